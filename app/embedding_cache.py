@@ -0,0 +1,142 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+# Optional second tier that survives restarts; empty disables it.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Canonical form used for cache keys.
+
+    all-MiniLM-L6-v2 lower-cases its input anyway, so case and whitespace
+    differences do not change the embedding.
+    """
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.lower().split())
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of sentence embeddings, keyed by normalized text hash.
+
+    Saving and retrieving memories used to call `embedder.encode` for every
+    text, even ones seen moments ago. Hot entries live in an in-memory LRU;
+    an optional SQLite file keeps them across restarts.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_size: int = EMBEDDING_CACHE_SIZE,
+        disk_path: Optional[str] = EMBEDDING_CACHE_PATH or None,
+    ):
+        self.model_name = model_name
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+            )
+            self._db.commit()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> str:
+        # The model name is part of the key so a model change can never
+        # serve stale vectors from the disk tier.
+        payload = f"{self.model_name}\0{normalize_text(text)}"
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = self.key(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype="float32")
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, text: str, vector: np.ndarray) -> None:
+        key = self.key(text)
+        vector = np.asarray(vector, dtype="float32").reshape(-1)
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    (key, vector.tobytes()),
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        vector.setflags(write=False)
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def encode(self, embedder, texts: List[str]) -> np.ndarray:
+        """
+        Embed `texts`, calling the model only for cache misses.
+
+        Misses are encoded in a single batch. Returns a float32 array of
+        shape (len(texts), dim).
+        """
+        vectors: List[Optional[np.ndarray]] = [self.get(text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+
+        if missing:
+            encoded = np.asarray(
+                embedder.encode([texts[i] for i in missing]), dtype="float32"
+            )
+            for i, vector in zip(missing, encoded):
+                self.put(texts[i], vector)
+                vectors[i] = vector
+
+        return np.vstack(vectors).astype("float32")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+# Seconds the first request in a batch waits for others to join it.
+EMBEDDING_MAX_WAIT = float(os.getenv("EMBEDDING_MAX_WAIT", "0.005"))
+
+
+class EmbeddingBatcher:
+    """
+    Collects concurrent encode requests into one batched model call.
+
+    Under load every chat used to call `SentenceTransformer.encode([text])`
+    with a batch of one. Requests are now encoded together on a worker
+    thread and each caller's future is resolved with its own vector.
+
+    While the model is idle a batch is dispatched on the next loop tick, so
+    a lone caller pays no extra latency. While a batch is running, new
+    requests collect for up to `max_wait` seconds (or `max_batch` items).
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        max_batch: int = EMBEDDING_MAX_BATCH,
+        max_wait: float = EMBEDDING_MAX_WAIT,
+    ):
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop = None
+        self._running = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.batches = 0
+        self.items = 0
+
+    async def encode(self, text: str) -> np.ndarray:
+        """Return the embedding of `text` as a 1-D float32 array."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Futures are bound to one loop; start fresh on a new one.
+            self._loop = loop
+            self._pending = []
+            self._timer = None
+            self._running = 0
+            self._tasks = set()
+
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            delay = self.max_wait if self._running else 0
+            self._timer = loop.call_later(delay, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            self._running += 1
+            self._spawn(self._run(batch))
+
+    def _spawn(self, coro) -> None:
+        # The loop only keeps weak references to tasks; hold on to them
+        # until they finish so none is collected mid-flight.
+        task = self._loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("%s task failed", type(self).__name__, exc_info=task.exception())
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            vectors = await asyncio.to_thread(
+                self.encode_fn, [text for text, _ in batch]
+            )
+            vectors = np.asarray(vectors, dtype="float32")
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        finally:
+            self._running -= 1
+
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,292 @@
+"""
+Opt-in flight recorder for chat turns.
+
+With FLIGHT_RECORDER=1, every `run_agent` / `run_agent_stream` call leaves
+a trace in a ring buffer. A trace holds the stage spans (everything timed
+with `app.metrics.stage`), prompt sizes, the number of retrieved memories,
+the model and the outcome. Turns slower than FLIGHT_RECORDER_SLOW_SECONDS
+are also kept in a separate buffer of slow traces, and written to
+FLIGHT_RECORDER_DIR when that is set. A FLIGHT_RECORDER_PROFILE_RATE
+fraction of turns additionally carry a sampling profile in collapsed-stack
+format, which flamegraph.pl and speedscope can read.
+
+The admin endpoints in web/server.py serve the buffers.
+"""
+import contextvars
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+FLIGHT_RECORDER = os.getenv("FLIGHT_RECORDER", "0").lower() in ("1", "true", "yes")
+# Recent traces kept in memory (slow traces have a buffer of their own).
+FLIGHT_RECORDER_SIZE = int(os.getenv("FLIGHT_RECORDER_SIZE", "256"))
+FLIGHT_RECORDER_SLOW_SECONDS = float(os.getenv("FLIGHT_RECORDER_SLOW_SECONDS", "10"))
+# Optional directory that slow traces are also written to, one JSON file each.
+FLIGHT_RECORDER_DIR = os.getenv("FLIGHT_RECORDER_DIR", "")
+# Fraction of turns (0.0-1.0) that are profiled while they run.
+FLIGHT_RECORDER_PROFILE_RATE = float(os.getenv("FLIGHT_RECORDER_PROFILE_RATE", "0"))
+FLIGHT_RECORDER_PROFILE_INTERVAL = float(os.getenv("FLIGHT_RECORDER_PROFILE_INTERVAL", "0.005"))
+
+_current: contextvars.ContextVar = contextvars.ContextVar("flight_recorder_trace", default=None)
+
+
+class Trace:
+    """One recorded turn. Spans are in milliseconds from the trace start."""
+
+    def __init__(self, kind: str, session_id: str, model: Optional[str]):
+        self.id = uuid.uuid4().hex[:16]
+        self.kind = kind
+        self.session_id = session_id
+        self.model = model
+        self.started_at = time.time()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self.attributes: Dict = {}
+        self.spans: List[Dict] = []
+        self.profile: Optional[Dict] = None
+        self._start = time.perf_counter()
+
+    def span(self, name: str, start: float, duration: float) -> None:
+        """Record a stage that started at perf_counter() time `start`."""
+        self.spans.append({
+            "name": name,
+            "start_ms": round((start - self._start) * 1000, 2),
+            "duration_ms": round(duration * 1000, 2),
+        })
+
+    def to_dict(self, full: bool = True) -> Dict:
+        data = {
+            "id": self.id,
+            "kind": self.kind,
+            "session_id": self.session_id,
+            "model": self.model,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 2) if self.duration is not None else None,
+            "error": self.error,
+            **self.attributes,
+        }
+        if full:
+            data["spans"] = list(self.spans)
+            if self.profile is not None:
+                data["profile"] = self.profile
+        return data
+
+
+def current_trace() -> Optional[Trace]:
+    """The trace of the turn running in this context, if it is recorded."""
+    return _current.get()
+
+
+def annotate(**attributes) -> None:
+    """Attach attributes (prompt sizes, counts, ...) to the current trace."""
+    trace = _current.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of every thread at a fixed interval.
+
+    A turn spans the event loop, the LLM pool and memory worker threads, so
+    the whole process is sampled while the turn runs; concurrent turns show
+    up in the same profile. Stacks of threads that are only waiting (idle
+    pool workers, the loop's select) are counted as idle and not kept.
+    """
+
+    # Innermost Python frames of a thread blocked in C: locks and queues,
+    # the loop's select, an idle pool worker, the snapshot thread's sleep.
+    _IDLE = {
+        ("threading.py", "wait"),
+        ("selectors.py", "select"),
+        ("queue.py", "get"),
+        ("thread.py", "_worker"),
+        ("memory.py", "_snapshot_loop"),
+    }
+
+    def __init__(self, interval: float = FLIGHT_RECORDER_PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self.idle = 0
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="flight-recorder-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self, limit: int = 50) -> Dict:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return {
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "idle_samples": self.idle,
+            "stacks": [f"{stack} {count}" for stack, count in self._stacks.most_common(limit)],
+        }
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in self._IDLE:
+                    self.idle += 1
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack.append(names.get(thread_id, str(thread_id)))
+                self._stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+
+class _Recording:
+    __slots__ = ("recorder", "trace", "token", "profiler")
+
+    def __init__(self, recorder, trace: Trace, profiler: Optional[SamplingProfiler]):
+        self.recorder = recorder
+        self.trace = trace
+        self.profiler = profiler
+
+    def __enter__(self) -> Trace:
+        self.token = _current.set(self.trace)
+        if self.profiler is not None:
+            self.profiler.start()
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        trace = self.trace
+        trace.duration = time.perf_counter() - trace._start
+        if exc_type is not None and exc_type is not GeneratorExit:
+            trace.error = f"{exc_type.__name__}: {exc}"
+        if self.profiler is not None:
+            trace.profile = self.profiler.stop()
+            self.recorder._profiling.release()
+        try:
+            _current.reset(self.token)
+        except ValueError:
+            # An async generator closed from another context.
+            pass
+        self.recorder._finish(trace)
+
+
+class _NullRecording:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_RECORDING = _NullRecording()
+
+
+class FlightRecorder:
+    """Ring buffers of recent and slow traces; see the module docstring."""
+
+    def __init__(
+        self,
+        enabled: bool = FLIGHT_RECORDER,
+        size: int = FLIGHT_RECORDER_SIZE,
+        slow_seconds: float = FLIGHT_RECORDER_SLOW_SECONDS,
+        profile_rate: float = FLIGHT_RECORDER_PROFILE_RATE,
+        dump_dir: str = FLIGHT_RECORDER_DIR,
+    ):
+        self.enabled = enabled
+        self.slow_seconds = slow_seconds
+        self.profile_rate = profile_rate
+        self.dump_dir = dump_dir
+        self._recent: deque = deque(maxlen=size)
+        self._slow: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+        # One profiler at a time: it samples the whole process anyway.
+        self._profiling = threading.Lock()
+
+        self.recorded = 0
+        self.slow_count = 0
+        self.profiled = 0
+
+    def record(self, kind: str, session_id: str, model: Optional[str] = None):
+        """Context manager that traces one turn; a no-op when disabled."""
+        if not self.enabled:
+            return _NULL_RECORDING
+        profiler = None
+        if self.profile_rate > 0 and random.random() < self.profile_rate and self._profiling.acquire(blocking=False):
+            profiler = SamplingProfiler()
+        return _Recording(self, Trace(kind, session_id, model), profiler)
+
+    def _finish(self, trace: Trace) -> None:
+        slow = trace.duration >= self.slow_seconds
+        with self._lock:
+            self.recorded += 1
+            self.profiled += trace.profile is not None
+            self._recent.append(trace)
+            if slow:
+                self.slow_count += 1
+                self._slow.append(trace)
+        if slow:
+            logger.warning("Slow %s turn %s took %.2fs", trace.kind, trace.id, trace.duration)
+            if self.dump_dir:
+                self._dump(trace)
+
+    def _dump(self, trace: Trace) -> None:
+        try:
+            os.makedirs(self.dump_dir, exist_ok=True)
+            stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(trace.started_at))
+            with open(os.path.join(self.dump_dir, f"{stamp}-{trace.id}.json"), "w") as f:
+                json.dump(trace.to_dict(), f, indent=2)
+        except OSError:
+            logger.exception("Could not write slow trace %s", trace.id)
+
+    def recent(self, limit: int = 50) -> List[Dict]:
+        """Summaries of the most recent traces, newest first."""
+        with self._lock:
+            traces = list(self._recent)[-limit:]
+        return [trace.to_dict(full=False) for trace in reversed(traces)]
+
+    def slow(self, limit: int = 50) -> List[Dict]:
+        """Full slow traces, newest first."""
+        with self._lock:
+            traces = list(self._slow)[-limit:]
+        return [trace.to_dict() for trace in reversed(traces)]
+
+    def get(self, trace_id: str) -> Optional[Dict]:
+        with self._lock:
+            for trace in itertools.chain(self._slow, self._recent):
+                if trace.id == trace_id:
+                    return trace.to_dict()
+        return None
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "recorded": self.recorded,
+            "slow": self.slow_count,
+            "profiled": self.profiled,
+            "slow_seconds": self.slow_seconds,
+            "profile_rate": self.profile_rate,
+        }
+
+
+recorder = FlightRecorder()
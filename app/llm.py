@@ -0,0 +1,477 @@
+import asyncio
+import itertools
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from ollama import AsyncClient
+
+from app.flight_recorder import annotate
+from app.metrics import LLM_FAILOVERS, LLM_TOKENS, PREFILL_SECONDS, Callback, stage
+from config.llm_config import (
+    BACKEND_MAX_IN_FLIGHT,
+    LLM_CIRCUIT_COOLDOWN,
+    LLM_FAILURE_THRESHOLD,
+    LLM_HEALTH_INTERVAL,
+    LLM_HEALTH_TIMEOUT,
+    LLM_MAX_IN_FLIGHT,
+    LLM_MAX_QUEUE,
+    LLM_RETRIES,
+    config_list,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "http://localhost:11434"
+
+# Config keys that Ollama understands as generation "options".
+_OPTION_KEYS = ("temperature", "top_p", "top_k", "num_predict", "seed", "stop")
+
+
+class LLMQueueFull(RuntimeError):
+    """Raised when a backend already has a full queue of waiting requests."""
+
+
+def _ollama_options(config: dict) -> dict:
+    """Pick the sampling options out of an AutoGen-style config entry."""
+    return {key: config[key] for key in _OPTION_KEYS if key in config}
+
+
+def _backend_key(config: dict) -> str:
+    return config.get("base_url", DEFAULT_BASE_URL)
+
+
+async def stream_chat(
+    system_message: str,
+    messages: List[Dict[str, str]],
+    config: dict,
+    client: Optional[AsyncClient] = None,
+    agent: str = "CareBot",
+) -> AsyncIterator[str]:
+    """
+    Stream a chat completion from Ollama, yielding text as it is generated.
+
+    AutoGen's `generate_reply()` only returns once the whole completion is
+    done, so for real token streaming we talk to Ollama's chat API directly.
+    The agent's own system message is prepended exactly like AutoGen does,
+    which keeps streamed and non-streamed replies consistent. Pass a
+    long-lived `client` to reuse its connections; `agent` labels the token
+    metrics.
+    """
+    client = client or AsyncClient(host=_backend_key(config))
+
+    stream = await client.chat(
+        model=config["model"],
+        messages=[{"role": "system", "content": system_message}, *messages],
+        stream=True,
+        options=_ollama_options(config),
+    )
+
+    async for chunk in stream:
+        content = chunk["message"]["content"]
+        if content:
+            yield content
+        if chunk.get("done"):
+            # Ollama only counts (and times) the prompt tokens it had to
+            # evaluate; a prefix reused from its KV cache is not included.
+            prefill = (chunk.get("prompt_eval_duration") or 0) / 1e9
+            LLM_TOKENS.inc(chunk.get("prompt_eval_count") or 0, kind="prompt", agent=agent)
+            LLM_TOKENS.inc(chunk.get("eval_count") or 0, kind="completion", agent=agent)
+            PREFILL_SECONDS.observe(prefill)
+            annotate(prompt_eval_count=chunk.get("prompt_eval_count"), prefill_ms=round(prefill * 1000, 2))
+
+
+class BackendLimiter:
+    """
+    Caps the number of concurrent completions sent to one Ollama backend.
+
+    Requests beyond `max_in_flight` wait in FIFO order; once `max_queue`
+    requests are already waiting, new ones fail fast with `LLMQueueFull`
+    instead of piling up behind a saturated backend.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.queued = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # asyncio primitives are bound to one event loop. Tests and the
+        # Streamlit UI call asyncio.run() repeatedly, so recreate it per loop.
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._loop = loop
+        return self._semaphore
+
+    async def acquire(self) -> None:
+        """Take a slot; pair with exactly one `release()`."""
+        semaphore = self._get_semaphore()
+
+        if semaphore.locked() and self.queued >= self.max_queue:
+            raise LLMQueueFull(
+                f"LLM backend busy: {self.queued} requests already queued"
+            )
+
+        self.queued += 1
+        try:
+            with stage("llm_queue_wait"):
+                await semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class CircuitBreaker:
+    """
+    Health of one backend.
+
+    Closed while requests succeed. After `threshold` consecutive failures it
+    opens and the backend gets no traffic for `cooldown` seconds; then it is
+    half-open, and the next request decides: a success closes it again, a
+    failure re-opens it.
+    """
+
+    def __init__(self, threshold: int = LLM_FAILURE_THRESHOLD, cooldown: float = LLM_CIRCUIT_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.trips = 0
+        self._open_until = 0.0
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.threshold:
+            return "closed"
+        return "open" if time.monotonic() < self._open_until else "half_open"
+
+    def allow(self) -> bool:
+        return self.state != "open"
+
+    def record_success(self) -> None:
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self._open(self.failures)
+
+    def record_probe(self, ok: bool) -> None:
+        """
+        An unreachable backend leaves the rotation at once; a reachable one
+        whose circuit is open gets its trial request without waiting out the
+        cooldown. A probe never closes the circuit: the backend may answer
+        probes and still fail completions.
+        """
+        if not ok:
+            self._open(max(self.failures, self.threshold))
+        elif self.state == "open":
+            self._open_until = 0.0
+
+    def _open(self, failures: int) -> None:
+        if self.state != "open":
+            self.trips += 1
+        self.failures = failures
+        self._open_until = time.monotonic() + self.cooldown
+
+
+class LLMExecutor:
+    """
+    Runs LLM completions without blocking the event loop.
+
+    AutoGen's `generate_reply()` is synchronous, so blocking calls are moved
+    to a worker thread pool. Every completion, blocking or streamed, first
+    takes a slot from its backend's `BackendLimiter`, which keeps a single
+    uvicorn worker responsive while many chats are in progress.
+
+    A config whose base_url is one of `backends` is served by the whole
+    pool: the request goes to the available backend with the fewest
+    outstanding requests for its size, and a failed request is retried on
+    up to `retries` others. Backends are taken out of rotation by their
+    `CircuitBreaker`, fed by request outcomes and periodic health probes.
+    Any other base_url is used as is.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = LLM_MAX_IN_FLIGHT,
+        max_queue: int = LLM_MAX_QUEUE,
+        backend_max_in_flight: Optional[Dict[str, int]] = None,
+        backends: Optional[List[str]] = None,
+        retries: int = LLM_RETRIES,
+        failure_threshold: int = LLM_FAILURE_THRESHOLD,
+        cooldown: float = LLM_CIRCUIT_COOLDOWN,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.backend_max_in_flight = dict(backend_max_in_flight or {})
+        self.backends = list(backends or [])
+        self.retries = retries
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._limiters: Dict[str, BackendLimiter] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._clients: Dict[str, AsyncClient] = {}
+        self._clients_loop = None
+        self._rotation = itertools.count()
+        self._health_task: Optional[asyncio.Task] = None
+        self._usage_seen: "weakref.WeakKeyDictionary[object, Tuple[int, int]]" = weakref.WeakKeyDictionary()
+        self._usage_lock = threading.Lock()
+        # Enough threads for every slot of the default and configured
+        # backends; the limiters, not the pool size, bound concurrency.
+        workers = max_in_flight * max(len(self.backends), 1) + sum(self.backend_max_in_flight.values())
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="llm"
+        )
+
+    def limiter(self, config: dict) -> BackendLimiter:
+        key = _backend_key(config)
+        if key not in self._limiters:
+            self._limiters[key] = BackendLimiter(
+                self.backend_max_in_flight.get(key, self.max_in_flight),
+                self.max_queue,
+            )
+        return self._limiters[key]
+
+    def breaker(self, config: dict) -> CircuitBreaker:
+        key = _backend_key(config)
+        if key not in self._breakers:
+            self._breakers[key] = CircuitBreaker(self.failure_threshold, self.cooldown)
+        return self._breakers[key]
+
+    def client(self, config: dict) -> AsyncClient:
+        """A long-lived Ollama client per backend, so connections are reused."""
+        # httpx connections belong to one event loop, like the semaphores.
+        loop = asyncio.get_running_loop()
+        if self._clients_loop is not loop:
+            self._clients = {}
+            self._clients_loop = loop
+        key = _backend_key(config)
+        if key not in self._clients:
+            self._clients[key] = AsyncClient(host=key)
+        return self._clients[key]
+
+    def _route(self, config: dict) -> List[dict]:
+        """The backends to try for this request, best first."""
+        if _backend_key(config) not in self.backends:
+            return [config]
+
+        def load(url: str) -> float:
+            limiter = self.limiter({"base_url": url})
+            return (limiter.in_flight + limiter.queued) / limiter.max_in_flight
+
+        # Ties go round-robin so an idle pool still spreads requests.
+        start = next(self._rotation)
+        order = self.backends[start % len(self.backends):] + self.backends[:start % len(self.backends)]
+        ranked = sorted(order, key=lambda url: (not self.breaker({"base_url": url}).allow(), load(url)))
+        # With every circuit open, the least loaded backend is still tried.
+        return [{**config, "base_url": url} for url in ranked[:1 + self.retries]]
+
+    def _failed(self, config: dict, error: Exception, last: bool) -> None:
+        self.breaker(config).record_failure()
+        if not last:
+            LLM_FAILOVERS.inc(backend=_backend_key(config))
+            logger.warning("LLM backend %s failed (%s); retrying on another backend", _backend_key(config), error)
+
+    async def generate(self, agent, messages: List[Dict[str, str]], config: dict):
+        """
+        Run `agent.generate_reply(messages=...)` on the worker pool.
+
+        `agent` may also be a factory `agent(config)`, which lets the call go
+        to any backend of the pool; a ready-made agent always talks to the
+        backend it was built for.
+        """
+        routable = not hasattr(agent, "generate_reply")
+        attempts = self._route(config) if routable else [config]
+        for i, attempt in enumerate(attempts):
+            last = i == len(attempts) - 1
+            try:
+                reply = await self._generate_once(agent, routable, messages, attempt)
+            except LLMQueueFull:
+                if last:
+                    raise
+                continue
+            except Exception as e:
+                self._failed(attempt, e, last)
+                if last:
+                    raise
+                continue
+            self.breaker(attempt).record_success()
+            annotate(backend=_backend_key(attempt))
+            return reply
+
+    async def _generate_once(self, agent, routable: bool, messages: List[Dict[str, str]], config: dict):
+        limiter = self.limiter(config)
+        await limiter.acquire()
+        try:
+            bot = agent(config) if routable else agent
+            future = asyncio.get_running_loop().run_in_executor(
+                self._pool, self._generate_reply, bot, messages
+            )
+        except BaseException:
+            limiter.release()
+            raise
+        # A cancelled caller cannot stop the worker thread, which keeps
+        # talking to the backend; the slot is only freed once it is done.
+        future.add_done_callback(lambda _: limiter.release())
+        return await asyncio.shield(future)
+
+    def _generate_reply(self, bot, messages: List[Dict[str, str]]):
+        reply = bot.generate_reply(messages=messages)
+        self._record_usage(bot)
+        return reply
+
+    def _record_usage(self, bot) -> None:
+        """
+        Count the tokens Ollama reported for `bot`'s blocking completions.
+
+        AutoGen only keeps a running usage total per agent, shared by every
+        call on it, so each call records what the total grew by since the
+        last one did. Concurrent calls may split the count between them, but
+        no token is dropped or counted twice.
+        """
+        client = getattr(bot, "client", None)
+        usage = getattr(client, "actual_usage_summary", None)
+        if not usage:
+            return
+        models = [entry for entry in list(usage.values()) if isinstance(entry, dict)]
+        totals = (
+            sum(entry.get("prompt_tokens") or 0 for entry in models),
+            sum(entry.get("completion_tokens") or 0 for entry in models),
+        )
+        with self._usage_lock:
+            seen = self._usage_seen.get(client, (0, 0))
+            self._usage_seen[client] = totals
+        agent = getattr(bot, "name", "unknown")
+        LLM_TOKENS.inc(max(totals[0] - seen[0], 0), kind="prompt", agent=agent)
+        LLM_TOKENS.inc(max(totals[1] - seen[1], 0), kind="completion", agent=agent)
+
+    async def stream(
+        self,
+        system_message: str,
+        messages: List[Dict[str, str]],
+        config: dict,
+        agent: str = "CareBot",
+    ) -> AsyncIterator[str]:
+        """
+        Stream a completion, holding one backend slot until it finishes.
+
+        Failover only happens before the first token: once text has been
+        sent on, a failure is raised to the caller.
+        """
+        attempts = self._route(config)
+        for i, attempt in enumerate(attempts):
+            last = i == len(attempts) - 1
+            started = False
+            try:
+                async with self.limiter(attempt).slot():
+                    annotate(backend=_backend_key(attempt))
+                    async for token in stream_chat(
+                        system_message, messages, attempt, self.client(attempt), agent
+                    ):
+                        started = True
+                        yield token
+            except LLMQueueFull:
+                if last:
+                    raise
+                continue
+            except Exception as e:
+                self._failed(attempt, e, last or started)
+                if last or started:
+                    raise
+                continue
+            self.breaker(attempt).record_success()
+            return
+
+    async def check_health(self, timeout: float = LLM_HEALTH_TIMEOUT) -> Dict[str, bool]:
+        """Probe every pool backend once and feed the results to its breaker."""
+
+        async def probe(url: str) -> bool:
+            try:
+                await asyncio.wait_for(self.client({"base_url": url}).list(), timeout)
+                return True
+            except Exception:
+                return False
+
+        results = await asyncio.gather(*(probe(url) for url in self.backends))
+        for url, ok in zip(self.backends, results):
+            if not ok and self.breaker({"base_url": url}).state != "open":
+                logger.warning("LLM backend %s failed its health probe", url)
+            self.breaker({"base_url": url}).record_probe(ok)
+        return dict(zip(self.backends, results))
+
+    def start_health_checks(self, interval: float = LLM_HEALTH_INTERVAL) -> None:
+        """Probe the pool every `interval` seconds on the running loop (idempotent)."""
+        if len(self.backends) < 2 or interval <= 0:
+            # A single backend has nowhere to fail over to.
+            return
+        if self._health_task is not None and not self._health_task.done():
+            return
+
+        async def run():
+            while True:
+                await self.check_health()
+                await asyncio.sleep(interval)
+
+        self._health_task = asyncio.get_running_loop().create_task(run(), name="llm-health")
+
+    async def stop_health_checks(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """In-flight and queued request counts and circuit state per backend."""
+        return {
+            key: {
+                "in_flight": limiter.in_flight,
+                "queued": limiter.queued,
+                "max_in_flight": limiter.max_in_flight,
+                "circuit": self.breaker({"base_url": key}).state,
+                "trips": self.breaker({"base_url": key}).trips,
+            }
+            for key, limiter in self._limiters.items()
+        }
+
+
+executor = LLMExecutor(
+    backend_max_in_flight=BACKEND_MAX_IN_FLIGHT,
+    backends=[config["base_url"] for config in config_list],
+)
+
+Callback(
+    "carebot_llm_in_flight", "Completions running per Ollama backend.",
+    lambda: {(key,): stats["in_flight"] for key, stats in executor.stats().items()},
+    ["backend"],
+)
+Callback(
+    "carebot_llm_backend_up", "1 while a pool backend's circuit lets requests through, else 0.",
+    lambda: {(url,): int(executor.breaker({"base_url": url}).allow()) for url in executor.backends},
+    ["backend"],
+)
+Callback(
+    "carebot_llm_queued", "Completions waiting for a slot per Ollama backend.",
+    lambda: {(key,): stats["queued"] for key, stats in executor.stats().items()},
+    ["backend"],
+)
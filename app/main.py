@@ -1,29 +1,156 @@
+import asyncio
 import json
+import logging
 import os
-from collections import defaultdict, deque
+import threading
+import time
+from typing import AsyncIterator, Optional
 
-from app.agent_care import create_carebot
-from app.agent_memory_extractor import create_memory_extractor
+from app.flight_recorder import annotate, recorder
+from app.llm import executor
 from app.router import route_message
 from app.rag import build_context
-from app.memory import save_memory
-from config.llm_config import config_list
+from app.memory import DEFAULT_SESSION_ID, embedder, embedding_cache, warm_up as warm_up_memory
+from app.memory_gate import MemoryGate
+from app.memory_pipeline import MemoryExtractionQueue
+from app.metrics import REQUEST_SECONDS, TTFT_SECONDS, Callback, stage
+from app.prompt import PromptAssembler
+from app.response_cache import ResponseCache
+from app.session_store import create_session_store
+from app.summarizer import ConversationSummarizer
+from config.llm_config import MEMORY_EXTRACTOR_MODEL, config_list
+
+logger = logging.getLogger(__name__)
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 # We wrap the raw config_list exactly as AutoGen expects.
 llm_config = {"config_list": config_list}
 
-carebot = create_carebot(llm_config)
-memory_extractor = create_memory_extractor(llm_config)
+# The memory extractor may run a smaller model on the same backends.
+extractor_config = {**config_list[0], "model": MEMORY_EXTRACTOR_MODEL or config_list[0]["model"]}
 
 # ----------------------------
-# 🔧 SHORT-TERM MEMORY
+# 🤖 AGENTS (BUILT ON FIRST USE)
 # ----------------------------
-CHAT_HISTORY = defaultdict(lambda: deque(maxlen=6))
+# Importing AutoGen and building agents takes seconds, so nothing heavy
+# happens at import time. `warm_up()` builds everything ahead of the first
+# request; otherwise the first turn does.
+#
+# An AutoGen agent talks to the backends of its own llm_config, so there is
+# one agent per backend and model; the executor picks the backend and asks
+# these factories for the matching agent.
+_agents = {}
+_agents_lock = threading.Lock()
+
+
+def _agent_key(name: str, config: dict) -> tuple:
+    return name, config["base_url"], config["model"]
+
+
+def get_carebot(config: Optional[dict] = None):
+    config = config or config_list[0]
+    with _agents_lock:
+        key = _agent_key("carebot", config)
+        if key not in _agents:
+            from app.agent_care import create_carebot
+            _agents[key] = create_carebot({"config_list": [config]})
+        return _agents[key]
+
+
+def get_memory_extractor(config: Optional[dict] = None):
+    config = config or extractor_config
+    with _agents_lock:
+        key = _agent_key("memory_extractor", config)
+        if key not in _agents:
+            from app.agent_memory_extractor import create_memory_extractor
+            _agents[key] = create_memory_extractor({"config_list": [config]})
+        return _agents[key]
+
+
+def get_memorybot(config: Optional[dict] = None):
+    config = config or config_list[0]
+    with _agents_lock:
+        key = _agent_key("memorybot", config)
+        if key not in _agents:
+            from app.agent_memory import create_memorybot
+            _agents[key] = create_memorybot({"config_list": [config]})
+        return _agents[key]
+
+
+def __getattr__(name):
+    # Keep `from app.main import carebot` working for existing callers.
+    if name == "carebot":
+        return get_carebot()
+    if name == "memory_extractor":
+        return get_memory_extractor()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Long-term memory extraction runs in the background, off the reply path,
+# and only for turns the local gate thinks contain something durable.
+memory_gate = MemoryGate(embedder)
+extraction_queue = MemoryExtractionQueue(
+    get_memory_extractor, executor, extractor_config, gate=memory_gate
+)
+Callback(
+    "carebot_extraction_queue_depth", "Turns waiting for memory extraction.",
+    lambda: extraction_queue.depth,
+)
+
+_ready = False
+
+
+def is_ready() -> bool:
+    """True once `warm_up()` has loaded every heavy resource."""
+    return _ready
+
+
+async def warm_up() -> None:
+    """
+    Load the embedding model, default memory partition and agents (or,
+    with a memory service, check that it is reachable).
+
+    Called from FastAPI startup so the first real request doesn't pay for
+    it; all loading runs on worker threads so the server stays responsive.
+    """
+    global _ready
+
+    def load():
+        warm_up_memory()
+        for config in config_list:
+            get_carebot(config)
+            get_memory_extractor({**extractor_config, "base_url": config["base_url"]})
+            get_memorybot(config)
+
+    await asyncio.to_thread(load)
+    extraction_queue.start()
+    summarizer.start()
+    _ready = True
+
+# ----------------------------
+# 🔧 SHORT-TERM MEMORY + ANTI-REPETITION (PER-SESSION)
+# ----------------------------
+# Recent history and the last reply of each session, bounded by LRU + TTL.
+# Set SESSION_STORE=sqlite to share sessions between uvicorn workers.
+session_store = create_session_store()
+
+# Static system prefix, then history, facts and the new message, each cut
+# to its token budget (PROMPT_BUDGET_*).
+prompt_assembler = PromptAssembler()
+Callback("carebot_sessions", "Sessions held by the session store.", lambda: session_store.stats()["sessions"])
 
-# 🔧 ANTI-REPETITION CACHE (PER-SESSION)
-LAST_RESPONSE_CACHE = {}
+# Replies to greetings and recurring non-personal questions, keyed by route
+# and query embedding (RESPONSE_CACHE_*).
+response_cache = ResponseCache(lambda texts: embedding_cache.encode(embedder, texts))
+
+# Turns that leave the history window are folded into a per-session summary
+# by the MemoryBot in the background; prompts carry the summary instead.
+summarizer = ConversationSummarizer(get_memorybot, executor, config_list[0], session_store)
+Callback(
+    "carebot_summary_queue_depth", "Sessions waiting for a summary update.",
+    lambda: summarizer.depth,
+)
 
 
 def _normalize_reply(reply) -> str:
@@ -90,58 +217,46 @@ User message:
 """
 
 
-async def run_agent(user_message: str) -> str:
-    # For now we treat the browser as a single shared session.
-    # If you add authentication later, you can plug in a real user/session id here.
-    session_id = "web-session"
+SAFETY_RESPONSE = (
+    "I'm really glad you shared this. "
+    "You don’t have to face this alone.\n\n"
+    "If things feel overwhelming, please consider reaching out "
+    "to someone you trust or a mental health professional."
+)
+
 
+async def _build_messages(session_id: str, user_message: str):
+    """
+    Route the message and build the CareBot prompt for this turn.
+
+    Returns `(routed, messages)`. For the `safety` route no LLM call is
+    made, so `messages` is None.
+    """
     # 1️⃣ ROUTING
-    routed = route_message(user_message)
+    with stage("route"):
+        routed = route_message(user_message)
 
     if routed == "safety":
-        return (
-            "I'm really glad you shared this. "
-            "You don’t have to face this alone.\n\n"
-            "If things feel overwhelming, please consider reaching out "
-            "to someone you trust or a mental health professional."
-        )
+        return routed, None
 
     # 2️⃣ SYSTEM CONTEXT (RAG + MEMORY)
-    context = await build_context(session_id, user_message)
-    system_msg = {"role": "system", "content": context["system"]}
+    with stage("build_context"):
+        context = await build_context(session_id, user_message)
 
     # =====================================================
     # 👋 GREETING HANDLING (NO EMOTIONAL LOOP)
     # =====================================================
     if routed == "greeting":
-        reply = carebot.generate_reply(
-            messages=[
-                system_msg,
-                {
-                    "role": "user",
-                    "content": (
-                        "The user greeted you casually. "
-                        "Reply briefly and friendly. "
-                        "DO NOT ask emotional questions."
-                    )
-                }
-            ]
+        return routed, prompt_assembler.assemble(
+            system=context["system"],
+            facts=context["facts"],
+            user=(
+                "The user greeted you casually. "
+                "Reply briefly and friendly. "
+                "DO NOT ask emotional questions."
+            ),
         )
 
-        # Normalize whatever AutoGen returns into a clean string.
-        final_response = _normalize_reply(reply).strip()
-
-        # If normalization still leaves us with empty text, use the
-        # same friendly fallback message as the main path.
-        if not final_response:
-            final_response = (
-                "Hi there, it’s good to hear from you. "
-                "How are you feeling today?"
-            )
-
-        LAST_RESPONSE_CACHE[session_id] = final_response
-        return final_response
-
     # 3️⃣ USER CONTENT
     if routed == "planner":
         plan = planner_prompt(user_message)
@@ -157,73 +272,201 @@ Respond empathetically and practically.
     else:
         user_content = user_message
 
-    # 4️⃣ MESSAGE BUILD (WITH CHAT HISTORY)
-    messages = [system_msg]
-    messages.extend(CHAT_HISTORY[session_id])
-    messages.append({"role": "user", "content": user_content})
+    # 4️⃣ MESSAGE BUILD (WITH CHAT HISTORY, WITHIN THE TOKEN BUDGETS)
+    with stage("assemble_prompt"):
+        # The SQLite store blocks on disk and on other workers' writes.
+        history, summary = await asyncio.to_thread(
+            lambda: (session_store.history(session_id), session_store.summary(session_id))
+        )
+        messages = prompt_assembler.assemble(
+            system=context["system"],
+            facts=context["facts"],
+            history=history,
+            summary=summary,
+            user=user_content,
+        )
+
+    return routed, messages
 
-    # 5️⃣ LLM CALL (AutoGen – correct usage)
-    reply = carebot.generate_reply(messages=messages)
 
+async def _finalize_reply(session_id: str, routed: str, user_message: str, reply) -> str:
+    """
+    Turn the raw model output into the reply we send to the user.
+
+    Shared by the blocking and streaming paths so both apply the same
+    fallbacks, anti-repetition rule and short-term memory update. Session
+    store calls run on worker threads: a SQLite write waits for the
+    database lock, which must not stall the event loop.
+    """
     # ---------------------------------------------------------
     # Robust normalization: AutoGen may return a string, dict,
     # list of message-like objects, or even None. We always
     # convert it into a clean string here so the rest of the
     # pipeline (memory + streaming) can rely on it.
     # ---------------------------------------------------------
-    reply_str = _normalize_reply(reply)
+    final_response = _normalize_reply(reply).strip()
 
-    if not reply_str or not isinstance(reply_str, str):
-        reply = (
+    if routed == "greeting":
+        # If normalization still leaves us with empty text, use a
+        # friendly fallback message instead.
+        if not final_response:
+            final_response = (
+                "Hi there, it’s good to hear from you. "
+                "How are you feeling today?"
+            )
+
+        await asyncio.to_thread(session_store.record_reply, session_id, final_response)
+        return final_response
+
+    if not final_response:
+        final_response = (
             "I’m here with you. "
             "Can you tell me a bit more about what’s been on your mind?"
         )
-    else:
-        reply = reply_str
-
-    final_response = reply.strip()
 
     # =====================================================
     # 🔁 ANTI-REPETITION FIX (CRITICAL)
     # =====================================================
-    last = LAST_RESPONSE_CACHE.get(session_id)
+    last = await asyncio.to_thread(session_store.last_response, session_id)
     if last and final_response.lower() == last.lower():
         final_response = (
             "Thanks for sharing that. "
             "What part of this feels hardest for you right now?"
         )
 
-    LAST_RESPONSE_CACHE[session_id] = final_response
-
     # 6️⃣ UPDATE SHORT-TERM MEMORY
-    CHAT_HISTORY[session_id].append({"role": "user", "content": user_message})
-    CHAT_HISTORY[session_id].append(
-        {"role": "assistant", "content": final_response}
-    )
-
-    # 7️⃣ LONG-TERM MEMORY EXTRACTION (SAFE)
-    try:
-        memory_reply = memory_extractor.generate_reply(
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"""
-Conversation:
-User: {user_message}
-Assistant: {final_response}
-"""
-                }
-            ]
-        )
+    overflow = await asyncio.to_thread(session_store.record_reply, session_id, final_response, user_message)
+    if overflow:
+        summarizer.submit(session_id, overflow)
+
+    return final_response
+
+
+def _prompt_sizes(messages) -> dict:
+    """Prompt size attributes for the flight recorder trace."""
+    if not messages:
+        return {"prompt_messages": 0, "prompt_chars": 0}
+    return {
+        "prompt_messages": len(messages),
+        "prompt_chars": sum(len(m["content"]) for m in messages),
+        "system_chars": len(messages[0]["content"]),
+    }
+
+
+async def _cached_reply(session_id: str, routed: str, user_message: str, messages):
+    """
+    Look the turn up in the response cache.
 
-        if memory_reply:
-            parsed = json.loads(memory_reply)
-            if parsed.get("save"):
-                save_memory(
-                    parsed["summary"],
-                    parsed.get("category", "general")
-                )
-    except Exception:
-        pass
+    Returns `(reply, key)`: the cached reply or None, and the query
+    embedding to store the model's reply under, or None. Only a prompt of
+    the static system text plus the message touches the cache; history, a
+    summary or retrieved facts make it personal, and a reply shared
+    between users must never answer, or carry, one user's context.
+    """
+    if not response_cache.cacheable(routed):
+        return None, None
+    if len(messages) != 2:
+        response_cache.bypass(routed)
+        return None, None
+
+    with stage("response_cache"):
+        try:
+            key = await asyncio.to_thread(response_cache.embed, user_message)
+        except Exception:
+            # The cache is an optimization; the model can still answer.
+            logger.warning("Response cache lookup failed", exc_info=True)
+            return None, None
+        last = await asyncio.to_thread(session_store.last_response, session_id)
+        reply = response_cache.get(routed, key, avoid=last)
+    annotate(response_cache="hit" if reply is not None else "miss")
+    return reply, key
+
+
+async def run_agent(user_message: str, session_id: str = DEFAULT_SESSION_ID) -> str:
+    with recorder.record("run_agent", session_id, config_list[0]["model"]):
+        return await _run_agent(user_message, session_id)
+
+
+async def _run_agent(user_message: str, session_id: str) -> str:
+    start = time.perf_counter()
+    routed, messages = await _build_messages(session_id, user_message)
+    annotate(route=routed, **_prompt_sizes(messages))
+
+    if routed == "safety":
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route=routed, mode="blocking")
+        return SAFETY_RESPONSE
+
+    # 5️⃣ LLM CALL (AutoGen – correct usage, on the bounded worker pool),
+    # unless the response cache already has replies to this question
+    reply, cache_key = await _cached_reply(session_id, routed, user_message, messages)
+    if reply is None:
+        with stage("llm"):
+            reply = await executor.generate(get_carebot, messages, config_list[0])
+        if cache_key is not None:
+            response_cache.put(routed, cache_key, _normalize_reply(reply).strip())
+
+    with stage("finalize"):
+        final_response = await _finalize_reply(session_id, routed, user_message, reply)
+    REQUEST_SECONDS.observe(time.perf_counter() - start, route=routed, mode="blocking")
+
+    # 7️⃣ LONG-TERM MEMORY EXTRACTION (BACKGROUND)
+    if routed != "greeting":
+        extraction_queue.submit(session_id, user_message, final_response)
 
     return final_response
+
+
+async def run_agent_stream(user_message: str, session_id: str = DEFAULT_SESSION_ID) -> AsyncIterator[dict]:
+    """
+    Streaming variant of `run_agent`.
+
+    Yields WebSocket-ready frames: one `{"type": "stream"}` frame per chunk
+    of text as Ollama produces it, then a single `{"type": "final"}` frame
+    with the post-processed reply. The final text can differ from the
+    streamed one (fallbacks, anti-repetition), so clients should treat it
+    as authoritative.
+    """
+    with recorder.record("run_agent_stream", session_id, config_list[0]["model"]):
+        async for frame in _run_agent_stream(user_message, session_id):
+            yield frame
+
+
+async def _run_agent_stream(user_message: str, session_id: str) -> AsyncIterator[dict]:
+    start = time.perf_counter()
+    routed, messages = await _build_messages(session_id, user_message)
+    annotate(route=routed, **_prompt_sizes(messages))
+
+    if routed == "safety":
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route=routed, mode="stream")
+        yield {"type": "final", "content": SAFETY_RESPONSE}
+        return
+
+    # 5️⃣ LLM CALL (streamed straight from Ollama), unless the response
+    # cache already has replies to this question
+    parts = []
+    cached, cache_key = await _cached_reply(session_id, routed, user_message, messages)
+    if cached is not None:
+        TTFT_SECONDS.observe(time.perf_counter() - start)
+        parts.append(cached)
+        yield {"type": "stream", "content": cached}
+    else:
+        carebot = get_carebot()
+        with stage("llm"):
+            async for token in executor.stream(carebot.system_message, messages, config_list[0], carebot.name):
+                if not parts:
+                    TTFT_SECONDS.observe(time.perf_counter() - start)
+                parts.append(token)
+                yield {"type": "stream", "content": token}
+        if cache_key is not None:
+            response_cache.put(routed, cache_key, "".join(parts).strip())
+    annotate(streamed_chunks=len(parts))
+
+    with stage("finalize"):
+        final_response = await _finalize_reply(session_id, routed, user_message, "".join(parts))
+    REQUEST_SECONDS.observe(time.perf_counter() - start, route=routed, mode="stream")
+
+    yield {"type": "final", "content": final_response}
+
+    # 7️⃣ LONG-TERM MEMORY EXTRACTION (BACKGROUND)
+    if routed != "greeting":
+        extraction_queue.submit(session_id, user_message, final_response)
@@ -1,121 +1,1242 @@
+import asyncio
+import base64
 import faiss
+import hashlib
+import itertools
 import os
+import re
+import shutil
+import sys
+import threading
 import json
+import logging
+import time
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict
+
+from app.embedding_cache import EmbeddingCache
+from app.embedding_service import EmbeddingBatcher
+from app.memory_client import MemoryServiceClient
+from app.metrics import Callback, stage
+from app.record_store import SQLiteRecords
+from app.retrieval_cache import RetrievalCache
+from app.vector_index import configure, create_index, ensure_backend, extract, remove, stored_ids
+from typing import Iterable, List, Dict, Optional
 
 MODEL_NAME = "all-MiniLM-L6-v2"
 INDEX_FILE = "memory.index"
 DATA_FILE = "memory.json"
+LOG_FILE = "memory.log"
+DB_FILE = "memory.db"
+
+# On-disk format of new snapshots. "json" keeps every record in RAM and
+# rewrites memory.json on snapshot. "compact" keeps records in SQLite
+# (memory.db), reading only the ones a search returns, and memory-maps the
+# index snapshot, so large partitions open fast and cost little RSS.
+# Existing JSON stores are converted on first load.
+STORAGE = os.getenv("MEMORY_STORAGE", "json")
+# Written next to a partition's files so tools can map a directory back to
+# the session id it was created for.
+SESSION_FILE = "session_id"
+
+# Snapshots of dirty partitions are written in the background every
+# SNAPSHOT_INTERVAL seconds (and on shutdown via flush_memory()).
+SNAPSHOT_INTERVAL = float(os.getenv("MEMORY_SNAPSHOT_INTERVAL", "60"))
+
+logger = logging.getLogger(__name__)
+
+# Every session/user gets its own partition (FAISS index + metadata) under
+# MEMORY_DIR. The default web session keeps using INDEX_FILE / DATA_FILE so
+# existing stores load unchanged.
+MEMORY_DIR = os.getenv("MEMORY_DIR", "memory_partitions")
+DEFAULT_SESSION_ID = "web-session"
+
+# Loaded partitions are unloaded once they are snapshotted and either idle
+# for PARTITION_IDLE seconds or the least recently used beyond
+# MAX_LOADED_PARTITIONS, so one-off sessions don't stay in RAM for the life
+# of the process. The default partition is always kept.
+MAX_LOADED_PARTITIONS = int(os.getenv("MEMORY_MAX_LOADED_PARTITIONS", "1024"))
+PARTITION_IDLE = float(os.getenv("MEMORY_PARTITION_IDLE", "1800"))
+
+# Items per chunk for save_memories(): one batched encode, one duplicate
+# search and one log write each.
+BULK_CHUNK_SIZE = int(os.getenv("MEMORY_BULK_CHUNK_SIZE", "512"))
+
+# Squared L2 distance under which two memories of the same category count
+# as the same fact when compacting (MiniLM vectors are unit length, so 0.15
+# is a cosine similarity of about 0.92).
+COMPACTION_DISTANCE_THRESHOLD = float(os.getenv("MEMORY_COMPACTION_THRESHOLD", "0.15"))
+# Seconds between background compactions of loaded partitions; 0 disables.
+COMPACTION_INTERVAL = float(os.getenv("MEMORY_COMPACTION_INTERVAL", "0"))
+
+
+
+def _parse_ttls(value: str) -> Dict[str, float]:
+    """Parse "health=2592000,general=7776000" into {category: seconds}."""
+    ttls = {}
+    for part in value.split(","):
+        if "=" in part:
+            category, seconds = part.split("=", 1)
+            ttls[category.strip()] = float(seconds)
+    return ttls
+
+
+# Eviction keeps long-lived partitions bounded. MAX_MEMORIES caps each
+# partition (0 = unlimited), evicting the least recently retrieved first;
+# CATEGORY_TTL drops memories older than their category's lifetime.
+MAX_MEMORIES = int(os.getenv("MEMORY_MAX_PER_USER", "0"))
+CATEGORY_TTL = _parse_ttls(os.getenv("MEMORY_CATEGORY_TTL", ""))
+
+# With a capacity set, retrieval times are written to the log once per
+# snapshot interval instead of forcing a snapshot; after this many such
+# records the next snapshot folds them in.
+_TOUCHES_PER_SNAPSHOT = 64
+
+# With several uvicorn workers, set MEMORY_SERVICE_SOCKET and run
+# `python -m app.memory_service`: that process owns the model and the
+# partitions, and the public functions below forward to it.
+SERVICE_SOCKET = os.getenv("MEMORY_SERVICE_SOCKET", "")
+service_client: Optional[MemoryServiceClient] = (
+    MemoryServiceClient(SERVICE_SOCKET) if SERVICE_SOCKET else None
+)
 
-embedder = SentenceTransformer(MODEL_NAME)
 dimension = 384
 
-if os.path.exists(INDEX_FILE):
-    index = faiss.read_index(INDEX_FILE)
-else:
-    index = faiss.IndexFlatL2(dimension)
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    """
+    Return the SentenceTransformer, loading it on first use.
+
+    Importing sentence-transformers (torch) and loading the model takes
+    seconds and hundreds of MB, so modules that merely import app.memory
+    (routing, tests, the web server before warm-up) don't pay for it.
+    """
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            from sentence_transformers import SentenceTransformer
+            _embedder = SentenceTransformer(MODEL_NAME)
+        return _embedder
+
+
+class _LazyEmbedder:
+    """
+    Stand-in for the model that only loads it when `encode` is called.
+
+    In memory-service client mode the service encodes instead, so workers
+    never load the model at all.
+    """
+
+    def encode(self, texts, **kwargs):
+        if service_client is not None:
+            vectors = service_client.call_sync("encode", texts=list(texts))
+            return np.asarray(vectors, dtype="float32").reshape(-1, dimension)
+        return get_embedder().encode(texts, **kwargs)
+
+
+embedder = _LazyEmbedder()
+
+# Every encode in this module goes through the cache, so repeated texts
+# (re-saved facts, repeated questions) skip the model entirely.
+embedding_cache = EmbeddingCache(MODEL_NAME)
+
+# Async callers share one micro-batched model call instead of encoding
+# their texts one by one.
+embedding_batcher = EmbeddingBatcher(lambda texts: embedder.encode(texts))
+
+# Formatted facts per (session, normalized query, k), valid until the
+# session's partition changes.
+retrieval_cache = RetrievalCache()
+
+
+_versions = itertools.count(1)
+
+
+def _encode_vector(vector: np.ndarray) -> str:
+    return base64.b64encode(np.ascontiguousarray(vector, dtype="float32").tobytes()).decode("ascii")
+
+
+def _decode_vector(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype="float32").reshape(1, dimension)
+
+
+def _atomic_write(path: str, write) -> None:
+    """Write a file via a temp file + fsync + rename so readers never see half of it."""
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class MemoryPartition:
+    """
+    Long-term memories of a single session/user.
+
+    Each partition owns its own FAISS index and metadata, so a search only
+    scans that user's memories and can never return another user's facts.
+    Partitions are loaded from disk on first use.
+
+    Persistence is a snapshot (INDEX_FILE + DATA_FILE) plus an append-only
+    log (LOG_FILE) of everything written since. Saving a memory appends and
+    fsyncs one log line, so its cost does not grow with the store; the
+    snapshot is rewritten in the background and the log trimmed afterwards.
+    On load the log is replayed on top of the snapshot, which also repairs
+    a snapshot that was interrupted half-way.
+    """
+
+    def __init__(self, session_id: str, index_file: str, data_file: str, log_file: str):
+        self.session_id = session_id
+        self.index_file = index_file
+        self.data_file = data_file
+        self.log_file = log_file
+
+        # FAISS indexes are not safe for concurrent add + search, and
+        # blocking work runs on worker threads, so guard the shared state.
+        self.lock = threading.RLock()
+
+        # Vector ids are memory ids, so index hits map straight to records.
+        # The index structure (flat / HNSW / IVF) comes from
+        # MEMORY_INDEX_BACKEND, see app/vector_index.py.
+        self.index = create_index(dimension)
+        # True while self.index is a read-only mapping of index_file.
+        self._index_mapped = False
+        self.storage = STORAGE
+        self.db_file = os.path.join(os.path.dirname(data_file), DB_FILE)
+        self.records: Dict[int, Dict] = {}
+        self.next_id = 0
+        # Sequence number of the last log operation; the snapshot records
+        # the last one it includes so replay knows where to resume.
+        self.last_seq = 0
+        self.snapshot_seq = 0
+        # Changes whenever the set of memories changes; cached retrieval
+        # results computed at another version are discarded. Drawn from a
+        # process-wide counter so a reloaded partition never reuses one.
+        self.version = next(_versions)
+        # Set when the index changed without a log record (e.g. a backend
+        # migration), so the next snapshot persists it.
+        self._needs_snapshot = False
+        self._log = None
+
+        self.max_memories = MAX_MEMORIES
+        self.category_ttl = dict(CATEGORY_TTL)
+        self.evicted = 0
+        # id -> (category, created_at, last retrieved or created), built by
+        # the first eviction so it never has to walk the records again.
+        self._usage: Optional[Dict[int, tuple]] = None
+        # Retrieval times not yet persisted, and touch records in the log.
+        self._touched: Dict[int, float] = {}
+        self._touch_ops = 0
+        # When get_partition() last handed this partition out.
+        self.last_used = time.monotonic()
+
+        self._load()
+
+    @property
+    def dirty(self) -> bool:
+        """True if the snapshot on disk is behind the in-memory state."""
+        return self.last_seq > self.snapshot_seq or self._needs_snapshot
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    def _load(self):
+        if self.storage == "compact" and os.path.exists(self.db_file):
+            self._load_compact()
+            self._replay_log()
+            self._ensure_backend()
+            return
+
+        data = None
+        if os.path.exists(self.data_file):
+            with open(self.data_file, "r") as f:
+                data = json.load(f)
+
+        if isinstance(data, list):
+            self._load_legacy(data)
+        elif data is not None:
+            # One shared string per category instead of one per record.
+            self.records = {
+                int(item["id"]): {**item, "category": sys.intern(item.get("category") or "general")}
+                for item in data["memories"]
+            }
+            self.next_id = data["next_id"]
+            self.last_seq = self.snapshot_seq = data["last_seq"]
+
+            if os.path.exists(self.index_file):
+                self.index = faiss.read_index(self.index_file)
+
+            self._drop_stale_vectors()
+
+        if self.storage == "compact":
+            # Convert a JSON store: its records become pending changes that
+            # the next snapshot writes to memory.db.
+            records, self.records = self.records, SQLiteRecords(self.db_file)
+            self.records.update(records)
+            self._needs_snapshot = bool(records)
+
+        self._replay_log()
+        self._ensure_backend()
+
+    def _load_compact(self):
+        self.records = SQLiteRecords(self.db_file)
+        meta = self.records.meta()
+        self.next_id = meta.get("next_id", 0)
+        self.last_seq = self.snapshot_seq = meta.get("last_seq", 0)
+
+        if os.path.exists(self.index_file):
+            self._map_index()
+        self._drop_stale_vectors()
+
+    def _map_index(self):
+        """Memory-map the index snapshot instead of reading it into RAM."""
+        self.index = configure(faiss.read_index(self.index_file, faiss.IO_FLAG_MMAP_IFC))
+        self._index_mapped = True
+
+    def _writable(self):
+        """
+        Swap a memory-mapped index for an in-RAM copy before mutating it.
+
+        Mapped indexes are read-only (FAISS aborts on writes to them). The
+        copy lives until the next snapshot, which maps the new file again.
+        """
+        if self._index_mapped:
+            self.index = configure(faiss.deserialize_index(faiss.serialize_index(self.index)))
+            self._index_mapped = False
+
+    def _drop_stale_vectors(self):
+        # The index is replaced before the metadata during a snapshot. If
+        # we crashed in between, drop vectors the metadata doesn't know;
+        # the log still holds them and re-adds them below.
+        known = set(self.records)
+        stale = [int(i) for i in stored_ids(self.index) if int(i) not in known]
+        if stale:
+            self._writable()
+            self.index = remove(self.index, stale)
+
+    def _ensure_backend(self):
+        """Migrate the index to the configured backend (or train IVF) if due."""
+        self.index, changed = ensure_backend(self.index)
+        if changed:
+            self._needs_snapshot = True
+            self.version = next(_versions)
+
+    def migrate(self, backend: str):
+        """Rebuild the index on `backend` (used by the migrate-index CLI)."""
+        with self.lock:
+            self._writable()
+            self.index, changed = ensure_backend(self.index, backend)
+            if changed:
+                self._needs_snapshot = True
+                self.version = next(_versions)
+
+    def _load_legacy(self, memory_store: List[Dict[str, str]]):
+        """Import a pre-log store: a plain IndexFlatL2 plus a JSON list."""
+        vectors = np.zeros((0, dimension), dtype="float32")
+        if os.path.exists(self.index_file):
+            legacy_index = faiss.read_index(self.index_file)
+            count = min(len(memory_store), legacy_index.ntotal)
+            if isinstance(legacy_index, faiss.IndexIDMap2):
+                # The first snapshot after migration was interrupted: the
+                # index is already ID-mapped, and ids 0..n-1 are the legacy rows.
+                vectors = np.vstack([legacy_index.reconstruct(i) for i in range(count)]) if count else vectors
+            else:
+                vectors = legacy_index.reconstruct_n(0, count)
+
+        count = min(len(memory_store), len(vectors))
+        ids = np.arange(count, dtype="int64")
+        if count:
+            self.index.add_with_ids(vectors[:count], ids)
+
+        self.records = {
+            int(i): {"id": int(i), **memory_store[i]} for i in ids
+        }
+        self.next_id = count
+
+    def _replay_log(self):
+        if not os.path.exists(self.log_file):
+            return
+
+        with open(self.log_file, "r") as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-append; it was
+                    # never acknowledged to the caller, so skip it.
+                    continue
+
+                if op["op"] == "touch":
+                    # Logged at the current position without advancing it.
+                    if op["seq"] >= self.snapshot_seq:
+                        self._apply_touch(op)
+                    continue
+
+                if op["seq"] <= self.snapshot_seq:
+                    continue
+
+                self._apply(op)
+                self.last_seq = max(self.last_seq, op["seq"])
+
+    def _apply(self, op: dict):
+        self._writable()
+        if op["op"] == "add" and op["id"] not in self.records:
+            self.index.add_with_ids(
+                _decode_vector(op["vector"]), np.array([op["id"]], dtype="int64")
+            )
+            self.records[op["id"]] = {
+                "id": op["id"],
+                "text": op["text"],
+                "category": op["category"],
+                "created_at": op.get("created_at", time.time()),
+            }
+            self.next_id = max(self.next_id, op["id"] + 1)
+            self._track(self.records[op["id"]])
+        elif op["op"] == "remove":
+            ids = [i for i in op["ids"] if i in self.records]
+            self.index = remove(self.index, ids)
+            for memory_id in ids:
+                del self.records[memory_id]
+            self._untrack(ids)
+
+    def _apply_touch(self, op: dict):
+        for memory_id, at in op["times"].items():
+            memory_id = int(memory_id)
+            if memory_id in self.records:
+                record = self.records[memory_id]
+                record["last_accessed"] = max(record.get("last_accessed") or 0.0, at)
+                self.records[memory_id] = record
+                self._track(record)
+
+    # ------------------------------------------------------------------
+    # Reads / writes
+    # ------------------------------------------------------------------
+    def is_duplicate(self, text: str, category: str, embedding: np.ndarray) -> bool:
+        """
+        Return True if this memory is already stored.
+
+        We use FAISS to find the closest neighbors and skip the save if one of
+        them has the same text and category. Paraphrases of a stored fact are
+        merged later by `compact()`, which uses the FAISS distances.
+        """
+        return self._duplicates([text], [category], embedding)[0]
+
+    def _duplicates(self, texts: List[str], categories: List[str], embeddings: np.ndarray) -> List[bool]:
+        """
+        Flag entries that are already stored or repeat an earlier entry.
+
+        One FAISS search covers the whole batch; entries repeated inside the
+        batch are caught with a set, so bulk imports stay vectorized.
+        """
+        neighbours = None
+        if self.index.ntotal:
+            # Search the closest few neighbors for strong matches
+            _, neighbours = self.index.search(
+                embeddings.astype("float32"), min(5, self.index.ntotal)
+            )
+
+        seen = set()
+        flags = []
+        for i, key in enumerate(zip(texts, categories)):
+            duplicate = key in seen
+            if not duplicate and neighbours is not None:
+                for memory_id in neighbours[i]:
+                    item = self.records.get(int(memory_id))
+                    if item and (item.get("text"), item.get("category")) == key:
+                        duplicate = True
+                        break
+
+            seen.add(key)
+            flags.append(duplicate)
+
+        return flags
+
+    def add(self, text: str, category: str, embedding: np.ndarray) -> bool:
+        """Store one memory unless it is a duplicate. Returns True if saved."""
+        return self.add_many([text], [category], embedding) == 1
+
+    def add_many(self, texts: List[str], categories: List[str], embeddings: np.ndarray) -> int:
+        """
+        Store a batch of memories, skipping duplicates. Returns how many were saved.
+
+        The whole batch is one log append with a single fsync and one index add.
+        """
+        with self.lock:
+            # Skip anything that is clearly a duplicate of what we already know
+            flags = self._duplicates(texts, categories, embeddings)
+            keep = [i for i, duplicate in enumerate(flags) if not duplicate]
+            if not keep:
+                return 0
+
+            now = time.time()
+            ops = []
+            for offset, i in enumerate(keep):
+                ops.append({
+                    "op": "add",
+                    "seq": self.last_seq + 1 + offset,
+                    "id": self.next_id + offset,
+                    "text": texts[i],
+                    "category": categories[i],
+                    "created_at": now,
+                    "vector": _encode_vector(embeddings[i]),
+                })
+
+            # Durable first, then visible: a crash after the fsync is
+            # recovered by replay, a crash before it loses nothing acked.
+            self._append_log(*ops)
+
+            ids = np.array([op["id"] for op in ops], dtype="int64")
+            self._writable()
+            self.index.add_with_ids(embeddings[keep].astype("float32"), ids)
+            for op in ops:
+                self.records[op["id"]] = {
+                    "id": op["id"],
+                    "text": op["text"],
+                    "category": op["category"],
+                    "created_at": op["created_at"],
+                }
+                self._track(self.records[op["id"]])
+
+            self.next_id = ops[-1]["id"] + 1
+            self.last_seq = ops[-1]["seq"]
+            self.version = next(_versions)
+
+            if self.max_memories and len(self.records) > self.max_memories:
+                self.evict()
+            self._ensure_backend()
+            return len(ops)
+
+    def remove_ids(self, ids: List[int]) -> int:
+        """Delete memories by id (logged like adds). Returns how many were removed."""
+        with self.lock:
+            ids = sorted(int(i) for i in set(ids) if int(i) in self.records)
+            if not ids:
+                return 0
+
+            op = {"op": "remove", "seq": self.last_seq + 1, "ids": ids}
+            self._append_log(op)
+            self._apply(op)
+            self.last_seq = op["seq"]
+            self.version = next(_versions)
+            return len(ids)
+
+    def near_duplicates(self, distance_threshold: float = COMPACTION_DISTANCE_THRESHOLD) -> List[int]:
+        """
+        Ids of memories that repeat a newer memory of the same category.
+
+        Within each category every vector is matched against its nearest
+        neighbours, pairs closer than `distance_threshold` are joined into
+        clusters, and each cluster keeps only its newest memory (the latest
+        wording of a fact that the user may have updated).
+        """
+        with self.lock:
+            ids, vectors = extract(self.index)
+            categories = [self.records[int(i)].get("category") for i in ids]
+
+        parent = {int(i): int(i) for i in ids}
+
+        def find(memory_id):
+            while parent[memory_id] != memory_id:
+                parent[memory_id] = parent[parent[memory_id]]
+                memory_id = parent[memory_id]
+            return memory_id
+
+        for category in set(categories):
+            rows = [row for row, c in enumerate(categories) if c == category]
+            if len(rows) < 2:
+                continue
+
+            group = faiss.IndexFlatL2(vectors.shape[1])
+            group.add(vectors[rows])
+            distances, neighbours = group.search(vectors[rows], min(8, len(rows)))
+
+            for row, row_distances, row_neighbours in zip(rows, distances, neighbours):
+                for distance, neighbour in zip(row_distances, row_neighbours):
+                    if neighbour < 0 or distance > distance_threshold:
+                        continue
+                    a, b = find(int(ids[row])), find(int(ids[rows[neighbour]]))
+                    if a != b:
+                        # The newest id becomes the cluster's representative.
+                        parent[min(a, b)] = max(a, b)
+
+        return sorted(memory_id for memory_id in parent if find(memory_id) != memory_id)
+
+    def compact(self, distance_threshold: float = COMPACTION_DISTANCE_THRESHOLD) -> int:
+        """
+        Drop near-duplicate memories and rewrite the snapshot.
+
+        The removal is logged before it is applied, and the new index and
+        metadata are written via atomic renames, so a crash at any point
+        leaves either the old or the compacted store. Returns the number of
+        memories removed.
+        """
+        removed = self.remove_ids(self.near_duplicates(distance_threshold))
+        if removed:
+            self.snapshot()
+        return removed
+
+    def search(self, embedding: np.ndarray, k: int) -> List[Dict]:
+        """Return up to k nearest memories, closest first."""
+        with self.lock:
+            if self.index.ntotal == 0:
+                return []
+
+            _, ids = self.index.search(embedding, min(k, self.index.ntotal))
+            return [
+                self.records[int(memory_id)]
+                for memory_id in ids[0]
+                if int(memory_id) in self.records
+            ]
 
-if os.path.exists(DATA_FILE):
-    with open(DATA_FILE, "r") as f:
-        memory_store: List[Dict[str, str]] = json.load(f)
-else:
-    memory_store = []
+    def retrieve(self, embedding: np.ndarray, k: int) -> List[Dict]:
+        """
+        `search`, recording the hits as retrieved now when a capacity is set.
 
+        Access times only matter for eviction, so without a capacity reads
+        write nothing. With one they are kept in RAM and persisted by the
+        next `snapshot()` call without rewriting the snapshot.
+        """
+        with self.lock:
+            items = self.search(embedding, k)
+            if items and self.max_memories:
+                now = time.time()
+                for item in items:
+                    item["last_accessed"] = now
+                    # Compact storage hands out copies; store them back.
+                    self.records[item["id"]] = item
+                    self._touched[item["id"]] = now
+                    self._track(item)
+            return items
 
-def _is_duplicate_memory(text: str, category: str, embedding: np.ndarray, distance_threshold: float = 0.15) -> bool:
+    def evict(self, now: Optional[float] = None) -> int:
+        """
+        Apply the eviction policies and return how many memories were removed.
+
+        Memories older than their category's TTL go first. If the partition
+        is still over `max_memories`, the ones retrieved least recently (or,
+        if never retrieved, created earliest) are evicted. Vectors are
+        deleted from the index by id instead of rebuilding it (HNSW, which
+        cannot delete, is the exception; see `vector_index.remove`).
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            usage = self._usage_map()
+            expired = {
+                memory_id
+                for memory_id, (category, created_at, _) in usage.items()
+                if category in self.category_ttl
+                and created_at is not None
+                and now - created_at > self.category_ttl[category]
+            }
+
+            excess = len(usage) - len(expired) - self.max_memories
+            if self.max_memories and excess > 0:
+                survivors = sorted(
+                    (memory_id for memory_id in usage if memory_id not in expired),
+                    key=lambda memory_id: usage[memory_id][2],
+                )
+                expired.update(survivors[:excess])
+
+            removed = self.remove_ids(list(expired))
+            self.evicted += removed
+            return removed
+
+    def _usage_map(self) -> Dict[int, tuple]:
+        if self._usage is None:
+            # The only full walk of the records, on the first eviction.
+            self._usage = {}
+            for _, record in self.records.items():
+                self._track(record)
+        return self._usage
+
+    def _track(self, record: Dict):
+        if self._usage is not None:
+            created_at = record.get("created_at")
+            self._usage[record["id"]] = (
+                record.get("category"),
+                created_at,
+                record.get("last_accessed") or created_at or 0.0,
+            )
+
+    def _untrack(self, ids: List[int]):
+        if self._usage is not None:
+            for memory_id in ids:
+                self._usage.pop(memory_id, None)
+
+    def clear(self):
+        with self.lock:
+            self._close_log()
+            self.index = create_index(dimension)
+            self._index_mapped = False
+            if isinstance(self.records, SQLiteRecords):
+                self.records.close()
+                self.records = SQLiteRecords(self.db_file)
+            else:
+                self.records = {}
+            self.next_id = 0
+            self.last_seq = self.snapshot_seq = 0
+            self.version = next(_versions)
+            self._usage = None
+            self._touched = {}
+            self._touch_ops = 0
+
+            # Remove persisted files if they exist
+            for path in (self.index_file, self.data_file, self.db_file, self.log_file):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def close(self):
+        """Release the log and database handles; the files stay on disk."""
+        with self.lock:
+            self._close_log()
+            if isinstance(self.records, SQLiteRecords):
+                self.records.close()
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def _ensure_directory(self):
+        directory = os.path.dirname(self.log_file)
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+
+        marker = os.path.join(directory, SESSION_FILE)
+        if not os.path.exists(marker):
+            with open(marker, "w") as f:
+                f.write(self.session_id)
+
+    def _append_log(self, *ops: dict):
+        if self._log is None:
+            self._ensure_directory()
+            self._log = open(self.log_file, "a")
+
+        self._log.write("".join(json.dumps(op) + "\n" for op in ops))
+        self._log.flush()
+        os.fsync(self._log.fileno())
+
+    def _persist_touches(self):
+        """Write pending retrieval times of a partition that is otherwise clean."""
+        touched, self._touched = self._touched, {}
+        if not touched:
+            return
+        if isinstance(self.records, SQLiteRecords):
+            # The touched rows are the only changes: one batched write, and
+            # the snapshot position stays where it is.
+            self.records.begin_flush()
+            self.records.flush({"last_seq": self.last_seq, "next_id": self.next_id})
+            return
+
+        self._append_log({
+            "op": "touch",
+            "seq": self.last_seq,
+            "times": {str(memory_id): at for memory_id, at in touched.items()},
+        })
+        self._touch_ops += 1
+        if self._touch_ops >= _TOUCHES_PER_SNAPSHOT:
+            # Fold them into the snapshot before the log grows long.
+            self._needs_snapshot = True
+
+    def _close_log(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def snapshot(self):
+        """
+        Write a full snapshot and trim the log down to newer operations.
+
+        Only the in-memory copy is taken under the lock; the slow file writes
+        happen without it so saves and searches keep going meanwhile.
+        """
+        with self.lock:
+            if not self.dirty:
+                self._persist_touches()
+                return
+            # The snapshot carries every access time recorded so far.
+            self._touched = {}
+            self._touch_ops = 0
+            # A mapped index is unchanged since the last snapshot.
+            index = None if self._index_mapped else self.index
+            index_bytes = faiss.serialize_index(index) if index is not None else None
+            meta = {"last_seq": self.last_seq, "next_id": self.next_id}
+            compact = isinstance(self.records, SQLiteRecords)
+            if compact:
+                self.records.begin_flush()
+            else:
+                data = {**meta, "memories": list(self.records.values())}
+            needed_snapshot, self._needs_snapshot = self._needs_snapshot, False
+
+        self._ensure_directory()
+
+        try:
+            # Index before metadata: see the recovery note in _drop_stale_vectors().
+            if index_bytes is not None:
+                def write_index(path):
+                    # serialize_index() produces exactly what write_index() would.
+                    with open(path, "wb") as f:
+                        f.write(index_bytes.tobytes())
+
+                _atomic_write(self.index_file, write_index)
+
+            if compact:
+                self.records.flush(meta)
+            else:
+                def write_data(path):
+                    with open(path, "w") as f:
+                        json.dump(data, f, indent=2)  # 👈 readable
+
+                _atomic_write(self.data_file, write_data)
+        except Exception:
+            with self.lock:
+                self._needs_snapshot = self._needs_snapshot or needed_snapshot
+                if compact:
+                    self.records.abort_flush()
+            raise
+
+        with self.lock:
+            self.snapshot_seq = meta["last_seq"]
+            self._trim_log()
+
+            if compact:
+                # memory.db now supersedes a converted memory.json.
+                if os.path.exists(self.data_file):
+                    os.remove(self.data_file)
+                # Nothing touched the index while we wrote it: map the file
+                # and let go of the in-RAM copy.
+                if index is not None and index is self.index and self.last_seq == meta["last_seq"]:
+                    self._map_index()
+
+    def _trim_log(self):
+        """Drop log operations that are now covered by the snapshot."""
+        self._close_log()
+        if not os.path.exists(self.log_file):
+            return
+
+        with open(self.log_file, "r") as f:
+            keep = []
+            for line in f:
+                try:
+                    if json.loads(line)["seq"] > self.snapshot_seq:
+                        keep.append(line)
+                except json.JSONDecodeError:
+                    continue
+
+        if keep:
+            def write_log(path):
+                with open(path, "w") as f:
+                    f.writelines(keep)
+
+            _atomic_write(self.log_file, write_log)
+        else:
+            os.remove(self.log_file)
+
+
+_partitions: Dict[str, MemoryPartition] = {}
+_partitions_lock = threading.Lock()
+
+# Read at scrape time from the partitions loaded in this process (none in
+# a memory-service client).
+Callback(
+    "carebot_memory_partitions", "Memory partitions loaded in this process.",
+    lambda: len(_partitions),
+)
+Callback(
+    "carebot_memory_index_size", "Vectors in the loaded memory partitions.",
+    lambda: sum(partition.index.ntotal for partition in list(_partitions.values())),
+)
+Callback(
+    "carebot_retrieval_cache_lookups_total", "Retrieval cache lookups by result.",
+    lambda: {("hit",): retrieval_cache.hits, ("miss",): retrieval_cache.misses},
+    ["result"], kind="counter",
+)
+
+
+def _partition_dir(session_id: str) -> str:
+    """Filesystem-safe, collision-free directory name for a session id."""
+    slug = re.sub(r"[^A-Za-z0-9_.-]", "_", session_id)[:40]
+    digest = hashlib.sha1(session_id.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(MEMORY_DIR, f"{slug}-{digest}")
+
+
+def session_id_of(directory: str) -> Optional[str]:
+    """The session id a partition directory belongs to, if it is known."""
+    if not directory:
+        return DEFAULT_SESSION_ID
+
+    marker = os.path.join(directory, SESSION_FILE)
+    if not os.path.exists(marker):
+        return None
+    with open(marker, "r") as f:
+        return f.read()
+
+
+def open_partition(directory: str, session_id: str = None) -> MemoryPartition:
+    """Load the partition stored in `directory` ("" is the default partition)."""
+    return MemoryPartition(
+        session_id or session_id_of(directory) or directory,
+        os.path.join(directory, INDEX_FILE),
+        os.path.join(directory, DATA_FILE),
+        os.path.join(directory, LOG_FILE),
+    )
+
+
+def partition_directories() -> List[str]:
+    """Directories of every partition persisted on disk, default first."""
+    directories = []
+    if any(os.path.exists(path) for path in (INDEX_FILE, DATA_FILE, DB_FILE, LOG_FILE)):
+        directories.append("")
+
+    if os.path.isdir(MEMORY_DIR):
+        for name in sorted(os.listdir(MEMORY_DIR)):
+            directory = os.path.join(MEMORY_DIR, name)
+            if os.path.isdir(directory):
+                directories.append(directory)
+
+    return directories
+
+
+def get_partition(session_id: str = DEFAULT_SESSION_ID) -> MemoryPartition:
+    """Return the memory partition for a session, loading it on first use."""
+    with _partitions_lock:
+        partition = _partitions.pop(session_id, None)
+        if partition is None:
+            directory = "" if session_id == DEFAULT_SESSION_ID else _partition_dir(session_id)
+            partition = open_partition(directory, session_id)
+            _start_snapshotter()
+        # Re-inserted so the dict runs from least to most recently used.
+        _partitions[session_id] = partition
+        partition.last_used = time.monotonic()
+        crowded = len(_partitions) > MAX_LOADED_PARTITIONS
+
+    if crowded:
+        unload_partitions()
+    return partition
+
+
+def unload_partitions(now: Optional[float] = None) -> int:
+    """
+    Unload snapshotted partitions that are idle or beyond the LRU limit.
+
+    Partitions with writes only in the log stay loaded until the snapshotter
+    has written them. Returns how many were unloaded.
+    """
+    now = time.monotonic() if now is None else now
+    unloaded = []
+    with _partitions_lock:
+        excess = len(_partitions) - MAX_LOADED_PARTITIONS
+        for session_id, partition in list(_partitions.items()):
+            if session_id == DEFAULT_SESSION_ID or partition.dirty:
+                continue
+            if excess > 0 or now - partition.last_used > PARTITION_IDLE:
+                del _partitions[session_id]
+                unloaded.append(partition)
+                excess -= 1
+
+    for partition in unloaded:
+        partition.close()
+    return len(unloaded)
+
+
+def flush_memory():
+    """Snapshot every loaded partition that has unsnapshotted writes."""
+    if service_client is not None:
+        return service_client.call_sync("flush_memory")
+
+    with _partitions_lock:
+        partitions = list(_partitions.values())
+
+    for partition in partitions:
+        partition.snapshot()
+
+
+def evict_memory() -> Dict[str, int]:
+    """Apply eviction policies to every loaded partition; `{session_id: removed}`."""
+    if service_client is not None:
+        return service_client.call_sync("evict_memory")
+
+    with _partitions_lock:
+        partitions = list(_partitions.values())
+    return {partition.session_id: partition.evict() for partition in partitions}
+
+
+def compact_memory(
+    session_id: Optional[str] = None,
+    distance_threshold: float = COMPACTION_DISTANCE_THRESHOLD,
+) -> Dict[str, int]:
     """
-    Return True if this memory is essentially already stored.
+    Merge near-duplicate memories in one session, or in every loaded one.
 
-    We use FAISS to look for very close neighbors. If we find a memory with
-    the same category and very small L2 distance, we skip saving it to avoid
-    repeating the same fact over and over.
+    Returns `{session_id: removed_count}`. `python -m app.memory_cli compact`
+    runs the same job over the partitions on disk and reports sizes and
+    search latency before and after.
     """
-    if index.ntotal == 0:
-        return False
+    if service_client is not None:
+        return service_client.call_sync(
+            "compact_memory", session_id=session_id, distance_threshold=distance_threshold
+        )
+
+    if session_id is not None:
+        partitions = [get_partition(session_id)]
+    else:
+        with _partitions_lock:
+            partitions = list(_partitions.values())
+
+    return {
+        partition.session_id: partition.compact(distance_threshold)
+        for partition in partitions
+    }
+
+
+_snapshotter: Optional[threading.Thread] = None
 
-    # Search the closest few neighbors for strong matches
-    _, indices = index.search(embedding.astype("float32"), min(5, index.ntotal))
-    for idx in indices[0]:
-        if idx < len(memory_store):
-            item = memory_store[idx]
-            if item.get("category") == category and item.get("text") == text:
-                return True
 
-    return False
+def _snapshot_loop():
+    last_compaction = time.monotonic()
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL)
+        try:
+            if COMPACTION_INTERVAL > 0 and time.monotonic() - last_compaction >= COMPACTION_INTERVAL:
+                last_compaction = time.monotonic()
+                compact_memory()
+            if MAX_MEMORIES or CATEGORY_TTL:
+                evict_memory()
+            with stage("memory_snapshot"):
+                flush_memory()
+            unload_partitions()
+        except Exception:
+            logger.exception("Background memory snapshot failed")
 
 
-def save_memory(text: str, category: str = "general"):
+def _start_snapshotter():
+    global _snapshotter
+    if _snapshotter is None and SNAPSHOT_INTERVAL > 0:
+        _snapshotter = threading.Thread(
+            target=_snapshot_loop, name="memory-snapshot", daemon=True
+        )
+        _snapshotter.start()
+
+
+def warm_up():
+    """
+    Load the embedding model and the default partition ahead of traffic.
+
+    In client mode this only checks that the memory service answers.
+    """
+    if service_client is not None:
+        service_client.call_sync("ping")
+        return
+    get_embedder().encode(["warm-up"])
+    get_partition(DEFAULT_SESSION_ID)
+
+
+def _encode(text: str) -> np.ndarray:
+    return embedding_cache.encode(embedder, [text])
+
+
+async def _aencode(text: str) -> np.ndarray:
+    """Async `_encode`: cache first, then the shared micro-batcher."""
+    vector = embedding_cache.get(text)
+    if vector is None:
+        vector = await embedding_batcher.encode(text)
+        embedding_cache.put(text, vector)
+    return vector.reshape(1, -1)
+
+
+def save_memory(text: str, category: str = "general", session_id: str = DEFAULT_SESSION_ID):
     """
     Persist a new memory with FAISS indexing, but avoid saving exact
     duplicates so the memory file stays clean and non-repetitive.
     """
-    embedding = embedder.encode([text])
-    embedding_arr = np.array(embedding).astype("float32")
+    if service_client is not None:
+        return service_client.call_sync("save_memory", text=text, category=category, session_id=session_id)
+    get_partition(session_id).add(text, category, _encode(text))
 
-    # Skip if this is clearly a duplicate of what we already know
-    if _is_duplicate_memory(text, category, embedding_arr):
-        return
 
-    index.add(embedding_arr)
+async def asave_memory(text: str, category: str = "general", session_id: str = DEFAULT_SESSION_ID):
+    """
+    Async `save_memory` for callers on the event loop.
+
+    The embedding joins concurrent requests in one batched encode; the
+    index write runs on a worker thread.
+    """
+    if service_client is not None:
+        return await service_client.call("save_memory", text=text, category=category, session_id=session_id)
+    with stage("memory_save"):
+        embedding = await _aencode(text)
+        await asyncio.to_thread(get_partition(session_id).add, text, category, embedding)
+
+
+def save_memories(
+    memories: Iterable,
+    session_id: str = DEFAULT_SESSION_ID,
+    chunk_size: int = BULK_CHUNK_SIZE,
+) -> Dict[str, int]:
+    """
+    Bulk version of `save_memory` for seeding or migrating a user's history.
+
+    `memories` may yield plain strings or `{"text": ..., "category": ...}`
+    dicts and is consumed lazily, `chunk_size` items at a time. Each chunk is
+    encoded in one batch, de-duplicated in one vectorized pass (against the
+    index and within the chunk) and persisted with a single log write.
+    Returns counts of saved and skipped memories.
+    """
+    if service_client is not None:
+        return _remote_save_memories(memories, session_id, chunk_size)
+
+    partition = get_partition(session_id)
+    saved = skipped = 0
+
+    iterator = iter(memories)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            break
+
+        items = [{"text": m} if isinstance(m, str) else m for m in chunk]
+        items = [m for m in items if m.get("text")]
+        if not items:
+            continue
+
+        texts = [m["text"] for m in items]
+        categories = [m.get("category") or "general" for m in items]
+        embeddings = embedding_cache.encode(embedder, texts)
+
+        count = partition.add_many(texts, categories, embeddings)
+        saved += count
+        skipped += len(items) - count
 
-    memory_store.append({
-        "text": text,
-        "category": category
-    })
+    # Fold a large import into the snapshot right away instead of leaving
+    # it all in the log until the next background snapshot.
+    partition.snapshot()
+    return {"saved": saved, "skipped": skipped}
 
-    faiss.write_index(index, INDEX_FILE)
 
-    with open(DATA_FILE, "w") as f:
-        json.dump(memory_store, f, indent=2)  # 👈 readable
+def _remote_save_memories(memories: Iterable, session_id: str, chunk_size: int) -> Dict[str, int]:
+    """save_memories() in client mode: one service call per chunk."""
+    total = {"saved": 0, "skipped": 0}
+    iterator = iter(memories)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return total
+        counts = service_client.call_sync(
+            "save_memories", memories=chunk, session_id=session_id, chunk_size=chunk_size
+        )
+        for key in total:
+            total[key] += counts[key]
+
+
+def export_memories(out, session_id: Optional[str] = None) -> int:
+    """
+    Write memories as JSON lines (`session_id`, `text`, `category`) to `out`,
+    a path or a text file object. Exports one session, or every partition on
+    disk when `session_id` is None. Returns the number of lines written.
+    """
+    if service_client is not None and isinstance(out, str):
+        # The service shares our filesystem, so it can write the file.
+        return service_client.call_sync("export_memories", out=os.path.abspath(out), session_id=session_id)
+    if session_id is not None:
+        partitions = [get_partition(session_id)]
+    else:
+        partitions = []
+        for directory in partition_directories():
+            known = session_id_of(directory)
+            # Partitions from before session markers existed are read as-is.
+            partitions.append(get_partition(known) if known else open_partition(directory))
+
+    f = open(out, "w") if isinstance(out, str) else out
+    try:
+        count = 0
+        for partition in partitions:
+            with partition.lock:
+                records = list(partition.records.values())
+            for record in records:
+                f.write(json.dumps({
+                    "session_id": partition.session_id,
+                    "text": record["text"],
+                    "category": record.get("category", "general"),
+                }) + "\n")
+                count += 1
+        return count
+    finally:
+        if isinstance(out, str):
+            f.close()
 
 
 async def get_relevant_facts(session_id: str, query: str, k: int = 3):
     """
     Retrieve the top-k semantically relevant memories for a query.
 
-    We also de-duplicate results by text so the same memory does not show
-    up multiple times in the system prompt.
+    Only the session's own partition is searched. We also de-duplicate
+    results by text so the same memory does not show up multiple times in
+    the system prompt. Repeated queries are served from `retrieval_cache`
+    until the partition changes (cache hits do not refresh the memories'
+    last-retrieved time used by eviction).
     """
-    if index.ntotal == 0:
+    if service_client is not None:
+        return await service_client.call("get_relevant_facts", session_id=session_id, query=query, k=k)
+
+    partition = await asyncio.to_thread(get_partition, session_id)
+    if partition.index.ntotal == 0:
         return ""
 
-    query_embedding = embedder.encode([query])
-    _, indices = index.search(
-        np.array(query_embedding).astype("float32"), min(k, index.ntotal)
-    )
+    # Read the version first: a save racing with the search below makes
+    # the cached entry stale rather than wrong.
+    version = partition.version
+    cached = retrieval_cache.get(session_id, query, k, version)
+    if cached is not None:
+        return cached
 
+    # Encoding is batched with concurrent callers, and the search runs on a
+    # worker thread so a slow lookup never stalls the event loop.
+    with stage("memory_embed"):
+        query_embedding = await _aencode(query)
+    with stage("memory_search"):
+        items = await asyncio.to_thread(partition.retrieve, query_embedding, k)
+    facts = _format_facts(items)
+    retrieval_cache.put(session_id, query, k, version, facts)
+    return facts
+
+
+def _format_facts(items: List[Dict]) -> str:
     seen_texts = set()
     results = []
-    for idx in indices[0]:
-        if idx < len(memory_store):
-            item = memory_store[idx]
-            text = item.get("text") or ""
-            if not text or text in seen_texts:
-                continue
+    for item in items:
+        text = item.get("text") or ""
+        if not text or text in seen_texts:
+            continue
 
-            seen_texts.add(text)
-            results.append(f"[{item.get('category', 'GENERAL').upper()}] {text}")
+        seen_texts.add(text)
+        results.append(f"[{item.get('category', 'GENERAL').upper()}] {text}")
 
     return "\n".join(results)
 
-def clear_memory():
+
+def clear_memory(session_id: Optional[str] = None):
     """
-    Clears all stored long-term memory.
+    Clears stored long-term memory for one session, or for every session
+    when no id is given.
     Used for benchmarking and testing.
     """
-    global index, memory_store
+    if service_client is not None:
+        return service_client.call_sync("clear_memory", session_id=session_id)
+
+    if session_id is not None:
+        get_partition(session_id).clear()
+        return
 
-    # Reset FAISS index
-    index.reset()
+    with _partitions_lock:
+        partitions = list(_partitions.values())
 
-    # Clear in-memory store
-    memory_store.clear()
+    for partition in partitions:
+        partition.clear()
 
-    # Remove persisted files if they exist
-    if os.path.exists(INDEX_FILE):
-        os.remove(INDEX_FILE)
+    # Also drop partitions that were never loaded in this process.
+    for path in (INDEX_FILE, DATA_FILE, DB_FILE, LOG_FILE):
+        if os.path.exists(path):
+            os.remove(path)
 
-    if os.path.exists(DATA_FILE):
-        os.remove(DATA_FILE)
+    shutil.rmtree(MEMORY_DIR, ignore_errors=True)
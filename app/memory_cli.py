@@ -0,0 +1,154 @@
+"""
+Maintenance commands for the long-term memory store.
+
+Usage:
+    python -m app.memory_cli migrate-index --backend hnsw [--session ID]
+    python -m app.memory_cli import memories.jsonl [--session ID] [--chunk-size N]
+    python -m app.memory_cli export memories.jsonl [--session ID]
+    python -m app.memory_cli compact [--session ID] [--threshold 0.15]
+
+Import/export files hold one JSON object per line:
+    {"session_id": "...", "text": "...", "category": "..."}
+"""
+import argparse
+import itertools
+import json
+import time
+
+import faiss
+
+from app import memory
+from app.vector_index import BACKENDS, INDEX_BACKEND, backend_of, extract
+
+
+def _partitions(session_id):
+    """Yield (label, partition) for one session or every partition on disk."""
+    if session_id:
+        yield session_id, memory.get_partition(session_id)
+        return
+
+    for directory in memory.partition_directories():
+        yield memory.session_id_of(directory) or directory, memory.open_partition(directory)
+
+
+def migrate_index(args):
+    for label, partition in _partitions(args.session):
+        before = backend_of(partition.index)
+        started = time.perf_counter()
+        partition.migrate(args.backend)
+        partition.snapshot()
+        after = backend_of(partition.index)
+        print(
+            f"{label}: {before} -> {after} "
+            f"({partition.index.ntotal} vectors, {time.perf_counter() - started:.2f}s)"
+        )
+
+    if args.backend != INDEX_BACKEND:
+        print(
+            f"\nNote: set MEMORY_INDEX_BACKEND={args.backend} for the app, otherwise "
+            f"partitions are migrated back to '{INDEX_BACKEND}' when loaded."
+        )
+
+
+def _read_jsonl(path):
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def import_memories(args):
+    started = time.perf_counter()
+    total = {"saved": 0, "skipped": 0}
+
+    # Lines are grouped by session as they come, so a file sorted by
+    # session (what `export` writes) is streamed without loading it whole.
+    items = _read_jsonl(args.file)
+    for session_id, group in itertools.groupby(
+        items, key=lambda item: args.session or item.get("session_id") or memory.DEFAULT_SESSION_ID
+    ):
+        counts = memory.save_memories(group, session_id=session_id, chunk_size=args.chunk_size)
+        print(f"{session_id}: {counts['saved']} saved, {counts['skipped']} duplicates skipped")
+        for key in total:
+            total[key] += counts[key]
+
+    print(
+        f"\nImported {total['saved']} memories "
+        f"({total['skipped']} skipped) in {time.perf_counter() - started:.2f}s"
+    )
+
+
+def export_memories(args):
+    count = memory.export_memories(args.file, session_id=args.session)
+    print(f"Exported {count} memories to {args.file}")
+
+
+def _store_size(partition) -> int:
+    """Bytes the partition's snapshot (index + metadata) takes."""
+    with partition.lock:
+        index_bytes = faiss.serialize_index(partition.index).nbytes
+        data_bytes = len(json.dumps(list(partition.records.values())))
+    return index_bytes + data_bytes
+
+
+def _search_latency(partition, queries) -> float:
+    """Mean milliseconds for a top-3 search over `queries`."""
+    if len(queries) == 0:
+        return 0.0
+    started = time.perf_counter()
+    for query in queries:
+        partition.search(query.reshape(1, -1), 3)
+    return (time.perf_counter() - started) / len(queries) * 1000
+
+
+def compact(args):
+    for label, partition in _partitions(args.session):
+        # The same queries before and after, sampled from the stored vectors.
+        _, vectors = extract(partition.index)
+        queries = vectors[:: max(1, len(vectors) // 200)]
+
+        before = (partition.index.ntotal, _store_size(partition), _search_latency(partition, queries))
+        removed = partition.compact(args.threshold)
+        after = (partition.index.ntotal, _store_size(partition), _search_latency(partition, queries))
+
+        print(
+            f"{label}: {before[0]} -> {after[0]} memories ({removed} merged), "
+            f"{before[1] / 1024:.1f} -> {after[1] / 1024:.1f} KiB, "
+            f"search {before[2]:.3f} -> {after[2]:.3f} ms"
+        )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.memory_cli", description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = commands.add_parser("migrate-index", help="rebuild partition indexes on another backend")
+    migrate.add_argument("--backend", choices=BACKENDS, required=True)
+    migrate.add_argument("--session", help="only this session's partition (default: all)")
+    migrate.set_defaults(func=migrate_index)
+
+    bulk_import = commands.add_parser("import", help="bulk-load memories from a JSONL file")
+    bulk_import.add_argument("file")
+    bulk_import.add_argument("--session", help="import every line into this session (default: each line's session_id)")
+    bulk_import.add_argument("--chunk-size", type=int, default=memory.BULK_CHUNK_SIZE)
+    bulk_import.set_defaults(func=import_memories)
+
+    export = commands.add_parser("export", help="write memories to a JSONL file")
+    export.add_argument("file")
+    export.add_argument("--session", help="only this session's partition (default: all)")
+    export.set_defaults(func=export_memories)
+
+    compaction = commands.add_parser("compact", help="merge near-duplicate memories")
+    compaction.add_argument("--session", help="only this session's partition (default: all)")
+    compaction.add_argument(
+        "--threshold", type=float, default=memory.COMPACTION_DISTANCE_THRESHOLD,
+        help="squared L2 distance under which same-category memories are merged",
+    )
+    compaction.set_defaults(func=compact)
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    args.func(args)
@@ -0,0 +1,175 @@
+import asyncio
+import itertools
+import json
+import logging
+import socket
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Lines can carry many embeddings; asyncio's 64 KiB default is too small.
+STREAM_LIMIT = 64 * 1024 * 1024
+
+
+class MemoryServiceError(RuntimeError):
+    """The memory service could not be reached or the call failed there."""
+
+
+class MemoryServiceClient:
+    """
+    Client for the single-writer memory service (`python -m app.memory_service`).
+
+    Protocol: newline-delimited JSON over a Unix socket. A request line is
+    `{"batch": [{"id": 1, "op": "...", "args": {...}}, ...]}` and the reply
+    line is `{"results": [{"id": 1, "result": ...} | {"id": 1, "error": "..."}]}`.
+
+    Async calls made in the same event-loop tick are sent as one batch over
+    a connection kept open per loop, so concurrent retrievals from a worker
+    reach the service (and its embedding batcher) together. Sync calls open
+    a short-lived connection of their own.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._ids = itertools.count(1)
+
+        self._loop = None
+        self._pending: List[Tuple[int, str, Dict, asyncio.Future]] = []
+        self._waiting: Dict[int, asyncio.Future] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connecting: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.batches = 0
+        self.calls = 0
+
+    # ------------------------------------------------------------------
+    # Async (batched)
+    # ------------------------------------------------------------------
+    async def call(self, op: str, **args):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Streams and futures are bound to one loop; start fresh.
+            self._loop = loop
+            self._pending = []
+            self._waiting = {}
+            self._writer = None
+            self._connecting = None
+            self._tasks = set()
+
+        future = loop.create_future()
+        if not self._pending:
+            loop.call_soon(self._flush)
+        self._pending.append((next(self._ids), op, args, future))
+        return await future
+
+    def _flush(self) -> None:
+        batch, self._pending = self._pending, []
+        if batch:
+            self._spawn(self._send(batch))
+
+    def _spawn(self, coro) -> None:
+        # The loop only keeps weak references to tasks; hold on to them
+        # until they finish so none is collected mid-flight.
+        task = self._loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("%s task failed", type(self).__name__, exc_info=task.exception())
+
+    async def _send(self, batch) -> None:
+        for call_id, _, _, future in batch:
+            self._waiting[call_id] = future
+        try:
+            writer = await self._connection()
+            line = json.dumps({
+                "batch": [{"id": call_id, "op": op, "args": args} for call_id, op, args, _ in batch]
+            })
+            writer.write(line.encode("utf-8") + b"\n")
+            await writer.drain()
+        except Exception as exc:
+            self._fail(MemoryServiceError(f"memory service at {self.path} unavailable: {exc}"))
+            return
+
+        self.batches += 1
+        self.calls += len(batch)
+
+    async def _connection(self) -> asyncio.StreamWriter:
+        if self._writer is None:
+            if self._connecting is None:
+                self._connecting = asyncio.ensure_future(self._connect())
+            try:
+                await asyncio.shield(self._connecting)
+            except Exception:
+                # Let the next call try again instead of reusing the failure.
+                self._connecting = None
+                raise
+        return self._writer
+
+    async def _connect(self) -> None:
+        reader, writer = await asyncio.open_unix_connection(self.path, limit=STREAM_LIMIT)
+        self._writer = writer
+        self._spawn(self._read_loop(reader, writer))
+
+    async def _read_loop(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                for result in json.loads(line)["results"]:
+                    future = self._waiting.pop(result["id"], None)
+                    if future is None or future.done():
+                        continue
+                    if "error" in result:
+                        future.set_exception(MemoryServiceError(result["error"]))
+                    else:
+                        future.set_result(result.get("result"))
+        except Exception:
+            pass
+        finally:
+            # Reconnect on the next call; anything in flight is lost.
+            if self._writer is writer:
+                self._writer = None
+                self._connecting = None
+            writer.close()
+            self._fail(MemoryServiceError(f"memory service at {self.path} closed the connection"))
+
+    def _fail(self, exc: Exception) -> None:
+        waiting, self._waiting = self._waiting, {}
+        for future in waiting.values():
+            if not future.done():
+                future.set_exception(exc)
+
+    # ------------------------------------------------------------------
+    # Sync
+    # ------------------------------------------------------------------
+    def call_sync(self, op: str, **args):
+        """Blocking call for sync callers (CLI, scripts, worker threads)."""
+        call_id = next(self._ids)
+        line = json.dumps({"batch": [{"id": call_id, "op": op, "args": args}]})
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(self.path)
+                sock.sendall(line.encode("utf-8") + b"\n")
+                with sock.makefile("rb") as f:
+                    reply = f.readline()
+        except OSError as exc:
+            raise MemoryServiceError(f"memory service at {self.path} unavailable: {exc}") from exc
+
+        if not reply:
+            raise MemoryServiceError(f"memory service at {self.path} closed the connection")
+        result = json.loads(reply)["results"][0]
+        if "error" in result:
+            raise MemoryServiceError(result["error"])
+        return result.get("result")
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "calls": self.calls,
+            "avg_batch_size": self.calls / self.batches if self.batches else 0.0,
+        }
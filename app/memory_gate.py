@@ -0,0 +1,148 @@
+import re
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+# Messages that never carry a durable fact on their own.
+SMALL_TALK = {
+    "ok", "okay", "k", "kk", "thanks", "thank you", "thx", "ty", "cool", "nice",
+    "great", "sure", "yes", "yeah", "yep", "no", "nope", "nah", "hmm", "hm",
+    "lol", "haha", "bye", "goodbye", "good night", "see you", "hi", "hello",
+    "hey", "hii", "good morning", "good evening", "got it", "i see", "alright",
+    "fine", "same", "maybe", "idk", "i don't know", "sounds good", "sorry",
+}
+
+# First-person statements that usually describe something stable about the
+# user: identity, relationships, preferences, routines, health, plans.
+FACT_PATTERNS = [
+    r"\bmy (name|wife|husband|partner|son|daughter|kids?|children|mom|mother|dad|father|"
+    r"brother|sister|family|friend|best friend|girlfriend|boyfriend|boss|job|work|"
+    r"dog|cat|pet|birthday|therapist|doctor|exam|exams|school|college|major|team)\b",
+    r"\bi(?: am|'m) (a|an|from|allergic|vegetarian|vegan|married|single|divorced|"
+    r"pregnant|retired|studying|working|training|learning|\d+)\b",
+    r"\bi (work|live|study|prefer|like|love|hate|enjoy|moved|started|quit|teach|play|"
+    r"take|go to|have been|was diagnosed|usually|always|never)\b",
+    r"\bi (have|had|got) (a|an|two|three|\d+|my|adhd|anxiety|depression|diabetes|asthma|insomnia)\b",
+    r"\bi (don't|do not|can't|cannot) (eat|drink|stand|sleep)\b",
+    r"\bi've (been|had|got|moved|started|quit|lost)\b",
+    r"\bcall me\b",
+    r"\bi(?:'m| am) (going to|planning to|moving|starting|getting married)\b",
+    r"\bmy \w+ (is|are|was|were) (on|in|at|called|named)\b",
+]
+
+# Reference sentences for the embedding fallback. A turn that is close to
+# any of them is treated as worth extracting.
+FACT_PROTOTYPES = [
+    "I work as a software engineer.",
+    "My daughter is starting school next month.",
+    "I prefer vegetarian food.",
+    "I was diagnosed with anxiety last year.",
+    "I live alone in a small apartment.",
+    "My exam is on Friday.",
+    "I have a dog named Max.",
+    "I usually go running in the morning.",
+]
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.45
+
+_FACT_RE = re.compile("|".join(f"(?:{p})" for p in FACT_PATTERNS))
+
+
+def _normalize(text: str) -> str:
+    text = text.lower().replace("’", "'").strip()
+    return re.sub(r"[^\w\s']+", " ", text).strip()
+
+
+class MemoryGate:
+    """
+    Cheap local check for whether a turn is worth a memory-extractor call.
+
+    Most turns ("ok", "thanks", short venting) contain nothing durable, yet
+    each one used to cost a full LLM call. The gate runs lexical rules first
+    and, when an embedder is given, falls back to similarity against a few
+    fact-like prototype sentences for turns the rules cannot decide.
+    """
+
+    def __init__(self, embedder=None, threshold: float = DEFAULT_SIMILARITY_THRESHOLD):
+        self.embedder = embedder
+        self.threshold = threshold
+        self._prototypes: Optional[np.ndarray] = None
+
+        self.checked = 0
+        self.skipped = 0
+
+    @property
+    def skip_rate(self) -> float:
+        return self.skipped / self.checked if self.checked else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "skip_rate": self.skip_rate,
+        }
+
+    def should_extract(self, user_message: str) -> bool:
+        """Return True if the user message may contain a durable fact."""
+        keep = self._decide(user_message)
+        self.checked += 1
+        if not keep:
+            self.skipped += 1
+        return keep
+
+    def _decide(self, user_message: str) -> bool:
+        text = _normalize(user_message)
+
+        if not text or text in SMALL_TALK:
+            return False
+
+        if _FACT_RE.search(text):
+            return True
+
+        # Without a first-person reference there is nothing about the user.
+        if not re.search(r"\b(i|i'm|i've|i'd|my|me|mine)\b", text):
+            return False
+
+        if self.embedder is None:
+            return False
+
+        return self._similarity(user_message) >= self.threshold
+
+    def _similarity(self, user_message: str) -> float:
+        if self._prototypes is None:
+            self._prototypes = self._encode(FACT_PROTOTYPES)
+        query = self._encode([user_message])
+        return float(np.max(self._prototypes @ query[0]))
+
+    def _encode(self, texts) -> np.ndarray:
+        vectors = np.asarray(self.embedder.encode(list(texts)), dtype="float32")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+def evaluate_gate(gate: MemoryGate, examples: Iterable[dict]) -> Dict[str, float]:
+    """
+    Measure a gate against labelled turns (`{"text": ..., "label": bool}`).
+
+    Positive = "worth extracting". Recall is the share of real facts that
+    still reach the extractor; skip rate is the share of LLM calls saved.
+    """
+    tp = fp = fn = tn = 0
+    for example in examples:
+        predicted = gate._decide(example["text"])
+        if predicted and example["label"]:
+            tp += 1
+        elif predicted:
+            fp += 1
+        elif example["label"]:
+            fn += 1
+        else:
+            tn += 1
+
+    total = tp + fp + fn + tn
+    return {
+        "precision": tp / (tp + fp) if tp + fp else 0.0,
+        "recall": tp / (tp + fn) if tp + fn else 0.0,
+        "skip_rate": (fn + tn) / total if total else 0.0,
+        "examples": total,
+    }
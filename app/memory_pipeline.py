@@ -0,0 +1,262 @@
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from typing import Dict, List, Optional
+
+from app.memory import asave_memory
+from app.metrics import EXTRACTION_TURNS, MEMORIES_SAVED, stage
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_QUEUE_SIZE = int(os.getenv("MEMORY_EXTRACTION_QUEUE_SIZE", "256"))
+EXTRACTION_WORKERS = int(os.getenv("MEMORY_EXTRACTION_WORKERS", "1"))
+# Turns of one session that arrive within EXTRACTION_BATCH_WAIT seconds of
+# each other are folded into one extractor prompt, up to
+# EXTRACTION_MAX_BATCH turns.
+EXTRACTION_MAX_BATCH = int(os.getenv("MEMORY_EXTRACTION_MAX_BATCH", "4"))
+EXTRACTION_BATCH_WAIT = float(os.getenv("MEMORY_EXTRACTION_BATCH_WAIT", "0.5"))
+
+
+def _single_turn_prompt(turn: Dict[str, str]) -> str:
+    return f"""
+Conversation:
+User: {turn["user"]}
+Assistant: {turn["assistant"]}
+"""
+
+
+def _batch_prompt(turns: List[Dict[str, str]]) -> str:
+    blocks = "\n".join(
+        f"Turn {i}:\nUser: {turn['user']}\nAssistant: {turn['assistant']}\n"
+        for i, turn in enumerate(turns, start=1)
+    )
+    return f"""
+Conversation turns:
+{blocks}
+Return a JSON array with one object per turn, in order.
+Each object has "save" (bool), "summary" (str) and "category" (str).
+"""
+
+
+def _parse_extraction(reply) -> List[dict]:
+    """
+    Parse the extractor output into a list of fact dicts.
+
+    Single-turn prompts answer with one JSON object, batched prompts with an
+    array. Anything that is not valid JSON raises so the caller can count it.
+    """
+    if isinstance(reply, dict):
+        reply = reply.get("content") or ""
+
+    parsed = json.loads(reply)
+    if isinstance(parsed, dict):
+        return [parsed]
+    return [item for item in parsed if isinstance(item, dict)]
+
+
+class MemoryExtractionQueue:
+    """
+    Background long-term memory extraction.
+
+    `run_agent` used to call the extractor before returning, which roughly
+    doubled reply latency. Turns are now enqueued once the reply is ready and
+    processed by asyncio workers, which may batch several turns of a session
+    into a single extractor prompt before saving the facts with
+    `asave_memory`. Turns of different sessions never share a prompt, so a
+    fact can only ever be saved to the session it came from. An optional
+    `MemoryGate` drops turns with nothing worth remembering before any LLM
+    call is made.
+    """
+
+    def __init__(
+        self,
+        get_extractor,
+        executor,
+        config: dict,
+        save=asave_memory,
+        gate=None,
+        maxsize: int = EXTRACTION_QUEUE_SIZE,
+        workers: int = EXTRACTION_WORKERS,
+        max_batch: int = EXTRACTION_MAX_BATCH,
+        batch_wait: float = EXTRACTION_BATCH_WAIT,
+    ):
+        # A factory rather than the agent itself, so the extractor is only
+        # built when the first turn is processed, for the backend the
+        # executor picks.
+        self.get_extractor = get_extractor
+        self.executor = executor
+        self.config = config
+        self.save = save
+        self.gate = gate
+        self.maxsize = maxsize
+        self.workers = workers
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+
+        self._queue: Optional[asyncio.Queue] = None
+        # Turns taken off the queue while batching another session.
+        self._held: deque = deque()
+        self._tasks: List[asyncio.Task] = []
+        self._loop = None
+
+        self.processed = 0
+        self.saved = 0
+        self.failed = 0
+        self.dropped = 0
+        self.batches = 0
+
+    @property
+    def depth(self) -> int:
+        """Number of turns waiting for extraction."""
+        return self._queue.qsize() + len(self._held) if self._queue is not None else 0
+
+    def start(self) -> None:
+        """Start the workers on the running event loop (idempotent)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks:
+            return
+
+        # A new loop (asyncio.run() in tests / Streamlit) cannot reuse the
+        # old queue or tasks; anything left on a closed loop is already lost.
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._held = deque()
+        self._tasks = [
+            loop.create_task(self._worker(), name=f"memory-extractor-{i}")
+            for i in range(self.workers)
+        ]
+
+    def submit(self, session_id: str, user_message: str, assistant_reply: str) -> bool:
+        """
+        Enqueue a finished turn for extraction without waiting for it.
+
+        Returns False if the queue is full and the turn was dropped.
+        """
+        self.start()
+        try:
+            self._queue.put_nowait({
+                "session_id": session_id,
+                "user": user_message,
+                "assistant": assistant_reply,
+            })
+        except asyncio.QueueFull:
+            self.dropped += 1
+            EXTRACTION_TURNS.inc(outcome="dropped")
+            logger.warning("Memory extraction queue full; dropping turn")
+            return False
+        return True
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """Wait for queued turns to be processed, then stop the workers."""
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Memory extraction drain timed out with %d turns left", self.depth
+            )
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queue_depth": self.depth,
+            "processed": self.processed,
+            "saved": self.saved,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "batches": self.batches,
+        }
+
+    async def _next_batch(self) -> List[Dict[str, str]]:
+        batch = [self._held.popleft() if self._held else await self._queue.get()]
+        session_id = batch[0]["session_id"]
+        for turn in list(self._held):
+            if len(batch) >= self.max_batch:
+                break
+            if turn["session_id"] == session_id:
+                self._held.remove(turn)
+                batch.append(turn)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_wait
+
+        while len(batch) < self.max_batch:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                turn = await asyncio.wait_for(self._queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            # Other sessions wait for a batch of their own.
+            if turn["session_id"] == session_id:
+                batch.append(turn)
+            else:
+                self._held.append(turn)
+
+        return batch
+
+    async def _worker(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._process(batch)
+            except Exception:
+                self.failed += len(batch)
+                EXTRACTION_TURNS.inc(len(batch), outcome="failed")
+                logger.exception("Memory extraction failed for %d turn(s)", len(batch))
+            finally:
+                self.processed += len(batch)
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _process(self, batch: List[Dict[str, str]]) -> None:
+        if self.gate is not None:
+            # The gate may embed text, so it runs off the event loop too.
+            with stage("extraction_gate"):
+                keep = await asyncio.to_thread(
+                    lambda: [self.gate.should_extract(turn["user"]) for turn in batch]
+                )
+            EXTRACTION_TURNS.inc(len(batch) - sum(keep), outcome="skipped")
+            batch = [turn for turn, ok in zip(batch, keep) if ok]
+            if not batch:
+                return
+
+        prompt = _single_turn_prompt(batch[0]) if len(batch) == 1 else _batch_prompt(batch)
+
+        with stage("extraction_llm"):
+            reply = await self.executor.generate(
+                self.get_extractor,
+                [{"role": "user", "content": prompt}],
+                self.config,
+            )
+        self.batches += 1
+
+        if not reply:
+            EXTRACTION_TURNS.inc(len(batch), outcome="extracted")
+            return
+
+        # The whole batch is one session's, so it does not matter if the
+        # model merged, split or reordered the turns.
+        session_id = batch[0]["session_id"]
+        facts = _parse_extraction(reply)
+
+        with stage("extraction_save"):
+            for fact in facts:
+                if fact.get("save") and fact.get("summary"):
+                    await self.save(
+                        fact["summary"],
+                        fact.get("category", "general"),
+                        session_id,
+                    )
+                    self.saved += 1
+                    MEMORIES_SAVED.inc()
+        EXTRACTION_TURNS.inc(len(batch), outcome="extracted")
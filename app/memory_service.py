@@ -0,0 +1,137 @@
+"""
+Single-writer memory service.
+
+One process owns the embedding model, the FAISS partitions and their files;
+uvicorn workers started with the same MEMORY_SERVICE_SOCKET become thin
+clients of it (see app/memory_client.py for the protocol).
+
+Usage:
+    MEMORY_SERVICE_SOCKET=/tmp/carebot-memory.sock python -m app.memory_service
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from typing import Dict
+
+import numpy as np
+
+from app import memory
+from app.memory_client import STREAM_LIMIT
+
+logger = logging.getLogger(__name__)
+
+
+def _blocking(fn):
+    async def run(**args):
+        return await asyncio.to_thread(fn, **args)
+    return run
+
+
+async def _encode(texts):
+    vectors = await asyncio.to_thread(memory.embedding_cache.encode, memory.embedder, texts)
+    return np.asarray(vectors, dtype="float32").tolist()
+
+
+# Every op the service accepts. Async retrieval and saves go through
+# app.memory's embedding batcher, so the calls of one request batch (and of
+# concurrent batches from other workers) share model calls.
+OPS = {
+    "get_relevant_facts": memory.get_relevant_facts,
+    "save_memory": memory.asave_memory,
+    "save_memories": _blocking(memory.save_memories),
+    "export_memories": _blocking(memory.export_memories),
+    "clear_memory": _blocking(memory.clear_memory),
+    "flush_memory": _blocking(memory.flush_memory),
+    "compact_memory": _blocking(memory.compact_memory),
+    "evict_memory": _blocking(memory.evict_memory),
+    "encode": _encode,
+    "ping": lambda: asyncio.sleep(0, "pong"),
+}
+
+
+class MemoryService:
+    """Serves OPS to clients over a Unix socket; see MemoryServiceClient."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.batches = 0
+        self.calls = 0
+
+    async def _run(self, call: Dict) -> Dict:
+        try:
+            op = OPS[call["op"]]
+            return {"id": call["id"], "result": await op(**call.get("args", {}))}
+        except Exception as exc:
+            logger.exception("Memory service call %s failed", call.get("op"))
+            return {"id": call["id"], "error": f"{type(exc).__name__}: {exc}"}
+
+    async def _handle_batch(self, batch, writer: asyncio.StreamWriter) -> None:
+        self.batches += 1
+        self.calls += len(batch)
+        results = await asyncio.gather(*(self._run(call) for call in batch))
+        writer.write(json.dumps({"results": results}).encode("utf-8") + b"\n")
+        await writer.drain()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                # Batches from one connection run concurrently; replies carry
+                # call ids, so their order does not matter.
+                task = asyncio.create_task(self._handle_batch(json.loads(line)["batch"], writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, ready: asyncio.Event = None) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)  # stale socket from a previous run
+
+        server = await asyncio.start_unix_server(self._handle_connection, self.path, limit=STREAM_LIMIT)
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "calls": self.calls,
+            "avg_batch_size": self.calls / self.batches if self.batches else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.memory_service", description=__doc__.splitlines()[1])
+    parser.add_argument("--socket", default=memory.SERVICE_SOCKET or "memory.sock")
+    args = parser.parse_args()
+
+    # This process is the owner: serve from the local store, never from
+    # another service.
+    memory.service_client = None
+    memory.warm_up()
+
+    print(f"Memory service listening on {args.socket}")
+    try:
+        asyncio.run(MemoryService(args.socket).serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        memory.flush_memory()
+
+
+if __name__ == "__main__":
+    main()
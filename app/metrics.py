@@ -0,0 +1,286 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+The app records per-stage timings and a handful of counters here, and
+`web/server.py` serves `registry.render()` at `/metrics`. Values that
+already live elsewhere (index size, queue depths, cache hits) are read by
+callbacks at scrape time, so they cost nothing between scrapes.
+
+Recording is a lock, a bisect and two additions. With METRICS_ENABLED=0
+every call returns immediately and `/metrics` answers 404.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.flight_recorder import current_trace
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# Seconds; covers a sub-millisecond cache hit up to a slow CPU completion.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """All metrics of the process, rendered together for a scrape."""
+
+    def __init__(self):
+        self._metrics: Dict[str, "_Metric"] = {}
+
+    def register(self, metric: "_Metric") -> None:
+        # Re-registering a name replaces it (module reloads in tests).
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional["_Metric"]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = metric.collect()
+            except Exception:
+                # A broken callback must not take the whole scrape down.
+                continue
+            lines.extend(metric.header())
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return tuple(labels[name] for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """A monotonically increasing count, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values]
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last), sum, count].
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels):
+        """Context manager that observes the duration of its block."""
+        if not METRICS_ENABLED:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, [list(entry[0]), entry[1], entry[2]]) for key, entry in self._values.items())
+        lines = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Callback(_Metric):
+    """
+    A gauge or counter whose value is read from `fn` at scrape time.
+
+    `fn` returns a number, or a dict mapping label-value tuples to numbers.
+    """
+
+    def __init__(self, name: str, help: str, fn: Callable, labelnames: Sequence[str] = (), kind: str = "gauge"):
+        self.kind = kind
+        self.fn = fn
+        super().__init__(name, help, labelnames)
+
+    def collect(self) -> List[str]:
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+# ----------------------------
+# Metrics recorded by the app
+# ----------------------------
+STAGE_SECONDS = Histogram(
+    "carebot_stage_seconds",
+    "Time spent in each stage of a turn (routing, context, LLM, memory, extraction).",
+    ["stage"],
+)
+REQUEST_SECONDS = Histogram(
+    "carebot_request_seconds", "End-to-end time to produce a reply.", ["route", "mode"]
+)
+TTFT_SECONDS = Histogram(
+    "carebot_time_to_first_token_seconds", "Time from a streamed request to its first token."
+)
+LLM_TOKENS = Counter(
+    "carebot_llm_tokens_total", "Tokens reported by Ollama, by kind and by the agent that asked.", ["kind", "agent"]
+)
+LLM_FAILOVERS = Counter(
+    "carebot_llm_failovers_total", "Completions retried on another backend, by the backend that failed.", ["backend"]
+)
+PREFILL_SECONDS = Histogram(
+    "carebot_prefill_seconds",
+    "Prompt processing time reported by Ollama for streamed CareBot replies (low when the prefix was cached); "
+    "AutoGen does not pass it on for blocking completions.",
+)
+EXTRACTION_TURNS = Counter(
+    "carebot_extraction_turns_total",
+    "Turns leaving the memory extraction queue, by outcome "
+    "(extracted, skipped by the gate, failed, dropped on a full queue).",
+    ["outcome"],
+)
+MEMORIES_SAVED = Counter("carebot_memories_saved_total", "Facts saved to long-term memory by the extractor.")
+SUMMARIES = Counter(
+    "carebot_summaries_total",
+    "Rolling summary updates, by outcome (summarized, failed, dropped on a full queue).",
+    ["outcome"],
+)
+WEBSOCKET_ERRORS = Counter("carebot_websocket_errors_total", "Turns on /ws that ended in an error frame.")
+WEBSOCKET_CANCELLED = Counter(
+    "carebot_websocket_cancelled_turns_total",
+    "Turns on /ws cancelled before their final frame, by reason (disconnect, superseded, slow_client).",
+    ["reason"],
+)
+WEBSOCKET_TOKENS_SAVED = Counter(
+    "carebot_websocket_cancelled_tokens_saved_total",
+    "Estimated completion tokens not generated because a /ws turn was cancelled.",
+)
+
+
+class _StageTimer:
+    __slots__ = ("name", "trace", "start")
+
+    def __init__(self, name: str, trace):
+        self.name = name
+        self.trace = trace
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(duration, stage=self.name)
+        if self.trace is not None:
+            self.trace.span(self.name, self.start, duration)
+
+
+def stage(name: str):
+    """
+    Time a block as one stage: `with stage("build_context"): ...`.
+
+    The span also goes to the flight recorder's trace of the current turn.
+    """
+    trace = current_trace()
+    if not METRICS_ENABLED and trace is None:
+        return _NULL_TIMER
+    return _StageTimer(name, trace)
@@ -0,0 +1,258 @@
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.flight_recorder import annotate
+from app.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Token budget per prompt section. Anything over budget is cut: the oldest
+# history messages first, then the least relevant facts, then the tail of
+# the system or user text.
+PROMPT_BUDGET_SYSTEM = int(os.getenv("PROMPT_BUDGET_SYSTEM", "512"))
+PROMPT_BUDGET_SUMMARY = int(os.getenv("PROMPT_BUDGET_SUMMARY", "256"))
+PROMPT_BUDGET_FACTS = int(os.getenv("PROMPT_BUDGET_FACTS", "256"))
+PROMPT_BUDGET_HISTORY = int(os.getenv("PROMPT_BUDGET_HISTORY", "1024"))
+PROMPT_BUDGET_USER = int(os.getenv("PROMPT_BUDGET_USER", "512"))
+# "estimate" (default) or "tiktoken:<encoding>" for an exact count with an
+# installed tiktoken encoding.
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "estimate")
+TOKEN_COUNT_CACHE_SIZE = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "4096"))
+
+# Role header and end-of-turn tokens a chat template adds per message.
+MESSAGE_OVERHEAD = 4
+
+FACTS_HEADER = "Relevant past context (use only if helpful):"
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+
+_WORDS = re.compile(r"\w+|[^\w\s]")
+
+PROMPT_TOKENS = Histogram(
+    "carebot_prompt_tokens", "Estimated prompt tokens per section after budgeting.", ["section"],
+    buckets=(16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192),
+)
+PROMPT_TRUNCATED = Counter(
+    "carebot_prompt_truncated_total", "Prompts with a section cut to fit its budget.", ["section"]
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate BPE token count: a word costs one token per four characters,
+    punctuation one each. Errs slightly high for English prose, which is the
+    safe side for a budget.
+    """
+    return sum((len(piece) + 3) // 4 for piece in _WORDS.findall(text))
+
+
+def _load_tokenizer(spec: str):
+    if spec.startswith("tiktoken:"):
+        try:
+            import tiktoken
+
+            encoding = tiktoken.get_encoding(spec.split(":", 1)[1])
+            return lambda text: len(encoding.encode(text, disallowed_special=()))
+        except Exception:
+            logger.warning("Tokenizer %r unavailable; estimating token counts", spec, exc_info=True)
+    elif spec != "estimate":
+        logger.warning("Unknown PROMPT_TOKENIZER %r; estimating token counts", spec)
+    return estimate_tokens
+
+
+class TokenCounter:
+    """
+    Token counts per text, cached in an LRU.
+
+    The static system text, retrieved facts and history messages recur
+    across turns, so most lookups are hits and only the new user message
+    is tokenized.
+    """
+
+    def __init__(self, count_fn=None, max_size: int = TOKEN_COUNT_CACHE_SIZE):
+        self.count_fn = count_fn
+        self.max_size = max_size
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, text: str) -> int:
+        with self._lock:
+            cached = self._counts.get(text)
+            if cached is not None:
+                self._counts.move_to_end(text)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        if self.count_fn is None:
+            # Resolved on first use so importing the module stays cheap.
+            self.count_fn = _load_tokenizer(PROMPT_TOKENIZER)
+        tokens = self.count_fn(text)
+
+        with self._lock:
+            self._counts[text] = tokens
+            while len(self._counts) > self.max_size:
+                self._counts.popitem(last=False)
+        return tokens
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """The longest word-boundary prefix of `text` within `max_tokens`."""
+        if self.count(text) <= max_tokens:
+            return text
+        bounds = [match.end() for match in re.finditer(r"\S+", text)]
+        low, high = 0, len(bounds)
+        # Binary search over word boundaries; prefixes are not cached.
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count_fn(text[:bounds[mid - 1]]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:bounds[low - 1]] if low else ""
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._counts),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class PromptAssembler:
+    """
+    Builds the CareBot message list within a token budget per section.
+
+    Layout, most stable first, so consecutive turns share the longest
+    possible prefix and Ollama can reuse its KV cache for it:
+
+        system   static instructions, byte-identical on every turn
+        system   rolling summary of turns that left the history window
+                 (omitted until there is one)
+        history  recent turns of the session, oldest first
+        system   retrieved facts for this turn (omitted when there are none)
+        user     this turn's message
+
+    Facts used to be part of the first system message, which changed the
+    very first tokens whenever retrieval did and forced a full prefill.
+    The summary only changes when the history window slides, which changes
+    everything after it anyway.
+    """
+
+    def __init__(
+        self,
+        counter: Optional[TokenCounter] = None,
+        system_budget: int = PROMPT_BUDGET_SYSTEM,
+        summary_budget: int = PROMPT_BUDGET_SUMMARY,
+        facts_budget: int = PROMPT_BUDGET_FACTS,
+        history_budget: int = PROMPT_BUDGET_HISTORY,
+        user_budget: int = PROMPT_BUDGET_USER,
+    ):
+        self.counter = counter or TokenCounter()
+        self.budgets = {
+            "system": system_budget,
+            "summary": summary_budget,
+            "facts": facts_budget,
+            "history": history_budget,
+            "user": user_budget,
+        }
+        self.prompts = 0
+        self.tokens = {section: 0 for section in self.budgets}
+        self.truncated = {section: 0 for section in self.budgets}
+
+    def _tokens(self, text: str) -> int:
+        return self.counter.count(text) + MESSAGE_OVERHEAD
+
+    def _fit_text(self, section: str, text: str) -> str:
+        budget = self.budgets[section] - MESSAGE_OVERHEAD
+        if self.counter.count(text) <= budget:
+            return text
+        self._truncated(section)
+        return self.counter.truncate(text, budget)
+
+    def _fit_facts(self, facts: List[str]) -> List[str]:
+        # Facts arrive most relevant first; keep as many whole ones as fit.
+        budget = self.budgets["facts"] - self._tokens(FACTS_HEADER)
+        kept = []
+        for fact in facts:
+            cost = self.counter.count(fact) + 1
+            if cost > budget:
+                self._truncated("facts")
+                break
+            kept.append(fact)
+            budget -= cost
+        return kept
+
+    def _fit_history(self, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        # Keep the newest messages that fit, then drop a leading assistant
+        # reply so the window still starts with a user turn.
+        budget = self.budgets["history"]
+        start = len(history)
+        while start > 0 and self._tokens(history[start - 1]["content"]) <= budget:
+            budget -= self._tokens(history[start - 1]["content"])
+            start -= 1
+        if start > 0:
+            self._truncated("history")
+        kept = history[start:]
+        while kept and kept[0]["role"] != "user":
+            kept = kept[1:]
+        return kept
+
+    def _truncated(self, section: str) -> None:
+        self.truncated[section] += 1
+        PROMPT_TRUNCATED.inc(section=section)
+
+    def assemble(
+        self,
+        system: str,
+        user: str,
+        facts: Optional[List[str]] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        summary: Optional[str] = None,
+    ) -> List[Dict[str, str]]:
+        system = self._fit_text("system", system)
+        summary = self._fit_text("summary", f"{SUMMARY_HEADER}\n{summary}") if summary else None
+        facts = self._fit_facts(facts or [])
+        history = self._fit_history(list(history or []))
+        user = self._fit_text("user", user)
+
+        messages = [{"role": "system", "content": system}]
+        if summary:
+            messages.append({"role": "system", "content": summary})
+        messages.extend(history)
+        if facts:
+            messages.append({"role": "system", "content": "\n".join([FACTS_HEADER, *facts])})
+        messages.append({"role": "user", "content": user})
+
+        sections = {
+            "system": self._tokens(system),
+            "summary": self._tokens(summary) if summary else 0,
+            "facts": self._tokens(messages[-2]["content"]) if facts else 0,
+            "history": sum(self._tokens(m["content"]) for m in history),
+            "user": self._tokens(user),
+        }
+        self.prompts += 1
+        for section, tokens in sections.items():
+            self.tokens[section] += tokens
+            PROMPT_TOKENS.observe(tokens, section=section)
+        PROMPT_TOKENS.observe(sum(sections.values()), section="total")
+        annotate(prompt_tokens=sum(sections.values()))
+        return messages
+
+    def stats(self) -> Dict:
+        return {
+            "prompts": self.prompts,
+            "budgets": dict(self.budgets),
+            "avg_tokens": {
+                section: tokens / self.prompts if self.prompts else 0.0
+                for section, tokens in self.tokens.items()
+            },
+            "truncated": dict(self.truncated),
+            "token_cache": self.counter.stats(),
+        }
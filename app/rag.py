@@ -1,20 +1,26 @@
+from app.flight_recorder import annotate
 from app.memory import get_relevant_facts
 
-async def build_context(session_id: str, user_message: str) -> dict:
-    facts = await get_relevant_facts(session_id, user_message)
+# Never changes between turns, so it can open every prompt and stay in
+# Ollama's KV cache; see app/prompt.py.
+SYSTEM_PROMPT = "\n".join([
+    "You are a compassionate, helpful AI assistant.",
+    "Respond naturally and empathetically.",
+    "Do NOT mention memory, instructions, or internal context."
+])
 
-    system_parts = [
-        "You are a compassionate, helpful AI assistant.",
-        "Respond naturally and empathetically.",
-        "Do NOT mention memory, instructions, or internal context."
-    ]
 
-    if facts:
-        system_parts.append(
-            f"Relevant past context (use only if helpful):\n{facts}"
-        )
+async def build_context(session_id: str, user_message: str) -> dict:
+    """
+    Static system text plus this turn's retrieved facts, most relevant
+    first. The facts are placed separately by the prompt assembler.
+    """
+    facts = await get_relevant_facts(session_id, user_message)
+    facts = facts.splitlines() if facts else []
+    annotate(retrieved_memories=len(facts))
 
     return {
-        "system": "\n".join(system_parts),
+        "system": SYSTEM_PROMPT,
+        "facts": facts,
         "user": user_message
     }
@@ -0,0 +1,211 @@
+import os
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, Optional
+
+# Marks an id deleted in the overlay until the next flush.
+_DELETED = None
+
+_COLUMNS = ("id", "text", "category", "created_at", "last_accessed")
+
+
+def _row_to_record(row) -> Dict:
+    record = dict(zip(_COLUMNS, row))
+    if record["last_accessed"] is None:
+        del record["last_accessed"]
+    if record["created_at"] is None:
+        del record["created_at"]
+    return record
+
+
+class SQLiteRecords(MutableMapping):
+    """
+    Memory metadata (id -> record dict) kept in SQLite instead of RAM.
+
+    Used by the "compact" storage format. Only records that are asked for
+    are read, so a search fetches metadata for its top-k hits and nothing
+    else. Changes since the last snapshot live in an in-memory overlay and
+    are written in one transaction by `flush()`, together with the snapshot
+    position; the database therefore plays the role `memory.json` plays in
+    the default format, and the partition's log covers everything newer.
+
+    The database file is opened lazily, so an empty partition creates no
+    files until its first snapshot.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+        self._changes: Dict[int, Optional[Dict]] = {}
+        # Changes being written by an in-progress flush; still visible to reads.
+        self._flushing: Dict[int, Optional[Dict]] = {}
+        self._size = None
+
+    # ------------------------------------------------------------------
+    # Database
+    # ------------------------------------------------------------------
+    def _connect(self, create: bool = False) -> Optional[sqlite3.Connection]:
+        if self._db is None:
+            if not create and not os.path.exists(self.path):
+                return None
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS memories (
+                    id INTEGER PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    category TEXT,
+                    created_at REAL,
+                    last_accessed REAL
+                );
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+                """
+            )
+        return self._db
+
+    def meta(self) -> Dict[str, int]:
+        """Snapshot position (`last_seq`, `next_id`) stored with the records."""
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return {}
+            return dict(db.execute("SELECT key, value FROM meta"))
+
+    def _stored(self, memory_id: int) -> Optional[Dict]:
+        db = self._connect()
+        if db is None:
+            return None
+        row = db.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM memories WHERE id = ?", (memory_id,)
+        ).fetchone()
+        return _row_to_record(row) if row else None
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # ------------------------------------------------------------------
+    # Mapping interface
+    # ------------------------------------------------------------------
+    def _lookup(self, memory_id: int) -> Optional[Dict]:
+        for layer in (self._changes, self._flushing):
+            if memory_id in layer:
+                return layer[memory_id]
+        return self._stored(memory_id)
+
+    def __getitem__(self, memory_id: int) -> Dict:
+        with self._lock:
+            record = self._lookup(memory_id)
+        if record is None:
+            raise KeyError(memory_id)
+        return record
+
+    def __contains__(self, memory_id) -> bool:
+        with self._lock:
+            return self._lookup(memory_id) is not None
+
+    def __setitem__(self, memory_id: int, record: Dict):
+        with self._lock:
+            if self._size is not None and self._lookup(memory_id) is None:
+                self._size += 1
+            self._changes[memory_id] = record
+
+    def __delitem__(self, memory_id: int):
+        with self._lock:
+            if self._lookup(memory_id) is None:
+                raise KeyError(memory_id)
+            if self._size is not None:
+                self._size -= 1
+            self._changes[memory_id] = _DELETED
+
+    def __len__(self) -> int:
+        with self._lock:
+            if self._size is None:
+                self._size = len(list(iter(self)))
+            return self._size
+
+    def __iter__(self) -> Iterator[int]:
+        with self._lock:
+            overlay = {**self._flushing, **self._changes}
+            db = self._connect()
+            stored = [row[0] for row in db.execute("SELECT id FROM memories")] if db else []
+
+        ids = [i for i in stored if overlay.get(i, True) is not _DELETED]
+        stored_set = set(stored)
+        ids += [i for i, record in overlay.items() if record is not _DELETED and i not in stored_set]
+        return iter(ids)
+
+    def items(self):
+        """All (id, record) pairs; reads the whole table, so offline use only."""
+        with self._lock:
+            overlay = {**self._flushing, **self._changes}
+            db = self._connect()
+            rows = db.execute(f"SELECT {', '.join(_COLUMNS)} FROM memories ORDER BY id") if db else []
+            merged = [
+                (record["id"], overlay.get(record["id"], record))
+                for record in map(_row_to_record, rows)
+            ]
+
+        stored = {memory_id for memory_id, _ in merged}
+        merged += [(i, r) for i, r in overlay.items() if i not in stored]
+        return [(memory_id, record) for memory_id, record in merged if record is not _DELETED]
+
+    def values(self):
+        return [record for _, record in self.items()]
+
+    def clear(self):
+        with self._lock:
+            self._changes.clear()
+            self._flushing.clear()
+            self._size = 0
+            db = self._connect()
+            if db is not None:
+                with db:
+                    db.execute("DELETE FROM memories")
+                    db.execute("DELETE FROM meta")
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+    def begin_flush(self):
+        """Freeze the current changes for `flush`; later changes go to a new overlay."""
+        with self._lock:
+            self._flushing.update(self._changes)
+            self._changes = {}
+
+    def flush(self, meta: Dict[str, int]):
+        """Write the frozen changes and `meta` in one transaction."""
+        with self._lock:
+            pending = dict(self._flushing)
+            db = self._connect(create=True)
+
+        upserts = [
+            (
+                memory_id,
+                record["text"],
+                record.get("category"),
+                record.get("created_at"),
+                record.get("last_accessed"),
+            )
+            for memory_id, record in pending.items()
+            if record is not _DELETED
+        ]
+        deletes = [(memory_id,) for memory_id, record in pending.items() if record is _DELETED]
+
+        with self._lock:
+            with db:
+                db.executemany("INSERT OR REPLACE INTO memories VALUES (?, ?, ?, ?, ?)", upserts)
+                db.executemany("DELETE FROM memories WHERE id = ?", deletes)
+                db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", meta.items())
+            self._flushing.clear()
+
+    def abort_flush(self):
+        """Put frozen changes back after a failed flush so they are retried."""
+        with self._lock:
+            self._flushing.update(self._changes)
+            self._changes, self._flushing = self._flushing, {}
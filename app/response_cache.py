@@ -0,0 +1,154 @@
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.metrics import Counter
+
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "1").lower() in ("1", "true", "yes")
+# Cosine similarity at which two queries count as the same question.
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.92"))
+# Replies collected per question before any is served, so a user asking
+# twice does not get the same text back.
+RESPONSE_CACHE_VARIANTS = int(os.getenv("RESPONSE_CACHE_VARIANTS", "3"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+# Seconds a cached question is served for, per route; 0 turns the route off.
+RESPONSE_CACHE_TTL = {
+    "greeting": float(os.getenv("RESPONSE_CACHE_TTL_GREETING", "3600")),
+    "care": float(os.getenv("RESPONSE_CACHE_TTL_CARE", "0")),
+}
+# Never cached, whatever the TTL settings say. Crisis questions asking
+# what to do ("my partner hit me again, what should I do") route to the
+# planner, and must always get a reply of their own.
+UNCACHEABLE_ROUTES = frozenset({"safety", "planner"})
+
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "carebot_response_cache_lookups_total",
+    "Response cache lookups by route and result (hit, miss, fill while collecting variants, "
+    "bypass when the prompt carried personal context).",
+    ["route", "result"],
+)
+
+
+class _Entry:
+    __slots__ = ("vector", "variants", "expires_at")
+
+    def __init__(self, vector: np.ndarray, expires_at: float):
+        self.vector = vector
+        self.variants: List[str] = []
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """
+    Replies to recurring low-risk questions, keyed by route and query
+    embedding.
+
+    Every "hi" used to cost a full CareBot completion for a one-line reply.
+    A query whose embedding is within `threshold` of a cached question on
+    the same route is answered from that question's pool of variants. A
+    pool is only served once it holds `variants` different replies; until
+    then the model answers and its reply joins the pool. A session's last
+    response is never served back to it, so the anti-repetition rule holds.
+
+    The cache knows nothing about prompts: `app.main` only serves and
+    stores replies for a prompt of the static system text and the message
+    alone, never when history, a summary or memories are part of it.
+    """
+
+    def __init__(
+        self,
+        encode,
+        enabled: bool = RESPONSE_CACHE,
+        threshold: float = RESPONSE_CACHE_THRESHOLD,
+        ttl: Optional[Dict[str, float]] = None,
+        variants: int = RESPONSE_CACHE_VARIANTS,
+        max_size: int = RESPONSE_CACHE_SIZE,
+    ):
+        # `encode(texts)` returns one embedding row per text.
+        self.encode = encode
+        self.enabled = enabled
+        self.threshold = threshold
+        self.ttl = dict(RESPONSE_CACHE_TTL if ttl is None else ttl)
+        self.variants = variants
+        self.max_size = max_size
+        self._entries: Dict[str, List[_Entry]] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0
+        self.bypassed = 0
+
+    def cacheable(self, route: str) -> bool:
+        return self.enabled and route not in UNCACHEABLE_ROUTES and self.ttl.get(route, 0) > 0
+
+    def embed(self, query: str) -> np.ndarray:
+        """Unit-length query embedding; blocking, so call it off the event loop."""
+        vector = np.asarray(self.encode([query]), dtype="float32")[0]
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def bypass(self, route: str) -> None:
+        """Count a lookup skipped because the prompt was personal."""
+        self.bypassed += 1
+        RESPONSE_CACHE_LOOKUPS.inc(route=route, result="bypass")
+
+    def _match(self, route: str, vector: np.ndarray, now: float) -> Optional[_Entry]:
+        entries = self._entries.get(route)
+        if entries:
+            entries[:] = [entry for entry in entries if entry.expires_at > now]
+        if not entries:
+            return None
+        scores = np.stack([entry.vector for entry in entries]) @ vector
+        best = int(np.argmax(scores))
+        return entries[best] if scores[best] >= self.threshold else None
+
+    def get(self, route: str, vector: np.ndarray, avoid: Optional[str] = None) -> Optional[str]:
+        """A cached reply to a similar question other than `avoid`, or None."""
+        with self._lock:
+            entry = self._match(route, vector, time.monotonic())
+            if entry is not None and len(entry.variants) < self.variants:
+                self.fills += 1
+                RESPONSE_CACHE_LOOKUPS.inc(route=route, result="fill")
+                return None
+            choices = [reply for reply in entry.variants if reply != avoid] if entry is not None else []
+            if not choices:
+                self.misses += 1
+                RESPONSE_CACHE_LOOKUPS.inc(route=route, result="miss")
+                return None
+            self.hits += 1
+            RESPONSE_CACHE_LOOKUPS.inc(route=route, result="hit")
+            return random.choice(choices)
+
+    def put(self, route: str, vector: np.ndarray, reply: str) -> None:
+        """Add `reply` to the pool of the matching question, or start one."""
+        if not self.cacheable(route) or not reply:
+            return
+        now = time.monotonic()
+        with self._lock:
+            entry = self._match(route, vector, now)
+            if entry is None:
+                entry = _Entry(vector, now + self.ttl[route])
+                entries = self._entries.setdefault(route, [])
+                entries.append(entry)
+                del entries[:-self.max_size]
+            if reply not in entry.variants and len(entry.variants) < self.variants:
+                entry.variants.append(reply)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses + self.fills
+        return {
+            "size": sum(len(entries) for entries in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "fills": self.fills,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,67 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.embedding_cache import normalize_text
+
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+
+
+class RetrievalCache:
+    """
+    Caches formatted `get_relevant_facts` results per session and query.
+
+    `rag.build_context` retrieves memories on every turn, re-encoding the
+    query and searching the index even when nothing changed. Entries are
+    keyed by session, normalized query text and k, and remember the
+    partition version they were computed at; any save, removal or clear
+    bumps the version, so a stale entry is never served.
+    """
+
+    def __init__(self, max_size: int = RETRIEVAL_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, str, int], Tuple[int, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def get(self, session_id: str, query: str, k: int, version: int) -> Optional[str]:
+        key = (session_id, normalize_text(query), k)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            if entry is not None:
+                del self._entries[key]
+                self.stale += 1
+            self.misses += 1
+            return None
+
+    def put(self, session_id: str, query: str, k: int, version: int, facts: str) -> None:
+        key = (session_id, normalize_text(query), k)
+        with self._lock:
+            self._entries[key] = (version, facts)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,266 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+# "memory" keeps sessions in this process; "sqlite" shares them between
+# uvicorn workers through SESSION_DB_PATH.
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+# Sessions idle for longer than this many seconds are forgotten.
+SESSION_TTL = float(os.getenv("SESSION_TTL", "86400"))
+# At most this many sessions are kept; the least recently active go first.
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+# Short-term history per session, in messages (user + assistant). Older
+# messages are folded into the session's rolling summary (app/summarizer.py).
+HISTORY_MESSAGES = int(os.getenv("SESSION_HISTORY_MESSAGES", "6"))
+
+
+class InMemorySessionStore:
+    """
+    Short-term conversation state (recent history + last reply) per session.
+
+    Replaces the unbounded `CHAT_HISTORY` / `LAST_RESPONSE_CACHE` dicts: an
+    LRU of at most `max_sessions`, where sessions idle for `ttl` seconds
+    expire. State is local to the process.
+
+    Messages pushed out of the history window are returned by
+    `record_reply` so they can be folded into the session's summary.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = SESSION_MAX,
+        ttl: float = SESSION_TTL,
+        history_messages: int = HISTORY_MESSAGES,
+    ):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.history_messages = history_messages
+        self._sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def _get(self, session_id: str, create: bool = False) -> Optional[Dict]:
+        now = time.time()
+        session = self._sessions.get(session_id)
+        if session is not None and now - session["updated_at"] > self.ttl:
+            del self._sessions[session_id]
+            self.evicted += 1
+            session = None
+
+        if session is None and create:
+            session = {
+                "history": deque(maxlen=self.history_messages),
+                "last_response": None,
+                "summary": "",
+                "updated_at": now,
+            }
+            self._sessions[session_id] = session
+            self._evict(now)
+        return session
+
+    def _evict(self, now: float) -> None:
+        # Least recently active sessions sit at the front.
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - session["updated_at"] <= self.ttl:
+                break
+            del self._sessions[session_id]
+            self.evicted += 1
+
+    def history(self, session_id: str) -> List[Dict[str, str]]:
+        with self._lock:
+            session = self._get(session_id)
+            return list(session["history"]) if session else []
+
+    def last_response(self, session_id: str) -> Optional[str]:
+        with self._lock:
+            session = self._get(session_id)
+            return session["last_response"] if session else None
+
+    def summary(self, session_id: str) -> str:
+        with self._lock:
+            session = self._get(session_id)
+            return session["summary"] if session else ""
+
+    def set_summary(self, session_id: str, summary: str) -> None:
+        """Replace the rolling summary of a session that still exists."""
+        with self._lock:
+            session = self._get(session_id)
+            if session is not None:
+                session["summary"] = summary
+
+    def record_reply(self, session_id: str, reply: str, user_message: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        Remember `reply` as the last response; with `user_message`, also add
+        the turn to history. Returns the messages that fell out of the window.
+        """
+        with self._lock:
+            session = self._get(session_id, create=True)
+            session["last_response"] = reply
+            overflow = []
+            if user_message is not None:
+                turn = [{"role": "user", "content": user_message}, {"role": "assistant", "content": reply}]
+                history = session["history"]
+                excess = len(history) + len(turn) - self.history_messages
+                overflow = (list(history) + turn)[:max(excess, 0)]
+                history.extend(turn)
+            session["updated_at"] = time.time()
+            self._sessions.move_to_end(session_id)
+            return overflow
+
+    def clear(self, session_id: Optional[str] = None) -> None:
+        with self._lock:
+            if session_id is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, float]:
+        return {"sessions": len(self._sessions), "evicted": self.evicted}
+
+
+class SQLiteSessionStore:
+    """
+    `InMemorySessionStore` backed by a SQLite file, shared by worker processes.
+
+    Each update is one short `BEGIN IMMEDIATE` transaction, so two workers
+    appending to the same session never lose a turn. WAL mode lets readers
+    proceed while another worker writes. Expired and over-capacity sessions
+    are deleted every `evict_every` writes.
+    """
+
+    def __init__(
+        self,
+        path: str = SESSION_DB_PATH,
+        max_sessions: int = SESSION_MAX,
+        ttl: float = SESSION_TTL,
+        history_messages: int = HISTORY_MESSAGES,
+        evict_every: int = 64,
+    ):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.history_messages = history_messages
+        self.evict_every = evict_every
+        self._writes = 0
+        self.evicted = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                history TEXT NOT NULL,
+                last_response TEXT,
+                updated_at REAL NOT NULL,
+                summary TEXT NOT NULL DEFAULT ''
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(sessions)")}
+        if "summary" not in columns:
+            # Databases created before rolling summaries.
+            self._db.execute("ALTER TABLE sessions ADD COLUMN summary TEXT NOT NULL DEFAULT ''")
+
+    def _row(self, session_id: str):
+        row = self._db.execute(
+            "SELECT history, last_response, updated_at, summary FROM sessions WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        if row is None or time.time() - row[2] > self.ttl:
+            return None
+        return row
+
+    def history(self, session_id: str) -> List[Dict[str, str]]:
+        with self._lock:
+            row = self._row(session_id)
+        return json.loads(row[0]) if row else []
+
+    def last_response(self, session_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._row(session_id)
+        return row[1] if row else None
+
+    def summary(self, session_id: str) -> str:
+        with self._lock:
+            row = self._row(session_id)
+        return row[3] if row else ""
+
+    def set_summary(self, session_id: str, summary: str) -> None:
+        """Replace the rolling summary of a session that still exists."""
+        with self._lock:
+            self._db.execute("UPDATE sessions SET summary = ? WHERE session_id = ?", (summary, session_id))
+
+    def record_reply(self, session_id: str, reply: str, user_message: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        Remember `reply` as the last response; with `user_message`, also add
+        the turn to history. Returns the messages that fell out of the window.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._row(session_id)
+                history = json.loads(row[0]) if row else []
+                if user_message is not None:
+                    history.append({"role": "user", "content": user_message})
+                    history.append({"role": "assistant", "content": reply})
+                keep = len(history) - self.history_messages if self.history_messages else len(history)
+                overflow, history = history[:max(keep, 0)], history[max(keep, 0):]
+
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, history, last_response, updated_at, summary) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (session_id, json.dumps(history), reply, time.time(), row[3] if row else ""),
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._evict()
+            return overflow
+
+    def _evict(self) -> None:
+        deleted = self._db.execute(
+            "DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl,)
+        ).rowcount
+        deleted += self._db.execute(
+            """
+            DELETE FROM sessions WHERE session_id IN (
+                SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_sessions,),
+        ).rowcount
+        self.evicted += deleted
+
+    def clear(self, session_id: Optional[str] = None) -> None:
+        with self._lock:
+            if session_id is None:
+                self._db.execute("DELETE FROM sessions")
+            else:
+                self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            sessions = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"sessions": sessions, "evicted": self.evicted}
+
+
+def create_session_store(kind: str = SESSION_STORE):
+    """Build the session store selected by SESSION_STORE."""
+    if kind == "sqlite":
+        return SQLiteSessionStore()
+    if kind == "memory":
+        return InMemorySessionStore()
+    raise ValueError(f"Unknown session store {kind!r}; expected 'memory' or 'sqlite'")
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Set
+
+from app.metrics import SUMMARIES, stage
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_QUEUE_SIZE = int(os.getenv("SUMMARY_QUEUE_SIZE", "256"))
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "1"))
+# Length the MemoryBot is asked to keep the summary under; the prompt
+# assembler still cuts it to PROMPT_BUDGET_SUMMARY tokens.
+SUMMARY_MAX_WORDS = int(os.getenv("SUMMARY_MAX_WORDS", "120"))
+
+
+def _summary_prompt(summary: str, messages: List[Dict[str, str]], max_words: int) -> str:
+    lines = "\n".join(
+        f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in messages
+    )
+    return f"""
+Current summary of the conversation:
+{summary or "(none yet)"}
+
+Older messages to fold into it:
+{lines}
+
+Rewrite the summary so it also covers these messages.
+Keep what the user shared about their situation, feelings and plans, and any open questions.
+Use at most {max_words} words. Reply with the summary only.
+"""
+
+
+class ConversationSummarizer:
+    """
+    Rolling per-session summaries of turns that left the history window.
+
+    The session store only keeps the last HISTORY_MESSAGES messages, so a
+    long conversation used to forget its beginning. Messages that fall out
+    of the window are submitted here and folded into the session summary by
+    the MemoryBot in the background; the next prompts carry the summary in
+    place of the old turns, so prompt size stays flat however long the
+    conversation gets.
+
+    Updates of one session are applied in order: messages that arrive while
+    the session is being summarized wait and are folded in by the same
+    worker right after.
+    """
+
+    def __init__(
+        self,
+        get_agent,
+        executor,
+        config: dict,
+        store,
+        maxsize: int = SUMMARY_QUEUE_SIZE,
+        workers: int = SUMMARY_WORKERS,
+        max_words: int = SUMMARY_MAX_WORDS,
+    ):
+        self.get_agent = get_agent
+        self.executor = executor
+        self.config = config
+        self.store = store
+        self.maxsize = maxsize
+        self.workers = workers
+        self.max_words = max_words
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: Dict[str, List[Dict[str, str]]] = {}
+        self._active: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._loop = None
+
+        self.summarized = 0
+        self.failed = 0
+        self.dropped = 0
+
+    @property
+    def depth(self) -> int:
+        """Number of sessions waiting for a summary update."""
+        return len(self._pending)
+
+    def start(self) -> None:
+        """Start the workers on the running event loop (idempotent)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks:
+            return
+
+        # Same as the extraction queue: a new loop starts from scratch.
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._pending = {}
+        self._active = set()
+        self._tasks = [
+            loop.create_task(self._worker(), name=f"summarizer-{i}")
+            for i in range(self.workers)
+        ]
+
+    def submit(self, session_id: str, messages: List[Dict[str, str]]) -> bool:
+        """
+        Queue messages that left the history window of a session.
+
+        Returns False if the queue is full and the messages were dropped.
+        """
+        self.start()
+        if session_id in self._pending:
+            self._pending[session_id].extend(messages)
+            return True
+        try:
+            self._queue.put_nowait(session_id)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            SUMMARIES.inc(outcome="dropped")
+            logger.warning("Summary queue full; dropping %d message(s)", len(messages))
+            return False
+        self._pending[session_id] = list(messages)
+        return True
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """Wait for queued summaries to be written, then stop the workers."""
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Summary drain timed out with %d sessions left", self.depth)
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self.depth,
+            "summarized": self.summarized,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    async def _worker(self) -> None:
+        while True:
+            session_id = await self._queue.get()
+            try:
+                # Another worker is summarizing this session and will pick
+                # up the new messages when it is done.
+                if session_id not in self._active:
+                    self._active.add(session_id)
+                    try:
+                        while session_id in self._pending:
+                            await self._summarize(session_id, self._pending.pop(session_id))
+                    finally:
+                        self._active.discard(session_id)
+            finally:
+                self._queue.task_done()
+
+    async def _summarize(self, session_id: str, messages: List[Dict[str, str]]) -> None:
+        try:
+            summary = await asyncio.to_thread(self.store.summary, session_id)
+            prompt = _summary_prompt(summary, messages, self.max_words)
+
+            with stage("summarize"):
+                reply = await self.executor.generate(
+                    self.get_agent,
+                    [{"role": "user", "content": prompt}],
+                    self.config,
+                )
+            if isinstance(reply, dict):
+                reply = reply.get("content")
+            reply = (reply or "").strip()
+            if not reply:
+                raise ValueError("MemoryBot returned an empty summary")
+
+            await asyncio.to_thread(self.store.set_summary, session_id, reply)
+        except Exception:
+            # The messages are lost to the summary, but the conversation
+            # goes on; the next overflow starts from the previous summary.
+            self.failed += 1
+            SUMMARIES.inc(outcome="failed")
+            logger.exception("Summary update failed for %d message(s)", len(messages))
+            return
+        self.summarized += 1
+        SUMMARIES.inc(outcome="summarized")
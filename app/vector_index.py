@@ -0,0 +1,161 @@
+import math
+import os
+from typing import Tuple
+
+import faiss
+import numpy as np
+
+# Which FAISS structure memory partitions use: "flat" (exact, linear scan),
+# "hnsw" (graph, sub-linear search) or "ivf" (inverted lists, trained
+# automatically once a partition holds IVF_TRAIN_SIZE vectors).
+INDEX_BACKEND = os.getenv("MEMORY_INDEX_BACKEND", "flat")
+BACKENDS = ("flat", "hnsw", "ivf")
+
+HNSW_M = int(os.getenv("MEMORY_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("MEMORY_HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH = int(os.getenv("MEMORY_HNSW_EF_SEARCH", "128"))
+
+IVF_TRAIN_SIZE = int(os.getenv("MEMORY_IVF_TRAIN_SIZE", "4096"))
+IVF_NPROBE = int(os.getenv("MEMORY_IVF_NPROBE", "16"))
+
+
+def _inner(index):
+    """The index wrapped by an IndexIDMap2 (or the index itself)."""
+    if isinstance(index, faiss.IndexIDMap2):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def backend_of(index) -> str:
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def configure(index):
+    """Apply search-time parameters, which are not stored in index files."""
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = HNSW_EF_SEARCH
+    elif isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = IVF_NPROBE
+    return index
+
+
+def create_index(dimension: int, backend: str = INDEX_BACKEND, training_vectors: np.ndarray = None):
+    """
+    Build an empty index for `backend` that stores vectors under our own ids.
+
+    Flat and HNSW are wrapped in IndexIDMap2. IVF stores ids natively (the
+    ID map's remove() assumes the inner index compacts, which IVF does not)
+    and keeps a hash-table direct map so vectors can be reconstructed and
+    removed by id. IVF needs training data; with fewer than IVF_TRAIN_SIZE
+    vectors it falls back to flat until `ensure_backend` upgrades it.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown index backend {backend!r}; expected one of {BACKENDS}")
+
+    if backend == "ivf" and training_vectors is not None and len(training_vectors) >= IVF_TRAIN_SIZE:
+        nlist = max(1, int(math.sqrt(len(training_vectors))))
+        quantizer = faiss.IndexFlatL2(dimension)
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        # The IVF index must own its quantizer, or Python may free it first.
+        index.own_fields = True
+        quantizer.this.disown()
+        index.train(np.ascontiguousarray(training_vectors, dtype="float32"))
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return configure(index)
+
+    if backend == "hnsw":
+        inner = faiss.IndexHNSWFlat(dimension, HNSW_M)
+        inner.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    else:
+        inner = faiss.IndexFlatL2(dimension)
+
+    index = faiss.IndexIDMap2(inner)
+    index.own_fields = True
+    inner.this.disown()
+    return configure(index)
+
+
+def stored_ids(index) -> np.ndarray:
+    """Ids of every vector in the index, in no particular order."""
+    if isinstance(index, faiss.IndexIDMap2):
+        return faiss.vector_to_array(index.id_map).astype("int64")
+
+    ids = []
+    invlists = index.invlists
+    for list_no in range(index.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            ids.append(faiss.rev_swig_ptr(invlists.get_ids(list_no), size).copy())
+    return np.concatenate(ids).astype("int64") if ids else np.zeros(0, dtype="int64")
+
+
+def extract(index) -> Tuple[np.ndarray, np.ndarray]:
+    """Return `(ids, vectors)` for everything stored in the index."""
+    ids = stored_ids(index)
+    if len(ids) == 0:
+        return ids, np.zeros((0, index.d), dtype="float32")
+
+    if isinstance(index, faiss.IndexIDMap2):
+        # Inner positions line up with id_map, so one bulk copy suffices.
+        inner = _inner(index)
+        return ids, inner.reconstruct_n(0, inner.ntotal)
+
+    return ids, np.vstack([index.reconstruct(int(i)) for i in ids])
+
+
+def remove(index, ids):
+    """
+    Remove vectors by id and return the (possibly new) index.
+
+    HNSW graphs cannot delete nodes, so for them the index is rebuilt
+    without the removed ids; flat and IVF delete in place.
+    """
+    ids = np.asarray(ids, dtype="int64")
+    if len(ids) == 0:
+        return index
+
+    if backend_of(index) != "hnsw":
+        index.remove_ids(ids)
+        return index
+
+    all_ids, vectors = extract(index)
+    keep = ~np.isin(all_ids, ids)
+    new_index = create_index(index.d, "hnsw")
+    if keep.any():
+        new_index.add_with_ids(vectors[keep], all_ids[keep])
+    return new_index
+
+
+def rebuild(index, backend: str = INDEX_BACKEND):
+    """Copy every vector (with its id) into a fresh index of `backend`."""
+    ids, vectors = extract(index)
+    new_index = create_index(index.d, backend, training_vectors=vectors)
+    if len(ids):
+        new_index.add_with_ids(vectors, ids)
+    return new_index
+
+
+def target_backend(index, backend: str = INDEX_BACKEND) -> str:
+    """The backend an index should be on now; IVF waits for enough data."""
+    if backend == "ivf" and backend_of(index) != "ivf" and index.ntotal < IVF_TRAIN_SIZE:
+        return "flat"
+    return backend
+
+
+def ensure_backend(index, backend: str = INDEX_BACKEND):
+    """
+    Return `(index, changed)`, migrating the index to `backend` if needed.
+
+    Used after loading (e.g. an old flat `memory.index` with the backend now
+    set to HNSW) and after adds, which is where IVF gets trained once a
+    partition has enough vectors.
+    """
+    if backend_of(index) == target_backend(index, backend):
+        return configure(index), False
+    return rebuild(index, backend), True
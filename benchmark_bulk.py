@@ -0,0 +1,65 @@
+"""
+Bulk memory ingestion benchmark.
+
+Imports the same synthetic history once through per-item save_memory()
+calls and once through save_memories(), each into a fresh temporary store.
+
+Run: PYTHONPATH=. python benchmark_bulk.py [--memories 5000] [--chunk-size 512]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from app import memory
+
+CATEGORIES = ["personal", "preference", "health", "work"]
+
+
+def _history(n: int):
+    # Every tenth memory repeats an earlier one, as real exports do.
+    return [
+        {"text": f"user mentioned fact number {i % max(1, n - n // 10)}", "category": CATEGORIES[i % 4]}
+        for i in range(n)
+    ]
+
+
+def _fresh_store():
+    os.chdir(tempfile.mkdtemp(prefix="carebot-bulk-"))
+    memory._partitions.clear()
+    memory.embedding_cache.clear()
+
+
+def run_benchmark(n: int, chunk_size: int):
+    history = _history(n)
+    memory.embedder.encode(["warm-up"])  # load the model outside the timings
+
+    _fresh_store()
+    started = time.perf_counter()
+    for item in history:
+        memory.save_memory(item["text"], item["category"])
+    memory.flush_memory()
+    per_item = time.perf_counter() - started
+    per_item_count = memory.get_partition().index.ntotal
+
+    _fresh_store()
+    started = time.perf_counter()
+    counts = memory.save_memories(history, chunk_size=chunk_size)
+    bulk = time.perf_counter() - started
+
+    print(f"{'path':>10} | {'seconds':>8} | {'memories/s':>10} | stored")
+    print("-" * 60)
+    print(f"{'per-item':>10} | {per_item:>8.2f} | {n / per_item:>10.1f} | {per_item_count}")
+    print(f"{'bulk':>10} | {bulk:>8.2f} | {n / bulk:>10.1f} | {counts['saved']}")
+    print(f"\nSpeedup: {per_item / bulk:.1f}x ({counts['skipped']} duplicates skipped)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--memories", type=int, default=5000)
+    parser.add_argument("--chunk-size", type=int, default=memory.BULK_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    print("🧪 Bulk Ingestion Benchmark")
+    print("=" * 60)
+    run_benchmark(args.memories, args.chunk_size)
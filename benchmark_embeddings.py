@@ -0,0 +1,59 @@
+"""
+Throughput benchmark for the micro-batched embedding service.
+
+Compares encoding one text per model call (the old behaviour) with the
+EmbeddingBatcher used by app.memory, at 1/8/32/128 concurrent callers.
+
+Run: PYTHONPATH=. python benchmark_embeddings.py [--requests 512]
+"""
+import argparse
+import asyncio
+import time
+
+from app.embedding_service import EmbeddingBatcher
+from app.memory import embedder
+
+CONCURRENCY_LEVELS = [1, 8, 32, 128]
+
+
+def _texts(n: int):
+    return [f"user mentioned fact number {i} about their week" for i in range(n)]
+
+
+async def _drive(encode, texts, concurrency: int) -> float:
+    """Run `encode` over texts with `concurrency` callers; return texts/sec."""
+    queue = list(texts)
+
+    async def caller():
+        while queue:
+            await encode(queue.pop())
+
+    started = time.perf_counter()
+    await asyncio.gather(*[caller() for _ in range(concurrency)])
+    return len(texts) / (time.perf_counter() - started)
+
+
+async def run_benchmark(requests: int):
+    texts = _texts(requests)
+
+    async def unbatched(text):
+        return await asyncio.to_thread(embedder.encode, [text])
+
+    print(f"{'callers':>8} | {'unbatched/s':>12} | {'batched/s':>10} | {'avg batch':>9} | speedup")
+    print("-" * 60)
+    for concurrency in CONCURRENCY_LEVELS:
+        batcher = EmbeddingBatcher(lambda batch: embedder.encode(batch))
+        base = await _drive(unbatched, texts, concurrency)
+        batched = await _drive(batcher.encode, texts, concurrency)
+        avg = batcher.stats()["avg_batch_size"]
+        print(f"{concurrency:>8} | {base:>12.1f} | {batched:>10.1f} | {avg:>9.1f} | {batched / base:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=512)
+    args = parser.parse_args()
+
+    print("🧪 Embedding Throughput Benchmark")
+    print("=" * 60)
+    asyncio.run(run_benchmark(args.requests))
@@ -0,0 +1,85 @@
+"""
+Recall and latency benchmark for the memory index backends.
+
+Builds flat, HNSW and IVF indexes (app/vector_index.py) over synthetic,
+clustered 384-d "memories" and reports build time, recall@k against exact
+search, and single-query latency percentiles, the way get_relevant_facts
+queries the index.
+
+Run: PYTHONPATH=. python benchmark_index.py [--sizes 10000 100000 1000000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app import vector_index
+from app.memory import dimension
+
+
+def synthetic_memories(n: int, seed: int = 0) -> np.ndarray:
+    """Unit vectors drawn around a few hundred topics, like real embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((256, dimension)).astype("float32")
+    vectors = centers[rng.integers(0, len(centers), n)]
+    vectors += 0.35 * rng.standard_normal((n, dimension)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def _percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+
+def bench_backend(backend: str, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int):
+    started = time.perf_counter()
+    index = vector_index.create_index(dimension, backend, training_vectors=vectors)
+    index.add_with_ids(vectors, np.arange(len(vectors), dtype="int64"))
+    build_s = time.perf_counter() - started
+
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - started)
+        hits += len(set(ids[0]) & set(expected))
+
+    return {
+        "backend": vector_index.backend_of(index),
+        "build_s": build_s,
+        "recall": hits / (len(queries) * k),
+        "p50_ms": _percentile_ms(latencies, 50),
+        "p99_ms": _percentile_ms(latencies, 99),
+    }
+
+
+def run(sizes, k: int, n_queries: int):
+    print(f"{'size':>9} | {'backend':<7} | {'build (s)':>9} | {'recall@' + str(k):>9} | {'p50 (ms)':>8} | {'p99 (ms)':>8}")
+    print("-" * 66)
+    for size in sizes:
+        vectors = synthetic_memories(size)
+        queries = synthetic_memories(n_queries, seed=1)
+
+        exact = vector_index.create_index(dimension, "flat")
+        exact.add_with_ids(vectors, np.arange(size, dtype="int64"))
+        _, truth = exact.search(queries, k)
+
+        for backend in vector_index.BACKENDS:
+            r = bench_backend(backend, vectors, queries, truth, k)
+            print(
+                f"{size:>9} | {r['backend']:<7} | {r['build_s']:>9.2f} | "
+                f"{r['recall']:>9.3f} | {r['p50_ms']:>8.3f} | {r['p99_ms']:>8.3f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    print("🧪 Memory Index Benchmark")
+    print("=" * 66)
+    run(args.sizes, args.k, args.queries)
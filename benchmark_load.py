@@ -0,0 +1,320 @@
+"""
+Load benchmark: concurrent simulated users against the chat pipeline.
+
+Starts a stub Ollama server (tests/stub_ollama.py) with a fixed token rate
+and first-token latency, points the app at it and runs N users that each
+send T messages in turn. Reports p50/p95/p99 time-to-first-token, total
+latency and throughput, so the numbers reflect the app's own overhead and
+queueing rather than the model. Pass --backend to measure a real Ollama,
+or --stubs N to spread the load over a pool of N stub backends.
+
+Targets:
+  ws      the FastAPI /ws endpoint, served by uvicorn (needs `websockets`)
+  stream  run_agent_stream() in-process
+  agent   run_agent() in-process; TTFT equals total latency (no streaming)
+
+--json writes the results for comparison between releases; with
+--baseline, the run fails if a p95 regressed by more than --max-regression.
+
+Run: PYTHONPATH=. python benchmark_load.py [--target ws] [--users 16] [--json load.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from tests.stub_ollama import StubOllama
+
+MESSAGES = [
+    "I've been feeling overwhelmed at work lately",
+    "how can i get better sleep before exams?",
+    "My sister moved away and I feel a bit lonely",
+    "I started running again this week",
+    "what should i do when I can't focus?",
+    "hello",
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# ----------------------------------------------------------------------
+# Targets: each returns (ttft, total, tokens) for one turn, in seconds
+# ----------------------------------------------------------------------
+async def _turn_stream(run_agent_stream, session_id: str, message: str):
+    start = time.perf_counter()
+    ttft, tokens = None, 0
+    async for frame in run_agent_stream(message, session_id):
+        if frame["type"] == "stream":
+            tokens += 1
+            if ttft is None:
+                ttft = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return ttft if ttft is not None else total, total, tokens
+
+
+async def _turn_agent(run_agent, session_id: str, message: str):
+    start = time.perf_counter()
+    reply = await run_agent(message, session_id)
+    total = time.perf_counter() - start
+    return total, total, len(reply.split())
+
+
+async def _turn_ws(connection, message: str):
+    start = time.perf_counter()
+    ttft, tokens = None, 0
+    await connection.send(message)
+    while True:
+        frame = json.loads(await connection.recv())
+        if frame["type"] == "stream":
+            tokens += 1
+            if ttft is None:
+                ttft = time.perf_counter() - start
+        elif frame["type"] == "error":
+            raise RuntimeError(frame["content"])
+        elif frame["type"] == "final":
+            break
+    total = time.perf_counter() - start
+    return ttft if ttft is not None else total, total, tokens
+
+
+def _start_server(port: int):
+    import uvicorn
+
+    from web.server import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+async def _wait_ready(port: int, timeout: float = 300.0) -> None:
+    """Poll /ready so warm-up time is not counted as request latency."""
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if (await client.get(f"http://127.0.0.1:{port}/ready")).status_code == 200:
+                return
+            await asyncio.sleep(0.2)
+    raise TimeoutError("server did not become ready")
+
+
+# ----------------------------------------------------------------------
+# Load generator
+# ----------------------------------------------------------------------
+async def run_load(target: str, users: int, turns: int, think_time: float):
+    samples, errors = [], []
+
+    if target == "ws":
+        import websockets
+
+        port = _free_port()
+        server, thread = _start_server(port)
+        await _wait_ready(port)
+    else:
+        from app.main import extraction_queue, run_agent, run_agent_stream, summarizer, warm_up
+
+        await warm_up()
+
+    async def user(i: int):
+        session_id = f"load-user-{i:04d}"
+        connection = None
+        if target == "ws":
+            connection = await websockets.connect(f"ws://127.0.0.1:{port}/ws?session_id={session_id}")
+        try:
+            for t in range(turns):
+                message = MESSAGES[(i + t) % len(MESSAGES)]
+                try:
+                    if target == "ws":
+                        samples.append(await _turn_ws(connection, message))
+                    elif target == "stream":
+                        samples.append(await _turn_stream(run_agent_stream, session_id, message))
+                    else:
+                        samples.append(await _turn_agent(run_agent, session_id, message))
+                except Exception as e:
+                    errors.append(f"{type(e).__name__}: {e}")
+                await asyncio.sleep(think_time)
+        finally:
+            if connection is not None:
+                await connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(users)))
+    elapsed = time.perf_counter() - start
+
+    if target == "ws":
+        server.should_exit = True
+        thread.join(timeout=10)
+    else:
+        # Background memory extraction is not part of the measured turns.
+        await extraction_queue.drain(timeout=30)
+        await summarizer.drain(timeout=30)
+    return samples, errors, elapsed
+
+
+def _percentiles(values) -> dict:
+    if not values:
+        return {}
+    ms = np.asarray(values) * 1000
+    return {
+        "p50": round(float(np.percentile(ms, 50)), 1),
+        "p95": round(float(np.percentile(ms, 95)), 1),
+        "p99": round(float(np.percentile(ms, 99)), 1),
+        "mean": round(float(ms.mean()), 1),
+    }
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def _regressions(result: dict, baseline: dict, max_regression: float):
+    """(metric, old, new) for every p95 that got worse by more than max_regression."""
+    found = []
+    for metric in ("ttft_ms", "latency_ms"):
+        old = baseline.get(metric, {}).get("p95")
+        new = result.get(metric, {}).get("p95")
+        if old and new and new > old * (1 + max_regression):
+            found.append((metric, old, new))
+    old = baseline.get("throughput", {}).get("turns_per_s")
+    new = result["throughput"]["turns_per_s"]
+    if old and new < old * (1 - max_regression):
+        found.append(("turns_per_s", old, new))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--target", choices=["ws", "stream", "agent"], default="stream")
+    parser.add_argument("--users", type=int, default=16, help="concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=5, help="messages per user")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds between a user's messages")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="stub tokens per second")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub seconds before the first token")
+    parser.add_argument("--tokens", type=int, default=40, help="stub tokens per reply")
+    parser.add_argument("--prefill-rate", type=float, default=0.0,
+                        help="stub prompt tokens per second outside the cached prefix (0: free)")
+    parser.add_argument("--backend", help="real Ollama base URL instead of the stub")
+    parser.add_argument("--stubs", type=int, default=1, help="stub backends in the LLM pool")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file of a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+    # Resolved now: the run itself happens in a scratch directory.
+    args.json = args.json and os.path.abspath(args.json)
+    args.baseline = args.baseline and os.path.abspath(args.baseline)
+
+    stubs = []
+    if args.backend:
+        base_urls = [args.backend]
+    else:
+        stubs = [
+            StubOllama(
+                token_rate=args.token_rate, latency=args.latency, tokens=args.tokens, prefill_rate=args.prefill_rate,
+            ).start()
+            for _ in range(args.stubs)
+        ]
+        base_urls = [stub.base_url for stub in stubs]
+
+    # Before app.llm builds the executor's backend pool from the config.
+    from config.llm_config import config_list
+    config_list[:] = [{**config_list[0], "base_url": url} for url in base_urls]
+    base_url = ", ".join(base_urls)
+
+    # Start from an empty memory store and session state.
+    os.chdir(tempfile.mkdtemp(prefix="carebot-load-"))
+
+    print("🧪 Load Benchmark")
+    print("=" * 60)
+    print(f"Target: {args.target}, users: {args.users}, turns: {args.turns}, backend: {base_url}")
+    if stubs:
+        print(f"Stub: {args.token_rate:g} tok/s, {args.latency * 1000:.0f} ms to first token, {args.tokens} tokens")
+
+    samples, errors, elapsed = asyncio.run(run_load(args.target, args.users, args.turns, args.think_time))
+
+    ttft = [s[0] for s in samples]
+    total = [s[1] for s in samples]
+    tokens = sum(s[2] for s in samples)
+    result = {
+        "commit": _commit(),
+        "config": {
+            "target": args.target,
+            "users": args.users,
+            "turns": args.turns,
+            "think_time": args.think_time,
+            "backend": "ollama" if args.backend else "stub",
+            "stubs": len(stubs),
+            "token_rate": args.token_rate,
+            "latency": args.latency,
+            "tokens": args.tokens,
+            "prefill_rate": args.prefill_rate,
+        },
+        "turns": len(samples),
+        "errors": len(errors),
+        "ttft_ms": _percentiles(ttft),
+        "latency_ms": _percentiles(total),
+        "throughput": {
+            "turns_per_s": round(len(samples) / elapsed, 2),
+            "tokens_per_s": round(tokens / elapsed, 1),
+        },
+        "elapsed_s": round(elapsed, 2),
+    }
+    if stubs:
+        stats = [stub.stats() for stub in stubs]
+        result["stub"] = stats[0] if len(stubs) == 1 else stats
+        for stub in stubs:
+            stub.stop()
+
+    print(f"\n{'':<12}{'p50':>10}{'p95':>10}{'p99':>10}{'mean':>10}  (ms)")
+    for label, key in (("TTFT", "ttft_ms"), ("Latency", "latency_ms")):
+        row = result[key]
+        print(f"{label:<12}" + "".join(f"{row.get(p, float('nan')):>10.1f}" for p in ("p50", "p95", "p99", "mean")))
+    print(f"\nThroughput: {result['throughput']['turns_per_s']} turns/s, "
+          f"{result['throughput']['tokens_per_s']} tokens/s over {result['elapsed_s']} s")
+    print(f"Turns: {result['turns']}, errors: {result['errors']}")
+    for error in sorted(set(errors))[:5]:
+        print(f"  {error}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Wrote {args.json}")
+
+    failed = bool(errors)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = _regressions(result, json.load(f), args.max_regression)
+        for metric, old, new in regressions:
+            print(f"❌ {metric} regressed: {old} -> {new}")
+        if not regressions:
+            print(f"✅ No regression beyond {args.max_regression:.0%} against {args.baseline}")
+        failed = failed or bool(regressions)
+
+    print("=" * 60)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Benchmark for the memory-extraction gate (app/memory_gate.py).
+
+Measures precision, recall and skip rate of the gate against the labelled
+turns in tests/fixtures/memory_gate_turns.jsonl, with lexical rules only and
+with the MiniLM embedding fallback enabled.
+
+Run: PYTHONPATH=. python benchmark_memory_gate.py
+"""
+import json
+import time
+from pathlib import Path
+
+from app.memory_gate import MemoryGate, evaluate_gate
+
+FIXTURE = Path(__file__).parent / "tests" / "fixtures" / "memory_gate_turns.jsonl"
+
+
+def _report(name: str, gate: MemoryGate, examples):
+    started = time.perf_counter()
+    report = evaluate_gate(gate, examples)
+    elapsed_ms = (time.perf_counter() - started) * 1000 / len(examples)
+
+    print(f"\n{name}")
+    print(f"  precision : {report['precision']:.3f}")
+    print(f"  recall    : {report['recall']:.3f}")
+    print(f"  skip rate : {report['skip_rate']:.3f}  (share of extractor calls saved)")
+    print(f"  cost      : {elapsed_ms:.2f} ms / turn")
+
+
+if __name__ == "__main__":
+    with open(FIXTURE) as f:
+        examples = [json.loads(line) for line in f if line.strip()]
+
+    print("🧪 Memory Gate Benchmark")
+    print("=" * 60)
+    print(f"{len(examples)} labelled turns")
+
+    _report("Lexical rules only", MemoryGate(), examples)
+
+    from app.memory import embedder
+    _report("Lexical rules + MiniLM fallback", MemoryGate(embedder), examples)
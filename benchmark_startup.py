@@ -0,0 +1,73 @@
+"""
+Startup-time benchmark.
+
+Imports each module in a fresh interpreter and reports its wall-clock
+import cost and peak RSS, then measures the explicit warm-up step
+(`app.main.warm_up`) that loads the embedding model, memory and agents.
+
+Run: PYTHONPATH=. python benchmark_startup.py [--skip-warm-up]
+"""
+import argparse
+import subprocess
+import sys
+
+MODULES = [
+    "app.router",
+    "app.memory",
+    "app.rag",
+    "app.main",
+    "web.server",
+]
+
+_IMPORT_SNIPPET = """
+import resource, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+if sys.platform == "darwin":
+    rss_mb /= 1024
+print(f"{{elapsed:.3f}} {{rss_mb:.1f}}")
+"""
+
+_WARM_UP_SNIPPET = """
+import asyncio, resource, sys, time
+from app.main import warm_up
+started = time.perf_counter()
+asyncio.run(warm_up())
+elapsed = time.perf_counter() - started
+rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+if sys.platform == "darwin":
+    rss_mb /= 1024
+print(f"{elapsed:.3f} {rss_mb:.1f}")
+"""
+
+
+def _run(snippet: str):
+    out = subprocess.run(
+        [sys.executable, "-c", snippet],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    seconds, rss_mb = out.stdout.strip().splitlines()[-1].split()
+    return float(seconds), float(rss_mb)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--skip-warm-up", action="store_true")
+    args = parser.parse_args()
+
+    print("🧪 Startup Benchmark")
+    print("=" * 60)
+    print(f"{'module':<14} | {'import (s)':>10} | {'peak RSS (MB)':>13}")
+    print("-" * 60)
+    for module in MODULES:
+        seconds, rss_mb = _run(_IMPORT_SNIPPET.format(module=module))
+        print(f"{module:<14} | {seconds:>10.3f} | {rss_mb:>13.1f}")
+
+    if not args.skip_warm_up:
+        seconds, rss_mb = _run(_WARM_UP_SNIPPET)
+        print("-" * 60)
+        print(f"{'warm_up()':<14} | {seconds:>10.3f} | {rss_mb:>13.1f}")
@@ -0,0 +1,119 @@
+"""
+Cold-start and memory benchmark for the memory storage formats.
+
+Builds a partition of synthetic memories in each format ("json" and
+"compact"), then opens it in a fresh process and reports load time, first
+search latency and resident memory (anonymous vs file-backed pages).
+
+Run: PYTHONPATH=. python benchmark_storage.py [--memories 100000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+CATEGORIES = ["personal", "preference", "health", "work", "mood"]
+
+
+def _rss() -> dict:
+    """Resident memory in MiB, from /proc (Linux only)."""
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                fields[key] = int(value.split()[0]) / 1024
+    return fields
+
+
+def build(directory: str, storage: str, n: int):
+    from app import memory
+
+    memory.STORAGE = storage
+    partition = memory.open_partition(directory, "benchmark")
+
+    # Filled directly rather than via add_many(): its duplicate check would
+    # make building 100k memories quadratic, and only loading is measured.
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((n, memory.dimension)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    partition.index.add_with_ids(vectors, np.arange(n, dtype="int64"))
+    for i in range(n):
+        partition.records[i] = {
+            "id": i,
+            "text": f"user mentioned fact number {i} about their week",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "created_at": time.time(),
+        }
+    partition.next_id = n
+    partition._needs_snapshot = True
+    partition.snapshot()
+
+
+def measure(directory: str, storage: str):
+    """Runs in a child process so RSS reflects only this store."""
+    from app import memory
+
+    memory.STORAGE = storage
+
+    baseline = _rss()
+    started = time.perf_counter()
+    partition = memory.open_partition(directory, "benchmark")
+    load = time.perf_counter() - started
+
+    query = np.random.default_rng(1).standard_normal((1, memory.dimension)).astype("float32")
+    started = time.perf_counter()
+    partition.search(query, 3)
+    first_search = time.perf_counter() - started
+
+    after = _rss()
+    print(json.dumps({
+        "load_s": load,
+        "first_search_ms": first_search * 1000,
+        **{key: after[key] - baseline.get(key, 0) for key in after},
+    }))
+
+
+def run_benchmark(n: int):
+    root = tempfile.mkdtemp(prefix="carebot-storage-")
+    print(f"{'format':>8} | {'disk MiB':>8} | {'load s':>7} | {'1st search ms':>13} | {'RSS MiB':>8} | {'anon':>7} | {'file':>7}")
+    print("-" * 78)
+    for storage in ("json", "compact"):
+        directory = os.path.join(root, storage)
+        build(directory, storage, n)
+        disk = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+        out = subprocess.run(
+            [sys.executable, __file__, "--measure", directory, "--storage", storage],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(
+            f"{storage:>8} | {disk / 2**20:>8.1f} | {result['load_s']:>7.2f} | "
+            f"{result['first_search_ms']:>13.1f} | {result['VmRSS']:>8.1f} | "
+            f"{result.get('RssAnon', 0):>7.1f} | {result.get('RssFile', 0):>7.1f}"
+        )
+
+    print("\nRSS is the growth after loading one partition and running one search.")
+    print("File-backed pages of a mapped index are shared between worker processes")
+    print("and can be dropped by the kernel under memory pressure; anonymous pages cannot.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--memories", type=int, default=100_000)
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    parser.add_argument("--storage", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.storage)
+    else:
+        print("🧪 Memory Storage Benchmark")
+        print("=" * 60)
+        run_benchmark(args.memories)
@@ -1,10 +1,47 @@
+import os
+
+# Ollama backends, comma-separated. With more than one, completions are
+# balanced across them and fail over between them (app/llm.py).
+OLLAMA_BASE_URLS = [
+    url.strip()
+    for url in os.getenv("OLLAMA_BASE_URLS", os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")).split(",")
+    if url.strip()
+]
+
 config_list = [
     {
         "model": "llama3",
         "api_type": "ollama",
-        "base_url": "http://localhost:11434",
+        "base_url": base_url,
         # Slight temperature > 0 for more varied, less robotic replies.
         # Ollama's OpenAI-compatible API forwards this to the model.
         "temperature": 0.7,
     }
+    for base_url in OLLAMA_BASE_URLS
 ]
+
+# Optional smaller model for the memory extractor (e.g. "llama3.2:1b"); it
+# must be pulled on every backend. Empty means the same model as CareBot.
+MEMORY_EXTRACTOR_MODEL = os.getenv("MEMORY_EXTRACTOR_MODEL", "")
+
+# Concurrency limits for the LLM execution layer (app/llm.py).
+# At most LLM_MAX_IN_FLIGHT completions run against one Ollama backend at a
+# time; further requests wait in a queue of up to LLM_MAX_QUEUE entries and
+# are rejected beyond that.
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+
+# Optional per-backend override of LLM_MAX_IN_FLIGHT, keyed by base_url.
+BACKEND_MAX_IN_FLIGHT = {
+    # "http://gpu-box:11434": 8,
+}
+
+# Backend health (app/llm.py). A backend that fails LLM_FAILURE_THRESHOLD
+# requests in a row, or a health probe, is taken out of rotation for
+# LLM_CIRCUIT_COOLDOWN seconds and then gets a trial request. A failed
+# request is retried on up to LLM_RETRIES other backends.
+LLM_HEALTH_INTERVAL = float(os.getenv("LLM_HEALTH_INTERVAL", "10"))
+LLM_HEALTH_TIMEOUT = float(os.getenv("LLM_HEALTH_TIMEOUT", "2"))
+LLM_FAILURE_THRESHOLD = int(os.getenv("LLM_FAILURE_THRESHOLD", "3"))
+LLM_CIRCUIT_COOLDOWN = float(os.getenv("LLM_CIRCUIT_COOLDOWN", "30"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "1"))
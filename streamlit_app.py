@@ -1,9 +1,10 @@
 import asyncio
+import uuid
 from typing import List, Dict
 
 import streamlit as st
 
-from app.main import run_agent
+from app.main import extraction_queue, run_agent, session_store, summarizer
 
 
 st.set_page_config(
@@ -18,11 +19,34 @@ def _init_session_state() -> None:
     if "messages" not in st.session_state:
         # Each message: {"role": "user" | "assistant", "content": str}
         st.session_state.messages: List[Dict[str, str]] = []
+    if "session_id" not in st.session_state:
+        # Each browser tab gets its own short- and long-term memory.
+        st.session_state.session_id = uuid.uuid4().hex
 
 
 _init_session_state()
 
 
+def _run_turn(user_input: str, render) -> str:
+    """
+    Run one agent turn, hand the reply to `render`, then flush its
+    background memory extraction and summary update.
+
+    Each Streamlit rerun uses a fresh event loop, so queued extractions and
+    summaries would be lost when it closes unless we drain them here. The
+    drains run after `render` so the user does not wait for their LLM calls.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        reply = loop.run_until_complete(run_agent(user_input, st.session_state.session_id))
+        render(reply)
+        loop.run_until_complete(extraction_queue.drain())
+        loop.run_until_complete(summarizer.drain())
+    finally:
+        loop.close()
+    return reply
+
+
 st.title("🧠 CareBot (Streamlit UI)")
 st.caption(
     "Empathetic local assistant powered by Ollama + AutoGen, with FAISS memory and safety routing."
@@ -35,6 +59,7 @@ with col_right:
 
     if st.button("🧹 Clear conversation"):
         st.session_state.messages = []
+        session_store.clear(st.session_state.session_id)
         st.experimental_rerun()
 
     st.markdown("### Tips")
@@ -71,17 +96,12 @@ with col_left:
             thinking_placeholder = st.empty()
             thinking_placeholder.markdown("_Thinking..._")
 
+            def _render(text: str) -> None:
+                thinking_placeholder.empty()
+                st.markdown(text)
+
             # Call the async agent from Streamlit
-            try:
-                reply = asyncio.run(run_agent(user_input))
-            except RuntimeError:
-                # In case an event loop is already running (e.g. future Streamlit versions),
-                # fall back to creating a task on the existing loop.
-                loop = asyncio.get_event_loop()
-                reply = loop.run_until_complete(run_agent(user_input))
-
-            thinking_placeholder.empty()
-            st.markdown(reply)
+            reply = _run_turn(user_input, _render)
 
         st.session_state.messages.append(
             {"role": "assistant", "content": reply}
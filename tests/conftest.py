@@ -0,0 +1,60 @@
+import zlib
+
+import numpy as np
+import pytest
+
+from app import memory
+from app.embedding_cache import EmbeddingCache
+from app.embedding_service import EmbeddingBatcher
+from app.retrieval_cache import RetrievalCache
+
+
+class CountingEmbedder:
+    """Deterministic fake embedder that records each model call."""
+
+    def __init__(self):
+        self.calls = []
+
+    @property
+    def encoded(self):
+        """Every text encoded so far, in order."""
+        return [text for call in self.calls for text in call]
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        return np.vstack([
+            np.random.default_rng(zlib.crc32(text.encode("utf-8"))).random(memory.dimension)
+            for text in texts
+        ]).astype("float32")
+
+
+@pytest.fixture
+def embedder():
+    return CountingEmbedder()
+
+
+@pytest.fixture
+def memory_env(tmp_path, monkeypatch, embedder):
+    """
+    Run app.memory from tmp_path with no loaded partitions, empty caches
+    and the counting embedder instead of the model. Returns the embedder.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(memory, "_partitions", {})
+    monkeypatch.setattr(memory, "service_client", None)
+    monkeypatch.setattr(memory, "embedder", embedder)
+    monkeypatch.setattr(memory, "embedding_cache", EmbeddingCache("test", max_size=0))
+    monkeypatch.setattr(memory, "embedding_batcher", EmbeddingBatcher(embedder.encode))
+    monkeypatch.setattr(memory, "retrieval_cache", RetrievalCache())
+    return embedder
+
+
+@pytest.fixture
+def reload_partition():
+    """Drop a session's in-process partition so the next access replays it from disk."""
+
+    def reload(session_id):
+        memory._partitions.pop(session_id, None)
+        return memory.get_partition(session_id)
+
+    return reload
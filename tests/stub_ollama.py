@@ -0,0 +1,266 @@
+"""
+Ollama-compatible stub server for load tests and multi-backend tests.
+
+Implements the parts of the Ollama HTTP API the app uses (`POST /api/chat`,
+streamed or not, plus `GET /api/tags` and `/api/version` for health checks)
+and replies with filler text at a configurable token rate, after a
+configurable time-to-first-token. Only the standard library is used, and
+the server runs on its own thread so it can sit next to the app under test.
+
+Standalone: PYTHONPATH=. python -m tests.stub_ollama --port 11434 --token-rate 30
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from typing import Optional
+
+FILLER = (
+    "That sounds like a lot to carry right now. It might help to pick one small "
+    "step for today, like a short walk or writing down what is on your mind. "
+    "What feels most manageable for you at the moment?"
+).split()
+
+
+class StubOllama:
+    """
+    A fake Ollama backend.
+
+    `token_rate` is tokens per second once generation starts, `latency` the
+    delay before the first token (queueing + prompt processing), and
+    `tokens` the length of every reply. `fail` makes every chat request
+    return HTTP 500, for failover tests. Counters record what was served.
+
+    Like Ollama, the stub only "evaluates" the part of a prompt after the
+    longest message prefix it saw recently, and reports that as
+    `prompt_eval_count`; with `prefill_rate` (tokens per second) that
+    prefill also adds latency.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        token_rate: float = 50.0,
+        latency: float = 0.2,
+        tokens: int = 40,
+        model: str = "llama3",
+        prefill_rate: float = 0.0,
+        cache_slots: int = 16,
+    ):
+        self.host = host
+        self.port = port
+        self.token_rate = token_rate
+        self.latency = latency
+        self.tokens = tokens
+        self.model = model
+        self.prefill_rate = prefill_rate
+        self.cache_slots = cache_slots
+        self.fail = False
+        # Recent prompts, standing in for Ollama's KV cache slots.
+        self._prompts = []
+
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.cancelled = 0
+        self.tokens_sent = 0
+        self.prompt_tokens = 0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+        self._writers = set()
+        self._started = threading.Event()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self) -> "StubOllama":
+        self._thread = threading.Thread(target=self._run, name=f"stub-ollama-{self.port}", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def stop(self) -> None:
+        if self._loop is not None and self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=5)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    async def _shutdown(self) -> None:
+        self._server.close()
+        # Closing the sockets ends every handler (idle keep-alive ones too).
+        for writer in list(self._writers):
+            writer.transport.abort()
+        await self._server.wait_closed()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, self.host, self.port)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1").strip()
+                    if not line:
+                        break
+                    key, _, value = line.partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", "0"))
+                body = json.loads(await reader.readexactly(length)) if length else {}
+
+                if path == "/api/chat" and method == "POST":
+                    await self._chat(body, writer)
+                elif path in ("/api/tags", "/api/version", "/"):
+                    self._respond(writer, 200, {"models": [{"name": self.model}], "version": "stub"})
+                else:
+                    self._respond(writer, 404, {"error": "not found"})
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _respond(self, writer, status: int, payload: dict) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode("latin-1")
+            + data
+        )
+
+    def _chunk(self, writer, payload: dict) -> None:
+        data = json.dumps(payload).encode("utf-8") + b"\n"
+        writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+
+    async def _chat(self, body: dict, writer: asyncio.StreamWriter) -> None:
+        self.requests += 1
+        if self.fail:
+            self._respond(writer, 500, {"error": "stub backend failure"})
+            return
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        words = [FILLER[i % len(FILLER)] for i in range(self.tokens)]
+        prompt_tokens = self._prefill(body.get("messages", []))
+        prefill = prompt_tokens / self.prefill_rate if self.prefill_rate else 0.0
+        try:
+            await asyncio.sleep(self.latency + prefill)
+
+            if not body.get("stream", True):
+                await asyncio.sleep(len(words) / self.token_rate)
+                self.tokens_sent += len(words)
+                self._respond(writer, 200, self._message(" ".join(words), True, prompt_tokens, prefill))
+                return
+
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                b"Transfer-Encoding: chunked\r\n\r\n"
+            )
+            for i, word in enumerate(words):
+                self._chunk(writer, self._message(word if i == 0 else " " + word, done=False))
+                await writer.drain()
+                self.tokens_sent += 1
+                await asyncio.sleep(1 / self.token_rate)
+            self._chunk(writer, self._message("", True, prompt_tokens, prefill))
+            writer.write(b"0\r\n\r\n")
+        except ConnectionError:
+            # The client went away mid-stream (e.g. a cancelled request).
+            self.cancelled += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def _prefill(self, messages) -> int:
+        """Rough token count of the prompt part not covered by a cached prefix."""
+        prompt = [json.dumps(message, sort_keys=True) for message in messages]
+        shared = 0
+        for cached in self._prompts:
+            n = 0
+            while n < min(len(cached), len(prompt)) and cached[n] == prompt[n]:
+                n += 1
+            shared = max(shared, n)
+        self._prompts = [prompt, *self._prompts][:self.cache_slots]
+        tokens = sum(len(message.get("content") or "") // 4 + 4 for message in messages[shared:])
+        self.prompt_tokens += tokens
+        return tokens
+
+    def _message(self, content: str, done: bool, prompt_tokens: int = 0, prefill: float = 0.0) -> dict:
+        message = {
+            "model": self.model,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "message": {"role": "assistant", "content": content},
+            "done": done,
+        }
+        if done:
+            message.update({
+                "done_reason": "stop",
+                "eval_count": self.tokens,
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(prefill * 1e9),
+            })
+        return message
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "max_in_flight": self.max_in_flight,
+            "tokens_sent": self.tokens_sent,
+            "prompt_tokens": self.prompt_tokens,
+            "cancelled": self.cancelled,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--token-rate", type=float, default=50.0)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--prefill-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub = StubOllama(
+        port=args.port, token_rate=args.token_rate, latency=args.latency,
+        tokens=args.tokens, prefill_rate=args.prefill_rate,
+    )
+    stub.start()
+    print(f"Stub Ollama on {stub.base_url}")
+    try:
+        stub._thread.join()
+    except KeyboardInterrupt:
+        stub.stop()
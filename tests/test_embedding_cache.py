@@ -0,0 +1,52 @@
+import numpy as np
+
+from app import memory
+from app.embedding_cache import EmbeddingCache
+
+
+def test_repeated_text_is_encoded_once(embedder):
+    """Test that identical (after normalization) texts hit the cache."""
+    cache = EmbeddingCache("test-model")
+
+    first = cache.encode(embedder, ["User likes tea"])
+    second = cache.encode(embedder, ["  user   LIKES tea "])
+
+    assert embedder.encoded == ["User likes tea"], "Normalized duplicates should not be re-encoded"
+    assert np.array_equal(first, second)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_misses_are_batched(embedder):
+    """Test that only cache misses reach the model, in one batch."""
+    cache = EmbeddingCache("test-model")
+    cache.encode(embedder, ["a"])
+
+    vectors = cache.encode(embedder, ["a", "b", "c"])
+
+    assert embedder.encoded == ["a", "b", "c"], "Only the misses b and c should be encoded, together"
+    assert vectors.shape == (3, memory.dimension)
+
+
+def test_lru_eviction(embedder):
+    """Test that the least recently used entry is evicted at capacity."""
+    cache = EmbeddingCache("test-model", max_size=2)
+
+    cache.encode(embedder, ["one", "two"])
+    cache.encode(embedder, ["one"])          # refresh "one"
+    cache.encode(embedder, ["three"])        # evicts "two"
+
+    assert cache.get("two") is None
+    assert cache.get("one") is not None
+    assert cache.stats()["size"] == 2
+
+
+def test_disk_tier_survives_restart(tmp_path, embedder):
+    """Test that the optional SQLite tier serves vectors to a fresh cache."""
+    path = str(tmp_path / "embeddings.db")
+
+    EmbeddingCache("test-model", disk_path=path).encode(embedder, ["persisted text"])
+    restarted = EmbeddingCache("test-model", disk_path=path)
+    restarted.encode(embedder, ["persisted text"])
+
+    assert embedder.encoded == ["persisted text"], "Disk tier should avoid re-encoding"
+    assert restarted.stats()["disk_hits"] == 1
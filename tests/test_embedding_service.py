@@ -0,0 +1,60 @@
+import asyncio
+
+import numpy as np
+
+from app.embedding_service import EmbeddingBatcher
+
+
+class BatchRecorder:
+    """Fake encode function that records the size of every batch."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, texts):
+        self.batch_sizes.append(len(texts))
+        return np.array([[float(len(t))] for t in texts], dtype="float32")
+
+
+def test_concurrent_requests_share_one_batch():
+    """Test that concurrent callers are encoded in a single model call."""
+    recorder = BatchRecorder()
+    batcher = EmbeddingBatcher(recorder, max_batch=32, max_wait=0.05)
+
+    async def run():
+        return await asyncio.gather(*[batcher.encode("x" * n) for n in range(1, 11)])
+
+    vectors = asyncio.run(run())
+
+    assert recorder.batch_sizes == [10], "All ten requests should form one batch"
+    assert [float(v[0]) for v in vectors] == [float(n) for n in range(1, 11)], "Each caller gets its own vector"
+
+
+def test_max_batch_flushes_early():
+    """Test that a full batch is encoded without waiting for max_wait."""
+    recorder = BatchRecorder()
+    batcher = EmbeddingBatcher(recorder, max_batch=4, max_wait=10)
+
+    async def run():
+        return await asyncio.wait_for(
+            asyncio.gather(*[batcher.encode(str(n)) for n in range(8)]), timeout=2
+        )
+
+    asyncio.run(run())
+
+    assert recorder.batch_sizes == [4, 4]
+
+
+def test_encode_errors_reach_every_caller():
+    """Test that a failing model call fails each waiting future."""
+    def broken(texts):
+        raise RuntimeError("model crashed")
+
+    batcher = EmbeddingBatcher(broken, max_wait=0.01)
+
+    async def run():
+        return await asyncio.gather(batcher.encode("a"), batcher.encode("b"), return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(r, RuntimeError) for r in results)
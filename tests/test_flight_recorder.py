@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from app import main
+from app.flight_recorder import FlightRecorder
+from config.llm_config import config_list
+from tests.stub_ollama import StubOllama
+
+
+def _run_turn(monkeypatch, recorder, stub, session_id):
+    monkeypatch.setattr(main, "recorder", recorder)
+    monkeypatch.setattr(main.extraction_queue, "submit", lambda *args: True)
+    monkeypatch.setitem(config_list[0], "base_url", stub.base_url)
+
+    async def collect():
+        return [frame async for frame in main.run_agent_stream("I started a new job", session_id)]
+
+    return asyncio.run(collect())
+
+
+def test_disabled_recorder_keeps_nothing(tmp_path, monkeypatch):
+    """Test that the recorder is a no-op unless enabled."""
+    monkeypatch.chdir(tmp_path)
+    recorder = FlightRecorder(enabled=False)
+
+    with StubOllama(token_rate=1000, latency=0.01, tokens=3) as stub:
+        _run_turn(monkeypatch, recorder, stub, "recorder-off")
+
+    assert recorder.recent() == [] and recorder.stats()["recorded"] == 0
+
+
+def test_slow_turn_is_dumped_with_spans_and_profile(tmp_path, monkeypatch):
+    """Test that a turn over the threshold keeps its spans, sizes and profile."""
+    monkeypatch.chdir(tmp_path)
+    recorder = FlightRecorder(enabled=True, slow_seconds=0.1, profile_rate=1.0, dump_dir=str(tmp_path / "traces"))
+
+    with StubOllama(token_rate=100, latency=0.15, tokens=5) as stub:
+        frames = _run_turn(monkeypatch, recorder, stub, "recorder-slow")
+
+    assert frames[-1]["type"] == "final"
+    [trace] = recorder.slow()
+    assert trace["kind"] == "run_agent_stream" and trace["model"] == config_list[0]["model"]
+    assert trace["duration_ms"] >= 150
+    assert trace["retrieved_memories"] == 0 and trace["prompt_messages"] == 2
+    assert {"route", "build_context", "llm", "finalize"} <= {span["name"] for span in trace["spans"]}
+    assert trace["profile"]["samples"] + trace["profile"]["idle_samples"] > 0, "The turn should have been sampled"
+
+    [dump] = (tmp_path / "traces").iterdir()
+    assert json.loads(dump.read_text())["id"] == trace["id"]
+    assert recorder.get(trace["id"])["spans"] == trace["spans"]
+    assert "spans" not in recorder.recent()[0], "Recent traces are summaries"
+
+
+def test_admin_endpoint_serves_traces(monkeypatch):
+    """Test the admin endpoints and their token."""
+    from web import server
+
+    recorder = FlightRecorder(enabled=True, slow_seconds=0)
+    with recorder.record("run_agent", "admin-test", "llama3"):
+        pass
+    monkeypatch.setattr(server, "recorder", recorder)
+    client = TestClient(server.app)
+
+    monkeypatch.setattr(server, "ADMIN_TOKEN", "")
+    assert client.get("/admin/traces").status_code == 403, "Without a token the endpoints stay closed"
+
+    monkeypatch.setattr(server, "ADMIN_TOKEN", "secret")
+
+    assert client.get("/admin/traces/slow").status_code == 403
+    slow = client.get("/admin/traces/slow", headers={"X-Admin-Token": "secret"}).json()["traces"]
+    assert [trace["session_id"] for trace in slow] == ["admin-test"]
+    assert client.get(f"/admin/traces/{slow[0]['id']}", headers={"X-Admin-Token": "secret"}).status_code == 200
@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+
+from app.llm import LLMExecutor, LLMQueueFull
+from app.metrics import LLM_TOKENS
+
+CONFIG = {"model": "llama3", "base_url": "http://stub:11434"}
+
+
+class SlowAgent:
+    """Stand-in for a ConversableAgent whose generate_reply blocks."""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def generate_reply(self, messages):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return messages[-1]["content"]
+
+
+def test_generate_respects_max_in_flight():
+    """Test that no more than max_in_flight completions run at once per backend."""
+    executor = LLMExecutor(max_in_flight=2, max_queue=10)
+    agent = SlowAgent()
+
+    async def run_many():
+        return await asyncio.gather(*[
+            executor.generate(agent, [{"role": "user", "content": str(i)}], CONFIG)
+            for i in range(6)
+        ])
+
+    replies = asyncio.run(run_many())
+
+    assert replies == [str(i) for i in range(6)], "Every request should get its own reply"
+    assert agent.peak == 2, "Concurrency should be capped at max_in_flight"
+
+
+def test_generate_does_not_block_event_loop():
+    """Test that a slow blocking completion leaves the event loop free."""
+    executor = LLMExecutor(max_in_flight=1, max_queue=10)
+    agent = SlowAgent(delay=0.2)
+
+    async def check():
+        task = asyncio.create_task(
+            executor.generate(agent, [{"role": "user", "content": "hi"}], CONFIG)
+        )
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        tick = time.perf_counter() - started
+        await task
+        return tick
+
+    assert asyncio.run(check()) < 0.1, "Event loop should keep running during a completion"
+
+
+def test_full_queue_is_rejected():
+    """Test that requests beyond max_queue fail fast instead of waiting."""
+    executor = LLMExecutor(max_in_flight=1, max_queue=1)
+    agent = SlowAgent(delay=0.1)
+
+    async def overload():
+        return await asyncio.gather(*[
+            executor.generate(agent, [{"role": "user", "content": str(i)}], CONFIG)
+            for i in range(3)
+        ], return_exceptions=True)
+
+    results = asyncio.run(overload())
+
+    assert sum(isinstance(r, LLMQueueFull) for r in results) == 1, "Only the overflow request should be rejected"
+    assert executor.stats()[CONFIG["base_url"]]["in_flight"] == 0
+
+
+def test_cancelled_caller_keeps_the_slot_until_the_thread_is_done():
+    """Test that cancelling a generate() does not let more requests reach the backend."""
+    executor = LLMExecutor(max_in_flight=1, max_queue=10)
+    agent = SlowAgent(delay=0.2)
+
+    async def cancel_then_generate():
+        first = asyncio.create_task(
+            executor.generate(agent, [{"role": "user", "content": "first"}], CONFIG)
+        )
+        await asyncio.sleep(0.05)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        in_flight = executor.stats()[CONFIG["base_url"]]["in_flight"]
+        reply = await executor.generate(agent, [{"role": "user", "content": "second"}], CONFIG)
+        return in_flight, reply
+
+    in_flight, reply = asyncio.run(cancel_then_generate())
+
+    assert in_flight == 1, "The slot belongs to the thread still running the cancelled call"
+    assert reply == "second"
+    assert agent.peak == 1, "The cancelled and the new completion must not overlap"
+
+
+class UsageAgent:
+    """Stand-in for a ConversableAgent whose client sums usage like AutoGen's."""
+
+    name = "UsageTestBot"
+
+    def __init__(self):
+        self.client = type("Client", (), {"actual_usage_summary": None})()
+
+    def generate_reply(self, messages):
+        usage = self.client.actual_usage_summary or {"total_cost": 0}
+        entry = usage.get("llama3", {"prompt_tokens": 0, "completion_tokens": 0})
+        usage["llama3"] = {
+            "prompt_tokens": entry["prompt_tokens"] + 10,
+            "completion_tokens": entry["completion_tokens"] + 3,
+        }
+        self.client.actual_usage_summary = usage
+        return "ok"
+
+
+def test_blocking_completions_record_tokens_per_agent():
+    """Test that generate() counts each completion's tokens once, under the agent's name."""
+    executor = LLMExecutor(max_in_flight=2, max_queue=10)
+    agent = UsageAgent()
+    prompt = LLM_TOKENS.value(kind="prompt", agent=agent.name)
+    completion = LLM_TOKENS.value(kind="completion", agent=agent.name)
+
+    async def run_many():
+        for _ in range(3):
+            await executor.generate(agent, [{"role": "user", "content": "hi"}], CONFIG)
+
+    asyncio.run(run_many())
+
+    assert LLM_TOKENS.value(kind="prompt", agent=agent.name) == prompt + 30, "Usage totals must not be counted twice"
+    assert LLM_TOKENS.value(kind="completion", agent=agent.name) == completion + 9
@@ -0,0 +1,118 @@
+import asyncio
+from contextlib import ExitStack
+
+from app.llm import CircuitBreaker, LLMExecutor
+from app.metrics import LLM_FAILOVERS
+from tests.stub_ollama import StubOllama
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def _stubs(stack, count, **kwargs):
+    return [stack.enter_context(StubOllama(token_rate=1000, latency=0.05, tokens=3, **kwargs)) for _ in range(count)]
+
+
+def _stream_all(executor, config, count):
+    async def one():
+        return "".join([token async for token in executor.stream("system", MESSAGES, config)])
+
+    async def many():
+        return await asyncio.gather(*(one() for _ in range(count)))
+
+    return asyncio.run(many())
+
+
+def test_requests_spread_over_least_loaded_backends():
+    """Test that concurrent streams are balanced across the pool."""
+    with ExitStack() as stack:
+        stubs = _stubs(stack, 3)
+        urls = [stub.base_url for stub in stubs]
+        executor = LLMExecutor(max_in_flight=2, max_queue=10, backends=urls)
+
+        replies = _stream_all(executor, {"model": "llama3", "base_url": urls[0]}, 6)
+
+    assert all(replies), "Every stream should produce text"
+    assert [stub.stats()["requests"] for stub in stubs] == [2, 2, 2]
+    assert all(stub.stats()["max_in_flight"] <= 2 for stub in stubs)
+
+
+def test_failing_backend_is_retried_elsewhere_and_taken_out():
+    """Test failover before the first token and the circuit opening."""
+    with ExitStack() as stack:
+        bad, good = _stubs(stack, 2)
+        bad.fail = True
+        executor = LLMExecutor(backends=[bad.base_url, good.base_url], failure_threshold=2, cooldown=60)
+        failovers = LLM_FAILOVERS.value(backend=bad.base_url)
+
+        async def sequential():
+            return [
+                "".join([token async for token in executor.stream("system", MESSAGES, {"model": "llama3", "base_url": bad.base_url})])
+                for _ in range(6)
+            ]
+
+        replies = asyncio.run(sequential())
+
+    assert all(replies), "The healthy backend should answer every request"
+    assert bad.stats()["requests"] == 2, "The failing backend should stop getting traffic once its circuit opens"
+    assert executor.stats()[bad.base_url]["circuit"] == "open"
+    assert LLM_FAILOVERS.value(backend=bad.base_url) == failovers + 2
+
+
+def test_health_probe_takes_unreachable_backend_out():
+    """Test that a stopped backend is skipped after one probe."""
+    with ExitStack() as stack:
+        down, up = _stubs(stack, 2)
+        urls = [down.base_url, up.base_url]
+        down.stop()
+        executor = LLMExecutor(backends=urls)
+
+        async def probe_then_stream():
+            health = await executor.check_health(timeout=1)
+            tokens = [token async for token in executor.stream("system", MESSAGES, {"model": "llama3", "base_url": urls[0]})]
+            return health, tokens
+
+        health, tokens = asyncio.run(probe_then_stream())
+
+    assert health == {down.base_url: False, up.base_url: True}
+    assert tokens and up.stats()["requests"] == 1
+    assert executor.stats()[down.base_url]["circuit"] == "open"
+
+
+def test_generate_builds_the_agent_for_the_chosen_backend():
+    """Test that a factory agent follows the routing and fails over."""
+    urls = ["http://a:11434", "http://b:11434"]
+    built = []
+
+    class Agent:
+        def __init__(self, config):
+            self.config = config
+
+        def generate_reply(self, messages):
+            if self.config["base_url"] == urls[0]:
+                raise ConnectionError("backend down")
+            return f"{self.config['model']} via {self.config['base_url']}"
+
+    def factory(config):
+        built.append(config["base_url"])
+        return Agent(config)
+
+    executor = LLMExecutor(backends=urls)
+    executor._rotation = iter([0])      # try "a" first
+
+    reply = asyncio.run(executor.generate(factory, MESSAGES, {"model": "small", "base_url": urls[0]}))
+
+    assert reply == "small via http://b:11434"
+    assert built == urls
+
+
+def test_probe_success_never_closes_an_open_circuit():
+    """Test that a reachable backend still has to pass a trial request."""
+    breaker = CircuitBreaker(threshold=1, cooldown=60)
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    breaker.record_probe(True)
+
+    assert breaker.state == "half_open" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open", "A failed trial should re-open the circuit"
@@ -0,0 +1,198 @@
+import io
+import json
+import time
+
+import numpy as np
+
+from app import memory
+from app.memory import export_memories, get_partition, save_memories
+
+
+def test_add_many_skips_stored_and_repeated_entries(memory_env):
+    """Test that one batch dedupes against the index and within itself."""
+    partition = get_partition("test-bulk-dedupe")
+
+    rng = np.random.default_rng(0)
+    vectors = rng.random((4, memory.dimension)).astype("float32")
+    assert partition.add("user likes tea", "preference", vectors[:1])
+
+    saved = partition.add_many(
+        ["user likes tea", "user has a cat", "user has a cat", "user likes tea"],
+        ["preference", "personal", "personal", "general"],
+        np.vstack([vectors[0], vectors[1], vectors[1], vectors[0]]),
+    )
+
+    assert saved == 2, "Only the new cat fact and the re-categorised tea fact are new"
+    assert partition.index.ntotal == 3
+    with open(partition.log_file) as f:
+        assert len(f.readlines()) == 3, "A batch is written as one log append"
+
+
+def test_save_memories_streams_in_chunks(memory_env):
+    """Test that bulk saves encode once per chunk and persist a snapshot."""
+    fake = memory_env
+    session = "test-bulk-chunks"
+
+    items = ({"text": f"fact number {i}", "category": "general"} for i in range(10))
+    counts = save_memories(items, session_id=session, chunk_size=4)
+
+    assert counts == {"saved": 10, "skipped": 0}
+    assert [len(call) for call in fake.calls] == [4, 4, 2], "Each chunk should be a single batched encode"
+
+    partition = get_partition(session)
+    assert not partition.dirty, "Bulk import should end with a snapshot"
+    assert save_memories(["fact number 3"], session_id=session) == {"saved": 0, "skipped": 1}, \
+        "Re-importing a stored fact (plain strings are 'general') should be skipped"
+
+
+def test_export_round_trips_through_import(memory_env, monkeypatch):
+    """Test that an export can be re-imported into a fresh store unchanged."""
+    save_memories([{"text": "user lives in Pune", "category": "personal"}], session_id="alice")
+    save_memories(["user runs on Sundays"], session_id="bob")
+
+    out = io.StringIO()
+    assert export_memories(out) == 2
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert {(l["session_id"], l["text"], l["category"]) for l in lines} == {
+        ("alice", "user lives in Pune", "personal"),
+        ("bob", "user runs on Sundays", "general"),
+    }, "Export must keep each memory's session and category"
+
+    monkeypatch.setattr(memory, "_partitions", {})
+    memory.clear_memory()
+    for line in lines:
+        save_memories([line], session_id=line["session_id"])
+    assert [r["text"] for r in get_partition("alice").records.values()] == ["user lives in Pune"]
+
+
+def _near(vector, scale=0.01, seed=1):
+    noise = np.random.default_rng(seed).normal(0, scale, vector.shape).astype("float32")
+    return (vector + noise).astype("float32")
+
+
+def test_compaction_merges_paraphrases_per_category(memory_env, reload_partition):
+    """Test that near-duplicates collapse to the newest memory of each category."""
+    session = "test-compaction"
+    partition = get_partition(session)
+
+    base = np.random.default_rng(2).random((2, memory.dimension)).astype("float32")
+    partition.add_many(
+        ["user has a dog", "user owns a dog", "user has a pet dog", "user has a dog", "user likes jazz"],
+        ["personal", "personal", "personal", "preference", "preference"],
+        np.vstack([base[0], _near(base[0]), _near(base[0], seed=2), base[0], base[1]]),
+    )
+
+    assert partition.compact() == 2
+    assert sorted((r["text"], r["category"]) for r in partition.records.values()) == [
+        ("user has a dog", "preference"),
+        ("user has a pet dog", "personal"),
+        ("user likes jazz", "preference"),
+    ], "Only same-category paraphrases should merge, keeping the newest wording"
+    assert partition.index.ntotal == 3 and not partition.dirty
+
+    partition = reload_partition(session)
+    assert len(partition.records) == 3, "Compaction must survive a restart"
+
+
+def test_removal_is_replayed_from_log(memory_env, reload_partition):
+    """Test that a logged removal is reapplied when the snapshot is older."""
+    session = "test-remove-replay"
+    save_memories(["user is 30", "user lives in Goa"], session_id=session)
+
+    partition = get_partition(session)
+    partition.remove_ids([0])
+    assert partition.dirty, "Removal should be logged, not snapshotted yet"
+
+    partition = reload_partition(session)
+    assert [r["text"] for r in partition.records.values()] == ["user lives in Goa"]
+    assert partition.index.ntotal == 1
+
+
+def test_capacity_evicts_least_recently_retrieved(memory_env):
+    """Test that a full partition drops the memory retrieved longest ago."""
+    partition = get_partition("test-evict-capacity")
+    partition.max_memories = 2
+
+    vectors = np.random.default_rng(3).random((3, memory.dimension)).astype("float32")
+    partition.add_many(["user is a nurse", "user has twins"], ["personal", "personal"], vectors[:2])
+    partition.records[0]["created_at"] -= 10
+    partition.records[1]["created_at"] -= 5
+    partition.retrieve(vectors[:1], 1)  # the oldest memory is still in use
+
+    assert partition.add("user likes hiking", "preference", vectors[2:])
+    assert sorted(r["text"] for r in partition.records.values()) == ["user is a nurse", "user likes hiking"]
+    assert partition.index.ntotal == 2 and partition.evicted == 1
+
+
+def test_category_ttl_expires_old_memories(memory_env):
+    """Test that memories outlive their category TTL only if the TTL allows."""
+    partition = get_partition("test-evict-ttl")
+    partition.category_ttl = {"mood": 3600}
+
+    vectors = np.random.default_rng(4).random((2, memory.dimension)).astype("float32")
+    partition.add_many(["user feels tired", "user is a teacher"], ["mood", "personal"], vectors)
+
+    assert partition.evict(now=time.time() + 60) == 0
+    assert partition.evict(now=time.time() + 7200) == 1
+    assert [r["text"] for r in partition.records.values()] == ["user is a teacher"]
+
+
+def test_idle_and_excess_partitions_are_unloaded(memory_env, monkeypatch):
+    """Test that snapshotted partitions leave RAM when idle or beyond the LRU limit."""
+    monkeypatch.setattr(memory, "MAX_LOADED_PARTITIONS", 2)
+    save_memories(["user likes tea"], session_id="first")   # snapshotted
+    get_partition("second").add("user likes jazz", "preference", memory._encode("user likes jazz"))
+
+    get_partition("third")
+    assert list(memory._partitions) == ["second", "third"], "The least recently used clean partition goes first"
+
+    assert memory.unload_partitions(now=time.monotonic() + memory.PARTITION_IDLE + 1) == 1
+    assert list(memory._partitions) == ["second"], "A partition with unsnapshotted writes stays loaded"
+
+    assert [r["text"] for r in get_partition("first").records.values()] == ["user likes tea"]
+
+
+def test_retrieval_times_never_rewrite_the_snapshot(tmp_path, memory_env, reload_partition):
+    """Test that reads log access times only with a capacity, and never force a snapshot."""
+    session = "test-touch-log"
+    save_memories(["user is a nurse", "user has twins"], session_id=session)
+    partition = get_partition(session)
+    vector = memory._encode("user is a nurse")
+
+    partition.retrieve(vector, 1)
+    partition.snapshot()
+    assert not partition.dirty and not (tmp_path / partition.log_file).exists(), \
+        "Without a capacity, reads write nothing"
+
+    partition.max_memories = 10
+    written = (tmp_path / partition.data_file).stat().st_mtime_ns
+    partition.retrieve(vector, 1)
+    assert not partition.dirty, "A read must not force a snapshot"
+    partition.snapshot()
+    assert (tmp_path / partition.data_file).stat().st_mtime_ns == written
+    with open(partition.log_file) as f:
+        assert [json.loads(line)["op"] for line in f] == ["touch"]
+
+    accessed = partition.records[0]["last_accessed"]
+    assert reload_partition(session).records[0]["last_accessed"] == accessed, "Access times survive a restart"
+
+
+def test_compact_eviction_does_not_scan_the_table(memory_env, monkeypatch):
+    """Test that only the first eviction reads every record in compact storage."""
+    monkeypatch.setattr(memory, "STORAGE", "compact")
+    partition = get_partition("test-evict-compact")
+    partition.max_memories = 2
+
+    vectors = np.random.default_rng(7).random((4, memory.dimension)).astype("float32")
+    partition.add_many(["user is a nurse", "user has twins"], ["personal", "personal"], vectors[:2])
+    partition.snapshot()
+    partition.retrieve(vectors[:1], 1)
+    assert partition.add("user likes hiking", "preference", vectors[2:3])
+
+    def scan():
+        raise AssertionError("eviction walked the records table")
+
+    monkeypatch.setattr(partition.records, "items", scan)
+    partition.retrieve(vectors[:1], 1)
+    assert partition.add("user speaks Tamil", "personal", vectors[3:])
+    assert sorted(partition.records[i]["text"] for i in partition.records) == ["user is a nurse", "user speaks Tamil"]
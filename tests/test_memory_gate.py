@@ -0,0 +1,38 @@
+import json
+from pathlib import Path
+
+from app.memory_gate import MemoryGate, evaluate_gate
+
+FIXTURE = Path(__file__).parent / "fixtures" / "memory_gate_turns.jsonl"
+
+
+def _load_examples():
+    with open(FIXTURE) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_gate_skips_small_talk():
+    """Test that acknowledgements and greetings never reach the extractor."""
+    gate = MemoryGate()
+    for message in ["ok", "Thanks!", "hi", "lol", "sounds good"]:
+        assert not gate.should_extract(message), f"'{message}' should be skipped"
+
+    assert gate.skip_rate == 1.0
+
+
+def test_gate_keeps_durable_facts():
+    """Test that clear first-person facts are sent to the extractor."""
+    gate = MemoryGate()
+    for message in ["My name is Priya", "I work as a nurse", "I'm allergic to peanuts"]:
+        assert gate.should_extract(message), f"'{message}' should be extracted"
+
+
+def test_gate_precision_recall_on_labelled_turns():
+    """Test the lexical gate against the labelled fixture set."""
+    report = evaluate_gate(MemoryGate(), _load_examples())
+
+    # Losing a memory is worse than an extra LLM call, so recall is the
+    # stricter bar.
+    assert report["recall"] >= 0.95, f"Gate drops too many facts: {report}"
+    assert report["precision"] >= 0.85, f"Gate lets too much through: {report}"
+    assert report["skip_rate"] >= 0.4, f"Gate saves too few LLM calls: {report}"
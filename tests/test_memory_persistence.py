@@ -0,0 +1,86 @@
+import json
+
+import numpy as np
+
+from app import memory
+from app.memory import get_partition, save_memory, flush_memory
+
+
+def test_save_appends_to_log_without_rewriting_snapshot(tmp_path, memory_env):
+    """Test that saving a memory only appends one log record."""
+    session = "test-log-append"
+
+    save_memory("user has a sister called Maya", category="personal", session_id=session)
+    save_memory("user plays chess on weekends", category="preference", session_id=session)
+
+    partition = get_partition(session)
+    with open(partition.log_file) as f:
+        assert len(f.readlines()) == 2, "Each save should append exactly one log record"
+    assert not (tmp_path / partition.data_file).exists(), "Saving must not rewrite the snapshot"
+
+
+def test_log_is_replayed_after_restart(memory_env, reload_partition):
+    """Test that memories survive a restart, including a torn final log line."""
+    session = "test-log-replay"
+
+    save_memory("user works night shifts", category="personal", session_id=session)
+    with open(get_partition(session).log_file, "a") as f:
+        f.write('{"op": "add", "seq": 2, "id"')  # crash mid-append
+
+    partition = reload_partition(session)
+    assert [r["text"] for r in partition.records.values()] == ["user works night shifts"]
+    assert partition.index.ntotal == 1
+
+
+def test_snapshot_trims_log(tmp_path, memory_env, reload_partition):
+    """Test that a snapshot captures all records and empties the log."""
+    session = "test-log-snapshot"
+
+    save_memory("user is learning piano", category="preference", session_id=session)
+    flush_memory()
+
+    partition = get_partition(session)
+    with open(partition.data_file) as f:
+        assert json.load(f)["last_seq"] == 1
+    assert not (tmp_path / partition.log_file).exists(), "Snapshotted records should leave the log"
+
+    partition = reload_partition(session)
+    assert partition.index.ntotal == 1 and not partition.dirty
+
+
+def test_compact_storage_maps_index_and_reads_hits_only(tmp_path, memory_env, monkeypatch, reload_partition):
+    """Test the SQLite + memory-mapped format across snapshots and restarts."""
+    monkeypatch.setattr(memory, "STORAGE", "compact")
+    session = "test-compact-storage"
+
+    vectors = np.random.default_rng(5).random((3, memory.dimension)).astype("float32")
+    partition = get_partition(session)
+    partition.add_many(["user is a pilot", "user has a parrot"], ["personal", "personal"], vectors[:2])
+    flush_memory()
+    assert partition._index_mapped, "A clean snapshot should be memory-mapped"
+    assert not (tmp_path / partition.data_file).exists(), "Compact storage writes no memory.json"
+
+    partition = reload_partition(session)
+    assert partition._index_mapped and partition.records._changes == {}
+    assert [r["text"] for r in partition.search(vectors[1:2], 1)] == ["user has a parrot"]
+
+    # Writes copy the mapped index into RAM; replay restores them after a crash.
+    assert partition.add("user speaks Tamil", "personal", vectors[2:])
+    partition = reload_partition(session)
+    assert len(partition.records) == 3 and partition.index.ntotal == 3
+
+
+def test_json_store_converts_to_compact_storage(memory_env, monkeypatch, reload_partition):
+    """Test that an existing JSON store is carried over to memory.db."""
+    session = "test-compact-convert"
+    vectors = np.random.default_rng(6).random((1, memory.dimension)).astype("float32")
+    get_partition(session).add("user bakes bread", "preference", vectors)
+    flush_memory()
+
+    monkeypatch.setattr(memory, "STORAGE", "compact")
+    partition = reload_partition(session)
+    assert partition.dirty, "Converted records are written by the next snapshot"
+    partition.snapshot()
+
+    partition = reload_partition(session)
+    assert [r["text"] for r in partition.records.values()] == ["user bakes bread"]
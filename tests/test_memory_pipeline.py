@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+from app.memory_pipeline import MemoryExtractionQueue
+
+
+class FakeExecutor:
+    """Returns canned extractor output instead of calling Ollama."""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.prompts = []
+
+    async def generate(self, agent, messages, config):
+        self.prompts.append(messages[-1]["content"])
+        return self.reply
+
+
+def _recorder(saved):
+    """Async stand-in for asave_memory that records saved facts."""
+    async def save(*fact):
+        saved.append(fact)
+    return save
+
+
+def test_turns_are_extracted_in_background():
+    """Test that submitted turns are saved by the worker, not by the caller."""
+    saved = []
+    executor = FakeExecutor(json.dumps({"save": True, "summary": "User is a nurse", "category": "personal"}))
+    queue = MemoryExtractionQueue(lambda: None, executor, {}, save=_recorder(saved), batch_wait=0)
+
+    async def run():
+        queue.submit("s1", "I work as a nurse", "That sounds demanding.")
+        assert saved == [], "Submitting must not wait for extraction"
+        await queue.drain(timeout=5)
+
+    asyncio.run(run())
+
+    assert saved == [("User is a nurse", "personal", "s1")]
+    assert queue.stats()["processed"] == 1
+    assert queue.depth == 0
+
+
+def test_batched_turns_use_one_prompt():
+    """Test that turns queued together are folded into a single extractor call."""
+    saved = []
+    executor = FakeExecutor(json.dumps([
+        {"save": True, "summary": "User has a dog", "category": "personal"},
+        {"save": False},
+    ]))
+    queue = MemoryExtractionQueue(lambda: None, executor, {}, save=_recorder(saved), max_batch=4, batch_wait=0.2)
+
+    async def run():
+        queue.submit("s1", "I have a dog", "Lovely!")
+        queue.submit("s1", "ok", "Sure.")
+        await queue.drain(timeout=5)
+
+    asyncio.run(run())
+
+    assert len(executor.prompts) == 1, "Both turns should share one extractor prompt"
+    assert saved == [("User has a dog", "personal", "s1")]
+
+
+def test_invalid_json_is_counted_not_raised():
+    """Test that unparseable extractor output is recorded as a failure."""
+    queue = MemoryExtractionQueue(lambda: None, FakeExecutor("not json"), {}, save=_recorder([]), batch_wait=0)
+
+    async def run():
+        queue.submit("s1", "hello there", "Hi!")
+        await queue.drain(timeout=5)
+
+    asyncio.run(run())
+
+    assert queue.stats()["failed"] == 1
+
+
+def test_turns_of_different_sessions_never_share_a_prompt():
+    """Test that a batch only holds one session's turns, so facts cannot cross users."""
+    saved = []
+
+    class PerSessionExecutor(FakeExecutor):
+        async def generate(self, agent, messages, config):
+            prompt = messages[-1]["content"]
+            self.prompts.append(prompt)
+            summary = "User likes tea" if "tea" in prompt else "User likes coffee"
+            # Merged into one fact, whatever the number of turns.
+            return json.dumps([{"save": True, "summary": summary, "category": "preference"}])
+
+    executor = PerSessionExecutor(None)
+    queue = MemoryExtractionQueue(lambda: None, executor, {}, save=_recorder(saved), max_batch=4, batch_wait=0.2)
+
+    async def run():
+        queue.submit("user-a", "I like tea", "Nice.")
+        queue.submit("user-b", "I like coffee", "Nice.")
+        queue.submit("user-a", "green tea especially", "Lovely.")
+        await queue.drain(timeout=5)
+
+    asyncio.run(run())
+
+    assert len(executor.prompts) == 2, "Each session should get its own extractor prompt"
+    assert "coffee" not in executor.prompts[0] and "green tea" in executor.prompts[0]
+    assert sorted(saved) == [
+        ("User likes coffee", "preference", "user-b"),
+        ("User likes tea", "preference", "user-a"),
+    ]
+    assert queue.stats()["processed"] == 3 and queue.depth == 0
@@ -1,8 +1,11 @@
 import asyncio
+from app import memory
 from app.memory import save_memory, get_relevant_facts
 
-def test_memory_retrieval():
+def test_memory_retrieval(tmp_path, monkeypatch):
     """Test that stored memories can be retrieved via semantic search."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(memory, "_partitions", {})
     # Store a memory
     save_memory("user prefers vegetarian food", category="preference")
     
@@ -15,3 +18,18 @@ def test_memory_retrieval():
     
     results = asyncio.run(check_retrieval())
     assert len(results) > 0, "Memory retrieval should not be empty"
+
+def test_memory_is_partitioned_by_session(tmp_path, monkeypatch):
+    """Test that one session's memories are never returned for another session."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(memory, "_partitions", {})
+    save_memory("user is training for a marathon", category="personal", session_id="test-runner")
+
+    async def check_isolation():
+        own = await get_relevant_facts("test-runner", "marathon training", k=3)
+        other = await get_relevant_facts("test-someone-else", "marathon training", k=3)
+        return own, other
+
+    own, other = asyncio.run(check_isolation())
+    assert "marathon" in own.lower(), "Session should see its own memories"
+    assert "marathon" not in other.lower(), "Memories must not leak across sessions"
@@ -0,0 +1,96 @@
+import asyncio
+
+from app import memory
+from app.memory_client import MemoryServiceClient, MemoryServiceError
+from app.memory_service import MemoryService
+
+
+async def _with_service(path, scenario):
+    service = MemoryService(path)
+    ready = asyncio.Event()
+    server = asyncio.create_task(service.serve(ready))
+    await ready.wait()
+    try:
+        return service, await scenario(MemoryServiceClient(path))
+    finally:
+        server.cancel()
+
+
+def test_concurrent_calls_share_one_batch(tmp_path, memory_env):
+    """Test that calls made together travel as one batch and one encode."""
+    embedder = memory_env
+    path = str(tmp_path / "memory.sock")
+
+    async def scenario(client):
+        await client.call("save_memory", text="user has a cat named Miso", category="personal", session_id="s1")
+        embedder.calls.clear()
+        replies = await asyncio.gather(*[
+            client.call("get_relevant_facts", session_id="s1", query=f"question {i}", k=1)
+            for i in range(5)
+        ])
+        return client, replies
+
+    service, (client, replies) = asyncio.run(_with_service(path, scenario))
+
+    assert all("Miso" in reply for reply in replies)
+    assert client.stats()["batches"] == 2, "The five lookups should be sent as one batch"
+    assert len(embedder.calls) == 1 and len(embedder.calls[0]) == 5, \
+        "The service should encode the whole batch in one model call"
+    assert service.stats()["calls"] == 6
+
+
+class RecordingClient:
+    """Stands in for MemoryServiceClient and records what would be sent."""
+
+    def __init__(self):
+        self.sent = []
+
+    def call_sync(self, op, **args):
+        self.sent.append((op, args))
+        if op == "encode":
+            return [[0.0] * memory.dimension for _ in args["texts"]]
+        if op == "save_memories":
+            return {"saved": len(args["memories"]), "skipped": 0}
+
+    async def call(self, op, **args):
+        self.sent.append((op, args))
+        return "[PERSONAL] forwarded"
+
+
+def test_public_functions_forward_to_the_service(tmp_path, monkeypatch, memory_env):
+    """Test that app.memory's functions act as thin clients when configured."""
+    client = RecordingClient()
+    monkeypatch.setattr(memory, "service_client", client)
+    monkeypatch.setattr(memory, "embedder", memory._LazyEmbedder())
+
+    memory.save_memory("user plays violin", "hobby", "s2")
+    assert asyncio.run(memory.get_relevant_facts("s2", "what do I play?")) == "[PERSONAL] forwarded"
+    assert memory.save_memories(["a", "b", "c"], session_id="s2", chunk_size=2) == {"saved": 3, "skipped": 0}
+    assert memory.embedder.encode(["hello"]).shape == (1, memory.dimension)
+
+    assert [op for op, _ in client.sent] == [
+        "save_memory", "get_relevant_facts", "save_memories", "save_memories", "encode",
+    ]
+    assert memory._partitions == {}, "A client must never open partitions itself"
+    assert not list(tmp_path.iterdir()), "A client must never write memory files"
+
+
+def test_unreachable_service_raises(tmp_path):
+    """Test that a missing service surfaces as MemoryServiceError."""
+    client = MemoryServiceClient(str(tmp_path / "missing.sock"))
+
+    try:
+        client.call_sync("ping")
+    except MemoryServiceError:
+        pass
+    else:
+        raise AssertionError("Calling a missing service should raise MemoryServiceError")
+
+    async def call():
+        try:
+            await client.call("ping")
+        except MemoryServiceError:
+            return True
+        return False
+
+    assert asyncio.run(call())
@@ -0,0 +1,63 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app import main, metrics
+from config.llm_config import config_list
+from tests.stub_ollama import StubOllama
+
+
+def test_histogram_renders_cumulative_buckets():
+    """Test the Prometheus text format of a labelled histogram."""
+    histogram = metrics.Histogram("test_latency_seconds", "Test latency.", ["stage"], buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+    histogram.observe(5.0, stage="a")
+
+    lines = histogram.collect()
+
+    assert 'test_latency_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{stage="a",le="1.0"} 2' in lines
+    assert 'test_latency_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_count{stage="a"} 3' in lines
+    assert "# TYPE test_latency_seconds histogram" in metrics.registry.render()
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    """Test that METRICS_ENABLED=0 turns recording into a no-op."""
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    counter = metrics.Counter("test_disabled_total", "Test counter.")
+    histogram = metrics.Histogram("test_disabled_seconds", "Test histogram.")
+
+    counter.inc()
+    with histogram.time():
+        pass
+
+    assert counter.value() == 0
+    assert histogram.count() == 0
+
+
+def test_turn_records_stages_and_tokens(tmp_path, monkeypatch):
+    """Test that a streamed turn shows up per stage and in /metrics."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main.extraction_queue, "submit", lambda *args: True)
+
+    with StubOllama(token_rate=1000, latency=0.01, tokens=6) as stub:
+        monkeypatch.setitem(config_list[0], "base_url", stub.base_url)
+        stages = {name: metrics.STAGE_SECONDS.count(stage=name) for name in ("route", "build_context", "llm")}
+        completion_tokens = metrics.LLM_TOKENS.value(kind="completion", agent="CareBot")
+
+        async def collect():
+            return [frame async for frame in main.run_agent_stream("I started a new job", "metrics-test")]
+
+        frames = asyncio.run(collect())
+
+    assert frames[-1]["type"] == "final"
+    for name, before in stages.items():
+        assert metrics.STAGE_SECONDS.count(stage=name) == before + 1, f"Stage {name} should be timed once"
+    assert metrics.LLM_TOKENS.value(kind="completion", agent="CareBot") == completion_tokens + 6
+
+    from web.server import app
+    body = TestClient(app).get("/metrics").text
+    assert 'carebot_stage_seconds_count{stage="llm"}' in body
+    assert "carebot_extraction_queue_depth 0" in body
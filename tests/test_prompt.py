@@ -0,0 +1,88 @@
+import asyncio
+
+from app import main
+from app.prompt import FACTS_HEADER, PromptAssembler, TokenCounter
+from app.rag import SYSTEM_PROMPT
+from config.llm_config import config_list
+from tests.stub_ollama import StubOllama
+
+
+def _words(text):
+    """One token per whitespace-separated word, to make budgets easy to reason about."""
+    return len(text.split())
+
+
+def _history(turns):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"message {i} " + "word " * 20})
+        history.append({"role": "assistant", "content": f"reply {i} " + "word " * 20})
+    return history
+
+
+def test_sections_are_cut_to_their_budgets():
+    """Test that each section stays within budget, dropping the oldest history first."""
+    assembler = PromptAssembler(TokenCounter(_words), system_budget=50, facts_budget=20, history_budget=60, user_budget=14)
+    facts = [f"[PERSONAL] fact number {i} is here" for i in range(10)]
+
+    messages = assembler.assemble(
+        system="static instructions", facts=facts, history=_history(5), user="please " * 40,
+    )
+
+    history = messages[1:-2]
+    assert history[0]["role"] == "user", "The history window should start with a user turn"
+    assert history[-1]["content"].startswith("reply 4"), "The newest turns should be kept"
+    assert sum(_words(m["content"]) + 4 for m in history) <= 60
+
+    facts_message = messages[-2]["content"].splitlines()
+    assert facts_message[0] == FACTS_HEADER and facts_message[1:] == facts[:len(facts_message) - 1]
+    assert _words(messages[-1]["content"]) == 10, "The user message should be cut to its budget"
+    assert assembler.stats()["truncated"] == {"system": 0, "summary": 0, "facts": 1, "history": 1, "user": 1}
+
+
+def test_static_prefix_is_identical_across_turns():
+    """Test that changing facts and history never changes the first message."""
+    assembler = PromptAssembler()
+
+    first = assembler.assemble(system=SYSTEM_PROMPT, facts=["[WORK] user is a nurse"], user="hi")
+    second = assembler.assemble(system=SYSTEM_PROMPT, facts=[], history=_history(1), user="tired today")
+
+    assert first[0] == second[0] == {"role": "system", "content": SYSTEM_PROMPT}
+    assert first[-2]["content"].startswith(FACTS_HEADER), "Facts go right before the user message"
+    assert all(FACTS_HEADER not in m["content"] for m in second), "No facts message without facts"
+
+
+def test_token_counts_are_cached():
+    """Test that repeated texts are only tokenized once."""
+    calls = []
+    counter = TokenCounter(lambda text: calls.append(text) or len(text.split()))
+
+    for _ in range(3):
+        counter.count("the same static system prompt")
+
+    assert len(calls) == 1 and counter.stats()["hits"] == 2
+
+
+def test_follow_up_turn_reuses_the_cached_prefix(tmp_path, monkeypatch):
+    """Test that a second turn only needs prefill for the new messages."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main.extraction_queue, "submit", lambda *args: True)
+
+    with StubOllama(token_rate=1000, latency=0.01, tokens=5) as stub:
+        monkeypatch.setitem(config_list[0], "base_url", stub.base_url)
+
+        async def turn(message):
+            async for _ in main.run_agent_stream(message, "prefix-test"):
+                pass
+            return stub.stats()["prompt_tokens"]
+
+        async def conversation():
+            first = await turn("I started a new job and the first week was a lot")
+            second = await turn("ok") - first
+            return first, second
+
+        first, second = asyncio.run(conversation())
+
+    # The first turn pays for both system messages; the follow-up only for
+    # the previous reply and the new message.
+    assert second < first / 3, f"Only the new messages should need prefill ({first} -> {second})"
@@ -1,8 +1,11 @@
 import asyncio
+from app import memory
 from app.main import run_agent
 
-def test_rag_response_stability():
+def test_rag_response_stability(tmp_path, monkeypatch):
     """Test that asking the same question twice returns non-empty, stable responses."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(memory, "_partitions", {})
     async def check_stability():
         # Ask the same question twice
         response1 = await run_agent("What is my preference?")
@@ -0,0 +1,97 @@
+import asyncio
+
+import numpy as np
+
+from app import main
+from app.prompt import FACTS_HEADER, SUMMARY_HEADER
+from app.response_cache import ResponseCache
+from config.llm_config import config_list
+from tests.stub_ollama import StubOllama
+
+# Hand-made embeddings: "hi" and "hello" are near-identical, "hey there" is not.
+VECTORS = {
+    "hi": [1.0, 0.0, 0.0],
+    "hello": [0.98, 0.1, 0.0],
+    "hey there": [0.6, 0.8, 0.0],
+    "how can i sleep better": [0.0, 0.0, 1.0],
+}
+
+
+def _encode(texts):
+    return np.array([VECTORS[text] for text in texts], dtype="float32")
+
+
+def test_pool_fills_before_serving_and_avoids_last_reply():
+    """Test that variants are collected first, then served without repeating."""
+    cache = ResponseCache(_encode, enabled=True, threshold=0.9, ttl={"greeting": 60}, variants=2)
+    key = cache.embed("hi")
+
+    assert cache.get("greeting", key) is None
+    cache.put("greeting", key, "Hi! How are you?")
+    assert cache.get("greeting", cache.embed("hello")) is None, "One variant is not enough to serve"
+    cache.put("greeting", cache.embed("hello"), "Hello there!")
+
+    assert cache.get("greeting", key, avoid="Hi! How are you?") == "Hello there!"
+    assert cache.get("greeting", cache.embed("hey there")) is None, "Dissimilar queries must miss"
+    assert cache.stats()["size"] == 1 and cache.stats()["fills"] == 1
+
+
+def test_expired_and_uncacheable_routes_are_never_served():
+    """Test per-route TTLs and that the safety and planner routes are always off."""
+    cache = ResponseCache(_encode, enabled=True, ttl={"greeting": 60, "safety": 60, "planner": 60, "care": 0}, variants=1)
+    key = cache.embed("hi")
+
+    for route in ("safety", "planner", "care"):
+        cache.put(route, key, "cached")
+        assert not cache.cacheable(route) and cache.get(route, key) is None
+
+    cache.put("greeting", key, "Hi!")
+    cache._entries["greeting"][0].expires_at -= 120
+    assert cache.get("greeting", key) is None, "Expired questions must miss"
+
+
+def test_repeated_greetings_skip_the_model(tmp_path, monkeypatch):
+    """Test that once the pool is full, greetings are answered without Ollama."""
+    monkeypatch.chdir(tmp_path)
+    # The stub always sends the same text, so a pool of one.
+    cache = ResponseCache(_encode, enabled=True, ttl={"greeting": 60}, variants=1)
+    monkeypatch.setattr(main, "response_cache", cache)
+
+    with StubOllama(token_rate=1000, latency=0.01, tokens=4) as stub:
+        monkeypatch.setitem(config_list[0], "base_url", stub.base_url)
+
+        async def greet(session_id):
+            frames = [frame async for frame in main.run_agent_stream("hi", session_id)]
+            return frames[-1]["content"]
+
+        async def sessions():
+            return [await greet(f"greeting-cache-{i}") for i in range(6)]
+
+        replies = asyncio.run(sessions())
+
+    assert stub.stats()["requests"] == 1, "Only the turn filling the pool should reach the model"
+    assert len(set(replies)) == 1 and cache.stats()["hits"] == 5
+
+
+def test_prompts_with_personal_context_bypass_the_cache(monkeypatch):
+    """Test that history, a summary or memories disable both serving and storing."""
+    cache = ResponseCache(_encode, enabled=True, ttl={"care": 60}, variants=1)
+    key = cache.embed("how can i sleep better")
+    cache.put("care", key, "Keep a regular bedtime.")
+    monkeypatch.setattr(main, "response_cache", cache)
+    static = {"role": "system", "content": "static"}
+    user = {"role": "user", "content": "how can i sleep better"}
+    personal = [
+        {"role": "system", "content": f"{FACTS_HEADER}\n[HEALTH] user has insomnia"},
+        {"role": "system", "content": f"{SUMMARY_HEADER}\nThe user lost their job last week."},
+        {"role": "assistant", "content": "That sounds exhausting."},
+    ]
+
+    for context in personal:
+        messages = [static, context, user]
+        reply, store_key = asyncio.run(main._cached_reply("personal-session", "care", user["content"], messages))
+        assert reply is None and store_key is None, f"{context['content'][:20]!r} must bypass the cache"
+
+    assert cache.stats()["bypassed"] == 3 and cache.stats()["hits"] == 0
+    reply, _ = asyncio.run(main._cached_reply("fresh-session", "care", user["content"], [static, user]))
+    assert reply == "Keep a regular bedtime.", "A prompt without context is still served"
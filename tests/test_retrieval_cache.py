@@ -0,0 +1,52 @@
+import asyncio
+
+from app import memory
+from app.memory import get_partition, get_relevant_facts, save_memories
+from app.retrieval_cache import RetrievalCache
+
+
+def test_repeated_query_skips_encode_and_search(memory_env):
+    """Test that asking the same (normalized) question twice hits the cache."""
+    embedder = memory_env
+    session = "test-retrieval-cache"
+    save_memories(["user has a cat named Miso"], session_id=session)
+    embedder.calls.clear()
+
+    async def ask_twice():
+        first = await get_relevant_facts(session, "What is my cat called?")
+        second = await get_relevant_facts(session, "  what is my CAT called? ")
+        return first, second
+
+    first, second = asyncio.run(ask_twice())
+
+    assert first == second and "Miso" in first
+    assert embedder.encoded == ["What is my cat called?"], "The repeat should not be re-encoded"
+    assert memory.retrieval_cache.stats()["hits"] == 1
+
+
+def test_saving_invalidates_cached_facts(memory_env):
+    """Test that a save or clear bumps the version and forces a fresh search."""
+    session = "test-retrieval-invalidate"
+    save_memories(["user works as a chef"], session_id=session)
+
+    before = asyncio.run(get_relevant_facts(session, "what do I do?", k=3))
+    save_memories(["user works weekends"], session_id=session)
+    after = asyncio.run(get_relevant_facts(session, "what do I do?", k=3))
+
+    assert "weekends" not in before and "weekends" in after
+    assert memory.retrieval_cache.stats()["stale"] == 1
+
+    get_partition(session).clear()
+    assert asyncio.run(get_relevant_facts(session, "what do I do?")) == ""
+
+
+def test_cache_is_bounded():
+    """Test that the least recently used entry is dropped at capacity."""
+    cache = RetrievalCache(max_size=2)
+    cache.put("s", "one", 3, 1, "a")
+    cache.put("s", "two", 3, 1, "b")
+    cache.get("s", "one", 3, 1)
+    cache.put("s", "three", 3, 1, "c")
+
+    assert cache.get("s", "two", 3, 1) is None
+    assert cache.get("s", "one", 3, 1) == "a"
@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+from app import main
+from app.session_store import InMemorySessionStore, SQLiteSessionStore
+
+
+def test_history_is_per_session_and_bounded():
+    """Test that sessions keep separate, length-limited histories."""
+    store = InMemorySessionStore(history_messages=4)
+    for i in range(3):
+        store.record_reply("alice", f"reply {i}", f"message {i}")
+    store.record_reply("bob", "hello bob", "hi")
+
+    assert [m["content"] for m in store.history("alice")] == ["message 1", "reply 1", "message 2", "reply 2"]
+    assert store.last_response("bob") == "hello bob"
+    assert store.history("carol") == [], "Unknown sessions start empty"
+
+
+def test_lru_and_ttl_eviction():
+    """Test that idle sessions expire and the least recently active go first."""
+    store = InMemorySessionStore(max_sessions=2, ttl=60)
+    store.record_reply("a", "1", "x")
+    store.record_reply("b", "2", "x")
+    store.record_reply("a", "3", "x")      # "a" is now the most recent
+    store.record_reply("c", "4", "x")      # evicts "b"
+
+    assert store.last_response("b") is None and store.last_response("a") == "3"
+
+    store._sessions["c"]["updated_at"] -= 120
+    assert store.history("c") == [], "Sessions idle past the TTL should expire"
+    assert store.stats()["evicted"] == 2
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    """Test that two store instances (e.g. two workers) see the same sessions."""
+    path = str(tmp_path / "sessions.db")
+    worker_a = SQLiteSessionStore(path, history_messages=4)
+    worker_b = SQLiteSessionStore(path, history_messages=4)
+
+    worker_a.record_reply("s1", "hello", "hi")
+    worker_b.record_reply("s1", "sure", "can you help?")
+
+    assert [m["content"] for m in worker_a.history("s1")] == ["hi", "hello", "can you help?", "sure"]
+    assert worker_a.last_response("s1") == "sure"
+
+
+def test_sqlite_store_evicts_expired_and_excess_sessions(tmp_path):
+    """Test that periodic eviction enforces both the TTL and the session cap."""
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), max_sessions=2, ttl=60, evict_every=1)
+    store.record_reply("old", "x", "x")
+    store._db.execute("UPDATE sessions SET updated_at = ?", (time.time() - 120,))
+    assert store.history("old") == [], "Expired sessions are not served even before eviction"
+
+    for session_id in ("a", "b", "c"):
+        store.record_reply(session_id, "x", "x")
+
+    assert store.stats()["sessions"] == 2
+    assert store.last_response("a") is None
+
+
+def test_overflow_is_returned_and_summary_kept(tmp_path):
+    """Test that both stores hand back messages leaving the window and keep the summary."""
+    for store in (InMemorySessionStore(history_messages=4), SQLiteSessionStore(str(tmp_path / "s.db"), history_messages=4)):
+        assert store.record_reply("s1", "reply 0", "message 0") == []
+        store.record_reply("s1", "reply 1", "message 1")
+        store.set_summary("s1", "User started a new job.")
+
+        overflow = store.record_reply("s1", "reply 2", "message 2")
+
+        assert [m["content"] for m in overflow] == ["message 0", "reply 0"]
+        assert store.summary("s1") == "User started a new job.", "Recording a reply must keep the summary"
+        assert store.summary("unknown") == ""
+
+
+def test_sqlite_store_adds_summary_column_to_old_databases(tmp_path):
+    """Test that a database created before summaries is upgraded in place."""
+    import sqlite3
+
+    path = str(tmp_path / "sessions.db")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE sessions (session_id TEXT PRIMARY KEY, history TEXT NOT NULL, last_response TEXT, updated_at REAL NOT NULL)")
+    db.execute("INSERT INTO sessions VALUES ('s1', '[]', 'hi', ?)", (time.time(),))
+    db.commit()
+    db.close()
+
+    store = SQLiteSessionStore(path)
+
+    assert store.last_response("s1") == "hi" and store.summary("s1") == ""
+    store.set_summary("s1", "User likes hiking.")
+    assert store.summary("s1") == "User likes hiking."
+
+
+class LockedStore(InMemorySessionStore):
+    """A store whose writes wait on a database lock held by another worker."""
+
+    def record_reply(self, *args):
+        time.sleep(0.3)
+        return super().record_reply(*args)
+
+
+def test_store_writes_do_not_block_the_event_loop(monkeypatch):
+    """Test that a slow session store write leaves other connections running."""
+    monkeypatch.setattr(main, "session_store", LockedStore())
+    monkeypatch.setattr(main.summarizer, "submit", lambda *args: True)
+
+    async def finalize_while_ticking():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        reply = await main._finalize_reply("locked-store", "care", "hello", "Hi there.")
+        ticker.cancel()
+        return reply, ticks
+
+    reply, ticks = asyncio.run(finalize_while_ticking())
+
+    assert reply == "Hi there."
+    assert ticks >= 10, "The loop should keep serving while the write waits"
+    assert main.session_store.last_response("locked-store") == "Hi there."
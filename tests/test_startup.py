@@ -0,0 +1,22 @@
+import subprocess
+import sys
+
+
+def _imported_after(module: str):
+    """Import `module` in a fresh interpreter and list the heavy modules it pulled in."""
+    snippet = (
+        f"import sys, {module}; "
+        "print(' '.join(m for m in ('sentence_transformers', 'torch', 'autogen') if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", snippet], capture_output=True, text=True, check=True)
+    return out.stdout.split()
+
+
+def test_importing_app_main_is_lazy():
+    """Test that importing the agent module loads neither the model nor AutoGen."""
+    assert _imported_after("app.main") == [], "Heavy resources should load on warm-up, not import"
+
+
+def test_importing_web_server_is_lazy():
+    """Test that the FastAPI app can be imported without loading models."""
+    assert _imported_after("web.server") == []
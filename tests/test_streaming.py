@@ -0,0 +1,24 @@
+import asyncio
+from app.main import run_agent_stream
+
+def test_stream_ends_with_final_frame():
+    """Test that the streaming agent yields stream frames followed by one final frame."""
+    async def collect():
+        return [frame async for frame in run_agent_stream("I feel a bit stuck with work")]
+
+    frames = asyncio.run(collect())
+
+    assert frames, "Streaming should yield at least one frame"
+    assert frames[-1]["type"] == "final", "Last frame should be the final reply"
+    assert frames[-1]["content"].strip(), "Final reply should not be empty"
+    assert all(f["type"] == "stream" for f in frames[:-1]), "Only stream frames may precede the final frame"
+
+def test_stream_safety_route_skips_llm():
+    """Test that safety messages return the fixed safety reply without streaming tokens."""
+    async def collect():
+        return [frame async for frame in run_agent_stream("I want to end my life")]
+
+    frames = asyncio.run(collect())
+
+    assert len(frames) == 1, "Safety route should yield only the final frame"
+    assert frames[0]["type"] == "final"
@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+from app.llm import LLMExecutor, stream_chat
+from tests.stub_ollama import StubOllama
+
+
+def test_stub_streams_through_the_ollama_client():
+    """Test that the stub speaks enough of the Ollama API for stream_chat."""
+    with StubOllama(token_rate=500, latency=0.1, tokens=8) as stub:
+        config = {"model": "llama3", "base_url": stub.base_url}
+
+        async def collect():
+            start = time.perf_counter()
+            first, tokens = None, []
+            async for token in stream_chat("system", [{"role": "user", "content": "hi"}], config):
+                if first is None:
+                    first = time.perf_counter() - start
+                tokens.append(token)
+            return first, tokens
+
+        first, tokens = asyncio.run(collect())
+
+    assert len(tokens) == 8, "Every stub token should arrive as its own chunk"
+    assert first >= 0.1, "The first token should wait for the configured latency"
+    assert stub.stats()["requests"] == 1
+
+
+def test_stub_exposes_backend_queueing():
+    """Test that the executor's per-backend cap is visible at the stub."""
+    executor = LLMExecutor(max_in_flight=2, max_queue=10)
+
+    with StubOllama(token_rate=1000, latency=0.05, tokens=5) as stub:
+        config = {"model": "llama3", "base_url": stub.base_url}
+
+        async def one():
+            return [token async for token in executor.stream("system", [{"role": "user", "content": "hi"}], config)]
+
+        async def many():
+            return await asyncio.gather(*(one() for _ in range(5)))
+
+        replies = asyncio.run(many())
+
+    assert all(len(reply) == 5 for reply in replies)
+    assert stub.stats()["max_in_flight"] == 2, "No more than max_in_flight requests should reach the backend"
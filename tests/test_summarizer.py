@@ -0,0 +1,76 @@
+import asyncio
+
+from app import main
+from app.session_store import InMemorySessionStore
+from app.summarizer import ConversationSummarizer
+from config.llm_config import config_list
+from tests.stub_ollama import StubOllama
+
+
+class FoldingExecutor:
+    """Stands in for the MemoryBot: the new summary lists every folded message."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    async def generate(self, agent, messages, config):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        prompt = messages[-1]["content"]
+        previous = prompt.split("Current summary of the conversation:\n", 1)[1].split("\n", 1)[0]
+        folded = [line.split(": ", 1)[1] for line in prompt.splitlines() if line.startswith(("User: ", "Assistant: "))]
+        return ", ".join(([] if previous == "(none yet)" else [previous]) + folded)
+
+
+def _turn(i):
+    return [{"role": "user", "content": f"message {i}"}, {"role": "assistant", "content": f"reply {i}"}]
+
+
+def test_overflow_is_folded_in_order():
+    """Test that updates submitted mid-summary are applied after it, none lost."""
+    store = InMemorySessionStore()
+    store.record_reply("s1", "hello", "hi")
+    executor = FoldingExecutor(delay=0.05)
+    summarizer = ConversationSummarizer(lambda: None, executor, {}, store, workers=2)
+
+    async def run():
+        summarizer.submit("s1", _turn(0))
+        await asyncio.sleep(0.01)
+        summarizer.submit("s1", _turn(1))     # arrives while turn 0 is summarized
+        summarizer.submit("s1", _turn(2))     # coalesced with turn 1
+        await summarizer.drain(timeout=5)
+
+    asyncio.run(run())
+
+    assert store.summary("s1") == "message 0, reply 0, message 1, reply 1, message 2, reply 2"
+    assert executor.calls == 2, "Messages waiting for the same session share one call"
+    assert summarizer.stats() == {"pending": 0, "summarized": 2, "failed": 0, "dropped": 0}
+
+
+def test_long_conversation_keeps_prompt_size_flat(tmp_path, monkeypatch):
+    """Test that old turns reach the prompt as a summary while history stays bounded."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main.extraction_queue, "submit", lambda *args: True)
+    monkeypatch.setattr(main.summarizer, "executor", FoldingExecutor())
+    monkeypatch.setattr(main.summarizer, "get_agent", lambda: None)
+
+    with StubOllama(token_rate=1000, latency=0.01, tokens=4) as stub:
+        monkeypatch.setitem(config_list[0], "base_url", stub.base_url)
+
+        async def conversation():
+            sizes = []
+            for i in range(6):
+                routed, messages = await main._build_messages("summary-test", f"turn {i} of a long chat")
+                sizes.append(len(messages))
+                async for _ in main.run_agent_stream(f"turn {i} of a long chat", "summary-test"):
+                    pass
+                await asyncio.sleep(0.05)
+            await main.summarizer.drain(timeout=5)
+            return sizes, messages
+
+        sizes, messages = asyncio.run(conversation())
+
+    assert sizes[-1] == sizes[-2], f"Prompt length should stop growing ({sizes})"
+    assert messages[1]["content"].startswith("Summary of the earlier conversation:\nturn 0 of a long chat")
+    assert main.session_store.summary("summary-test").count("turn") == 3, "Three turns left the window"
@@ -0,0 +1,70 @@
+import numpy as np
+
+from app import vector_index
+from app.vector_index import backend_of, create_index, ensure_backend, extract, rebuild, remove
+
+DIM = 16
+
+
+def _vectors(n, seed=0):
+    return np.random.default_rng(seed).random((n, DIM), dtype="float32")
+
+
+def _filled(backend, n=600):
+    vectors = _vectors(n)
+    ids = np.arange(1000, 1000 + n, dtype="int64")
+    index = create_index(DIM, backend, training_vectors=vectors)
+    index.add_with_ids(vectors, ids)
+    return index, vectors, ids
+
+
+def test_every_backend_finds_exact_matches(monkeypatch):
+    """Test that each backend returns our ids and finds a stored vector."""
+    monkeypatch.setattr(vector_index, "IVF_TRAIN_SIZE", 500)
+    for backend in vector_index.BACKENDS:
+        index, vectors, ids = _filled(backend)
+        _, found = index.search(vectors[:5], 1)
+
+        assert backend_of(index) == backend
+        assert list(found[:, 0]) == list(ids[:5]), f"{backend} should return the stored ids"
+
+
+def test_rebuild_preserves_ids_and_vectors(monkeypatch):
+    """Test that migrating between backends keeps every (id, vector) pair."""
+    monkeypatch.setattr(vector_index, "IVF_TRAIN_SIZE", 500)
+    index, vectors, ids = _filled("flat")
+
+    for backend in ("hnsw", "ivf", "flat"):
+        index = rebuild(index, backend)
+        got_ids, got_vectors = extract(index)
+        order = np.argsort(got_ids)
+
+        assert backend_of(index) == backend
+        assert np.array_equal(got_ids[order], ids)
+        assert np.allclose(got_vectors[order], vectors)
+
+
+def test_ivf_trains_once_enough_vectors_exist(monkeypatch):
+    """Test that the IVF backend stays flat until it has training data."""
+    monkeypatch.setattr(vector_index, "IVF_TRAIN_SIZE", 500)
+    index = create_index(DIM, "ivf")
+    index.add_with_ids(_vectors(100), np.arange(100, dtype="int64"))
+
+    index, changed = ensure_backend(index, "ivf")
+    assert not changed and backend_of(index) == "flat"
+
+    index.add_with_ids(_vectors(400, seed=1), np.arange(100, 500, dtype="int64"))
+    index, changed = ensure_backend(index, "ivf")
+    assert changed and backend_of(index) == "ivf" and index.ntotal == 500
+
+
+def test_remove_by_id_on_every_backend(monkeypatch):
+    """Test that removing ids works, including HNSW which has to rebuild."""
+    monkeypatch.setattr(vector_index, "IVF_TRAIN_SIZE", 500)
+    for backend in vector_index.BACKENDS:
+        index, vectors, ids = _filled(backend)
+        index = remove(index, ids[:10])
+        _, found = index.search(vectors[:1], 1)
+
+        assert index.ntotal == len(ids) - 10, f"{backend} should drop removed vectors"
+        assert found[0, 0] != ids[0]
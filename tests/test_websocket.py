@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from app import main
+from app.memory import DEFAULT_SESSION_ID
+from app.metrics import WEBSOCKET_CANCELLED, WEBSOCKET_TOKENS_SAVED
+from config.llm_config import config_list
+from tests.stub_ollama import StubOllama
+from web import server
+
+
+def _slow_stub():
+    # Replies take about five seconds, so every test cancels one mid-stream.
+    return StubOllama(token_rate=20, latency=0.01, tokens=100)
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def _receive_until(ws, frame_type):
+    frames = [ws.receive_json()]
+    while frames[-1]["type"] != frame_type:
+        frames.append(ws.receive_json())
+    return frames
+
+
+def test_new_message_cancels_the_turn_in_flight(tmp_path, monkeypatch):
+    """Test that a superseding message cancels the old turn and its Ollama request."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main.extraction_queue, "submit", lambda *args: True)
+    cancelled = WEBSOCKET_CANCELLED.value(reason="superseded")
+    saved = WEBSOCKET_TOKENS_SAVED.value()
+
+    with _slow_stub() as stub:
+        monkeypatch.setitem(config_list[0], "base_url", stub.base_url)
+        with TestClient(server.app).websocket_connect("/ws?session_id=ws-supersede-test") as ws:
+            ws.send_text("I started a new job")
+            _receive_until(ws, "stream")
+            stub.token_rate = 1000      # the second reply is quick
+            ws.send_text("actually, never mind")
+            frames = _receive_until(ws, "final")
+
+        assert _wait_for(lambda: stub.stats()["cancelled"] == 1), "The first Ollama stream should be closed"
+
+    types = [frame["type"] for frame in frames]
+    assert "cancelled" in types and types.index("cancelled") < types.index("thinking")
+    assert WEBSOCKET_CANCELLED.value(reason="superseded") == cancelled + 1
+    assert WEBSOCKET_TOKENS_SAVED.value() > saved
+    assert main.session_store.history("ws-supersede-test")[0]["content"] == "actually, never mind"
+
+
+def test_disconnect_stops_generation(tmp_path, monkeypatch):
+    """Test that closing the socket cancels the turn and the upstream request."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main.extraction_queue, "submit", lambda *args: True)
+    cancelled = WEBSOCKET_CANCELLED.value(reason="disconnect")
+
+    with _slow_stub() as stub:
+        monkeypatch.setitem(config_list[0], "base_url", stub.base_url)
+        with TestClient(server.app).websocket_connect("/ws?session_id=ws-disconnect-test") as ws:
+            ws.send_text("I started a new job")
+            _receive_until(ws, "stream")
+
+        assert _wait_for(lambda: stub.stats()["cancelled"] == 1), "The Ollama stream should be closed"
+        assert stub.stats()["tokens_sent"] < 100
+
+    assert WEBSOCKET_CANCELLED.value(reason="disconnect") == cancelled + 1
+
+
+class StalledWebSocket:
+    """A client that sends one message and then never reads a frame."""
+
+    def __init__(self):
+        self.messages = asyncio.Queue()
+        self.sent = 0
+        self.closed = None
+
+    async def receive_text(self):
+        return await self.messages.get()
+
+    async def send_text(self, text):
+        self.sent += 1
+        if self.sent > 1:
+            await asyncio.Event().wait()
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+def test_slow_client_is_bounded_and_disconnected(tmp_path, monkeypatch):
+    """Test that a stalled client stops the turn instead of buffering its reply."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main.extraction_queue, "submit", lambda *args: True)
+    cancelled = WEBSOCKET_CANCELLED.value(reason="slow_client")
+
+    with _slow_stub() as stub:
+        monkeypatch.setitem(config_list[0], "base_url", stub.base_url)
+        ws = StalledWebSocket()
+        connection = server.ChatConnection(ws, "ws-slow-test", send_buffer=4, send_timeout=0.5)
+
+        async def run():
+            ws.messages.put_nowait("I started a new job")
+            await asyncio.wait_for(connection.run(), 5)
+
+        asyncio.run(run())
+        assert _wait_for(lambda: stub.stats()["cancelled"] == 1)
+
+    assert ws.closed == 1013
+    assert connection._outbox.qsize() <= 4, "The outbox must stay within its bound"
+    assert WEBSOCKET_CANCELLED.value(reason="slow_client") == cancelled + 1
+
+
+def test_default_session_id_is_not_handed_out():
+    """Test that a client asking for the shared default session gets a fresh one."""
+    assert server._session_id("ws-reconnect-test") == "ws-reconnect-test", "A valid id should be kept"
+
+    fresh = server._session_id(DEFAULT_SESSION_ID)
+    assert fresh != DEFAULT_SESSION_ID, "The shared default session must not be reachable from the web"
+    assert server._SESSION_ID_RE.match(fresh), "The replacement should be a valid session id"
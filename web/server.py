@@ -1,37 +1,66 @@
-from fastapi import FastAPI, WebSocket
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from pathlib import Path
+import asyncio
+import hmac
 import json
-import traceback
+import logging
+import os
+import re
+import uuid
+from typing import Optional
 
-from app.main import run_agent
+from app.flight_recorder import recorder
+from app.llm import executor
+from app.main import extraction_queue, is_ready, run_agent_stream, summarizer, warm_up
+from app.memory import DEFAULT_SESSION_ID, flush_memory
+from app.metrics import METRICS_ENABLED, WEBSOCKET_CANCELLED, WEBSOCKET_ERRORS, WEBSOCKET_TOKENS_SAVED, registry
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# How long shutdown waits for queued memory extractions to finish.
+EXTRACTION_DRAIN_TIMEOUT = 30.0
+# /admin endpoints require it in an X-Admin-Token header. Traces carry
+# session ids, which are the only key to a session, so without a token
+# the endpoints stay closed.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# Frames queued per /ws connection; beyond that the turn waits for the
+# client, which in turn stops reading from Ollama.
+WS_SEND_BUFFER = int(os.getenv("WS_SEND_BUFFER", "64"))
+# A client that takes longer than this to accept one frame is disconnected.
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "30"))
 
-def _stream_text_chunks(text: str, words_per_chunk: int = 4):
-    """
-    Yield small word-based chunks of the final response so the frontend
-    can render them incrementally and feel closer to token streaming.
 
-    NOTE: We are *not* changing how the LLM is called – only how
-    we send the final string over the WebSocket.
-    """
-    if not text:
-        return
+async def _warm_up():
+    try:
+        await warm_up()
+    except Exception:
+        # /ready keeps reporting 503; the first request retries the loading.
+        logger.exception("Warm-up failed")
+
 
-    words = text.split(" ")
-    current = []
+@app.on_event("startup")
+async def start_background_workers():
+    extraction_queue.start()
+    summarizer.start()
+    executor.start_health_checks()
+    if recorder.enabled and not ADMIN_TOKEN:
+        logger.warning("FLIGHT_RECORDER is on but ADMIN_TOKEN is unset; /admin/traces stays closed")
+    # Load models in the background: the server accepts connections right
+    # away and /ready reports when the heavy resources are in place.
+    app.state.warm_up_task = asyncio.create_task(_warm_up())
 
-    for w in words:
-        current.append(w)
-        if len(current) >= words_per_chunk:
-            yield " ".join(current) + " "
-            current = []
 
-    if current:
-        # Flush any remaining words
-        yield " ".join(current)
+@app.on_event("shutdown")
+async def drain_background_workers():
+    # Let queued turns reach long-term memory before the process exits.
+    await extraction_queue.drain(timeout=EXTRACTION_DRAIN_TIMEOUT)
+    await summarizer.drain(timeout=EXTRACTION_DRAIN_TIMEOUT)
+    await executor.stop_health_checks()
+    # Fold the append-only memory logs into fresh snapshots.
+    await asyncio.to_thread(flush_memory)
 
 
 @app.get("/")
@@ -39,42 +68,215 @@ async def index():
     return HTMLResponse(Path("web/index.html").read_text())
 
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once models and agents are loaded, else 503."""
+    if is_ready():
+        return {"status": "ready"}
+    return JSONResponse({"status": "starting"}, status_code=503)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint (404 when METRICS_ENABLED=0)."""
+    if not METRICS_ENABLED:
+        return PlainTextResponse("metrics disabled\n", status_code=404)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+def _admin_denied(request: Request):
+    """Error response for an admin request that may not proceed, else None."""
+    if not recorder.enabled:
+        return JSONResponse({"error": "flight recorder disabled (set FLIGHT_RECORDER=1)"}, status_code=404)
+    if not ADMIN_TOKEN:
+        return JSONResponse({"error": "admin endpoints disabled (set ADMIN_TOKEN)"}, status_code=403)
+    if not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    return None
+
+
+@app.get("/admin/traces")
+async def admin_traces(request: Request, limit: int = 50):
+    """Summaries of the most recent turns, newest first."""
+    denied = _admin_denied(request)
+    if denied is not None:
+        return denied
+    return {"stats": recorder.stats(), "traces": recorder.recent(limit)}
+
+
+@app.get("/admin/traces/slow")
+async def admin_slow_traces(request: Request, limit: int = 50):
+    """Full traces (spans, profile) of turns over the slow threshold."""
+    denied = _admin_denied(request)
+    if denied is not None:
+        return denied
+    return {"traces": recorder.slow(limit)}
+
+
+@app.get("/admin/traces/{trace_id}")
+async def admin_trace(request: Request, trace_id: str):
+    denied = _admin_denied(request)
+    if denied is not None:
+        return denied
+    trace = recorder.get(trace_id)
+    if trace is None:
+        return JSONResponse({"error": "unknown trace"}, status_code=404)
+    return trace
+
+
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+def _session_id(requested) -> str:
+    """
+    Session id for a connection: the client's (so a reconnecting browser
+    keeps its history), or a fresh one if it sent none or a malformed one.
+    The shared default session is never handed to a web client.
+    """
+    if requested and requested != DEFAULT_SESSION_ID and _SESSION_ID_RE.match(requested):
+        return requested
+    return uuid.uuid4().hex
+
+
+class _ReplyLength:
+    """Running average of streamed reply lengths, in chunks (one token each)."""
+
+    def __init__(self, initial: float = 64.0, weight: float = 0.1):
+        self.average = initial
+        self.weight = weight
+
+    def observe(self, chunks: int) -> None:
+        self.average += self.weight * (chunks - self.average)
+
+    def remaining(self, chunks: int) -> float:
+        """Tokens a reply cut off after `chunks` would still have produced."""
+        return max(self.average - chunks, 0.0)
+
+
+reply_length = _ReplyLength()
+
+
+class ChatConnection:
+    """
+    One /ws connection: at most one turn in flight and a bounded outbox.
+
+    A message that arrives mid-turn cancels that turn (with the Ollama
+    request behind it) and starts a new one, and so does a disconnect, so
+    nobody queues behind a reply they no longer want and nothing keeps
+    generating for a closed tab. Frames go through an outbox of
+    `send_buffer` frames drained by a sender task: a slow client makes the
+    turn wait instead of piling up frames, and one that does not accept a
+    frame within `send_timeout` seconds is disconnected. Nothing is sent
+    once the socket is gone.
+    """
+
+    def __init__(
+        self,
+        ws: WebSocket,
+        session_id: str,
+        send_buffer: int = WS_SEND_BUFFER,
+        send_timeout: float = WS_SEND_TIMEOUT,
+    ):
+        self.ws = ws
+        self.session_id = session_id
+        self.send_timeout = send_timeout
+        self._outbox: asyncio.Queue = asyncio.Queue(maxsize=send_buffer)
+        self._turn: Optional[asyncio.Task] = None
+
+    async def run(self) -> None:
+        sender = asyncio.create_task(self._send_loop())
+        receive = None
+        try:
+            while True:
+                receive = asyncio.ensure_future(self.ws.receive_text())
+                await asyncio.wait({receive, sender}, return_when=asyncio.FIRST_COMPLETED)
+                if sender.done():
+                    # The client stopped accepting frames.
+                    await self._cancel_turn("slow_client")
+                    await self._close()
+                    break
+                try:
+                    message = receive.result()
+                except WebSocketDisconnect:
+                    # The browser closed the tab or will reconnect on its own.
+                    break
+
+                if await self._cancel_turn("superseded"):
+                    await self._send({"type": "cancelled"})
+                self._turn = asyncio.create_task(self._run_turn(message))
+        finally:
+            await self._cancel_turn("disconnect")
+            tasks = {task for task in (receive, sender) if task is not None}
+            for task in tasks:
+                task.cancel()
+            # asyncio.wait rather than gather: it keeps the cancellation of
+            # this task (e.g. by the server) its own.
+            await asyncio.wait(tasks)
+
+    async def _close(self) -> None:
+        try:
+            await asyncio.wait_for(self.ws.close(code=1013), self.send_timeout)
+        except Exception:
+            pass
+
+    async def _cancel_turn(self, reason: str) -> bool:
+        """Cancel the turn in flight, if any; True if there was one."""
+        turn, self._turn = self._turn, None
+        if turn is None or turn.done():
+            return False
+        turn.cancel()
+        WEBSOCKET_CANCELLED.inc(reason=reason)
+        await asyncio.wait({turn})
+        return True
+
+    async def _send(self, frame: dict) -> None:
+        # Waits while the outbox is full: that is the backpressure.
+        await self._outbox.put(json.dumps(frame))
+
+    async def _send_loop(self) -> None:
+        while True:
+            text = await self._outbox.get()
+            try:
+                await asyncio.wait_for(self.ws.send_text(text), self.send_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Closing /ws for session %s: client too slow", self.session_id)
+                return
+            except (WebSocketDisconnect, RuntimeError, OSError):
+                # Already closed; receive_text reports the disconnect.
+                return
+
+    async def _run_turn(self, message: str) -> None:
+        await self._send({"type": "thinking"})
+
+        # --- STREAMING LAYER ----------------------------------------
+        # Tokens are forwarded as "stream" frames as soon as Ollama
+        # emits them, followed by a "final" frame with the full text.
+        chunks, finished = 0, False
+        try:
+            async for frame in run_agent_stream(message, self.session_id):
+                if frame["type"] == "stream":
+                    chunks += 1
+                else:
+                    finished = True
+                await self._send(frame)
+            if chunks:
+                reply_length.observe(chunks)
+        except asyncio.CancelledError:
+            if not finished:
+                WEBSOCKET_TOKENS_SAVED.inc(reply_length.remaining(chunks))
+            raise
+        except Exception:
+            # A failed turn is reported and the connection stays open
+            # for the next message.
+            WEBSOCKET_ERRORS.inc()
+            logger.exception("Turn failed for session %s", self.session_id)
+            await self._send({
+                "type": "error",
+                "content": "An error occurred. Please try again."
+            })
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(ws: WebSocket):
     await ws.accept()
-    try:
-        while True:
-            user_msg = await ws.receive_text()
-
-            # Tell frontend we are processing
-            await ws.send_text(json.dumps({
-                "type": "thinking"
-            }))
-
-            reply = await run_agent(user_msg)
-
-            # --- STREAMING LAYER ----------------------------------------
-            # We first send small chunks so the UI can update token-by-token,
-            # then send a final message with the full text for safety.
-            for chunk in _stream_text_chunks(reply):
-                await ws.send_text(json.dumps({
-                    "type": "stream",
-                    "content": chunk,
-                }))
-
-            await ws.send_text(json.dumps({
-                "type": "final",
-                "content": reply,
-            }))
-
-    except Exception as e:
-        # ✅ LOG ERROR
-        print("WebSocket error:", e)
-        traceback.print_exc()
-
-        # ❌ DO NOT close socket here
-        # Browser will reconnect automatically if needed
-        await ws.send_text(json.dumps({
-            "type": "error",
-            "content": "An error occurred. Please try again."
-        }))
\ No newline at end of file
+    await ChatConnection(ws, _session_id(ws.query_params.get("session_id"))).run()